@@ -0,0 +1,239 @@
+"""
+OpenAIService 的批量（Batch API）后端。
+
+适用于夜间跑的大批量离线任务（例如对新一个月的微博数据做 distribute_themes，或 demo 的 analyze_keywords）：
+不需要交互式的延迟，但希望费用更低、也不占用同步接口的限流额度。
+
+设置环境变量 OPENAI_BACKEND 后，调用方代码不需要任何修改：
+    - batch: 通过服务端的 /v1/files + /v1/batches 接口提交；
+    - batch_local: 本地替代实现，把同样的 JSONL 文件逐条用普通接口执行，
+      用于不支持 Batch API 的服务（例如 mock_llm_server.py）或调试。
+
+每次 infer 发出的请求会先进入进程内共用的 BatchSubmitter，一段时间内没有新请求（或达到单批上限）时，
+把攒下的请求写成一个 JSONL 文件（每行带 custom_id）提交，轮询到批次完成后按 custom_id 把结果交还给各个调用方。
+解析失败的重试请求会进入下一个批次。请求与结果文件保存在 OPENAI_BATCH_DIR 下。
+用线程池并发调用的地方需要把线程数调到不小于条目数，否则每个批次只能攒到线程数条请求；
+demo 中的 analyze_keywords、analyze_is_hotel_related 通过 thread_pool_size 自动调整。
+"""
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+BATCH_DIR = os.environ.get("OPENAI_BATCH_DIR", "analyze/analyze_results/batches")
+BATCH_BACKENDS = ("batch", "batch_local")
+# Batch API 单个批次最多 50000 条请求
+MAX_BATCH_SIZE = 50000
+# 多长时间没有新请求就提交当前批次（秒）
+FLUSH_INTERVAL = float(os.environ.get("OPENAI_BATCH_FLUSH_INTERVAL", "5"))
+POLL_INTERVAL = float(os.environ.get("OPENAI_BATCH_POLL_INTERVAL", "30"))
+ENDPOINT = "/v1/chat/completions"
+
+
+class BatchRequestError(RuntimeError):
+    """批次中的单条请求失败或没有返回结果"""
+
+
+def _client():
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        base_url=os.environ.get("OPENAI_API_BASE"),
+    )
+
+
+def read_batch_output(path):
+    """读取批次结果文件，返回 {custom_id: 响应体或 BatchRequestError}"""
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                error = item.get("error") or (response.get("body") or {}).get("error") or response
+                results[item["custom_id"]] = BatchRequestError(f"{item['custom_id']}: {error}")
+            else:
+                results[item["custom_id"]] = response["body"]
+    return results
+
+
+class ProviderBatchRunner:
+    """通过服务端的 Batch API 执行一个批次"""
+
+    def __init__(self, poll_interval=POLL_INTERVAL, completion_window="24h"):
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.client = _client()
+
+    async def run(self, input_path, output_path):
+        with open(input_path, "rb") as f:
+            input_file = await self.client.files.create(file=f, purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=ENDPOINT,
+            completion_window=self.completion_window,
+            metadata={"source": os.path.basename(input_path)},
+        )
+        print(f"批次 {batch.id} 已提交（{os.path.basename(input_path)}）")
+
+        status = None
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            if batch.status != status:
+                status = batch.status
+                print(f"批次 {batch.id} 状态: {status}")
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        print(
+            f"批次 {batch.id} 结束: {batch.status}"
+            + (f"，完成 {counts.completed}/{counts.total}，失败 {counts.failed}" if counts else "")
+        )
+
+        # 过期或取消的批次也可能有部分结果
+        with open(output_path, "w", encoding="utf-8") as out:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    content = await self.client.files.content(file_id)
+                    out.write(content.text.rstrip("\n") + "\n")
+
+
+class LocalBatchRunner:
+    """本地替代实现：用普通接口逐条执行批次文件，输出与 Batch API 相同格式的结果文件"""
+
+    def __init__(self, concurrency=50):
+        self.concurrency = concurrency
+        self.client = _client()
+
+    async def run(self, input_path, output_path):
+        with open(input_path, "r", encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def execute(request):
+            async with semaphore:
+                try:
+                    completion = await self.client.chat.completions.create(**request["body"])
+                    response = {"status_code": 200, "body": completion.model_dump()}
+                    error = None
+                except Exception as e:
+                    response = None
+                    error = {"code": type(e).__name__, "message": str(e)}
+            return {"custom_id": request["custom_id"], "response": response, "error": error}
+
+        results = await asyncio.gather(*(execute(r) for r in requests))
+        with open(output_path, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+class BatchSubmitter:
+    """
+    把各处 infer 发出的请求攒成批次提交。
+
+    内部在单独线程的事件循环中运行，因此可以同时被异步代码（complete）、
+    同步代码（complete_sync，demo 中的线程池）以及流水线中不同线程各自的事件循环共用。
+    """
+
+    def __init__(self, runner_factory, batch_dir=BATCH_DIR, max_batch_size=MAX_BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.runner_factory = runner_factory
+        self.batch_dir = batch_dir
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._runner = None
+        self._pending = []
+        self._timer = None
+        self._ids = itertools.count()
+        self._batches = itertools.count()
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="batch-submitter", daemon=True).start()
+
+    def submit(self, body):
+        """提交一条 chat completion 请求，返回 concurrent.futures.Future，结果为响应体 dict"""
+        future = Future()
+        self._loop.call_soon_threadsafe(self._add, body, future)
+        return future
+
+    async def complete(self, **body):
+        from openai.types.chat import ChatCompletion
+
+        response = await asyncio.wrap_future(self.submit(body))
+        return ChatCompletion.model_validate(response)
+
+    def complete_sync(self, **body):
+        from openai.types.chat import ChatCompletion
+
+        return ChatCompletion.model_validate(self.submit(body).result())
+
+    def _add(self, body, future):
+        self._pending.append((f"req-{next(self._ids)}", body, future))
+        if self._timer:
+            self._timer.cancel()
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        else:
+            self._timer = self._loop.call_later(self.flush_interval, self._flush)
+
+    def _flush(self):
+        self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            self._loop.create_task(self._run_batch(pending))
+
+    async def _run_batch(self, pending):
+        if self._runner is None:
+            self._runner = self.runner_factory()
+        name = f"batch_{time.strftime('%Y%m%d_%H%M%S')}_{next(self._batches)}"
+        os.makedirs(self.batch_dir, exist_ok=True)
+        input_path = os.path.join(self.batch_dir, f"{name}.jsonl")
+        output_path = os.path.join(self.batch_dir, f"{name}_output.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            for custom_id, body, _ in pending:
+                f.write(
+                    json.dumps(
+                        {"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": body},
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                )
+
+        try:
+            await self._runner.run(input_path, output_path)
+            results = read_batch_output(output_path)
+        except Exception as e:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(BatchRequestError(f"批次 {name} 执行失败: {e}"))
+            return
+
+        for custom_id, _, future in pending:
+            result = results.get(custom_id, BatchRequestError(f"{custom_id}: 批次结果中没有该请求"))
+            if future.done():
+                # 调用方已经取消
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+_submitters = {}
+_submitters_lock = threading.Lock()
+
+
+def get_batch_submitter(backend):
+    """进程内每种批量后端共用一个 BatchSubmitter"""
+    if backend not in BATCH_BACKENDS:
+        raise ValueError(f"未知的批量后端: {backend}，可选: {', '.join(BATCH_BACKENDS)}")
+    with _submitters_lock:
+        if backend not in _submitters:
+            runner_factory = ProviderBatchRunner if backend == "batch" else LocalBatchRunner
+            _submitters[backend] = BatchSubmitter(runner_factory)
+        return _submitters[backend]
@@ -0,0 +1,483 @@
+"""
+分析流水线中 CPU 侧各阶段的基准测试。
+
+按指定规模生成汽车之家 / B站 / 微博 / 酒店分析数据形状的合成语料，逐个阶段计时，
+每个阶段在单独 fork 出的子进程中运行，记录耗时、峰值 RSS 增量和 tracemalloc 统计的峰值分配。
+结果可以保存为 JSON，并与之前保存的结果比较，超过阈值的变慢会被标记为回归。
+
+用法（在仓库根目录下运行）:
+    python analyze/analyze_scripts/benchmark.py --sizes 10000,100000 --output bench.json
+    python analyze/analyze_scripts/benchmark.py --compare bench.json           # 与上次结果比较
+    python analyze/analyze_scripts/benchmark.py --stages count_themes,filter_by_time
+    # 需要先启动 mock_llm_server.py 并设置 OPENAI_API_BASE
+    python analyze/analyze_scripts/benchmark.py --with-llm
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from queue import Empty
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEMO_DIR = os.path.join(SCRIPTS_DIR, "demo")
+
+HOTELS = ["惠庭", "亚朵", "全季", "桔子水晶", "丽枫", "维也纳国际"]
+THEMES = [chr(c) for c in range(ord("A"), ord("O") + 1)]
+WORDS = [
+    "领克900", "1.5T", "2.0T", "智驾", "试驾", "销售", "门店", "空间", "六座", "理想L8",
+    "问界M9", "价格", "配置", "油耗", "底盘", "隔音", "前台", "早餐", "床", "卫生间",
+    "服务", "干净", "性价比", "位置", "隔音差", "体验", "推荐", "不错", "一般", "失望",
+]
+XHS_TIMESTAMPS = [
+    "50 minutes ago", "2024-05-03", "2024-05-03 上海", "04-30 Jiangsu", "3 hours ago",
+    "2 days ago Guangdong", "Yesterday 10:30 PM", "Apr 03", "Edited on Mar 19",
+    "Apr 26Hebei", "Aug/25/2024", "Edited on Aug/16/2024 北京", "无法解析的时间",
+]
+
+
+# ---------------------------------------------------------------------------
+# 合成语料
+# ---------------------------------------------------------------------------
+
+
+def _text(rng, min_words=3, max_words=40):
+    return "".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def _time(rng, start=datetime(2024, 1, 1), days=540):
+    return start + timedelta(minutes=rng.randint(0, days * 24 * 60))
+
+
+def make_bili_comments(rng, size):
+    comments = []
+    for i in range(size):
+        # 约 5% 的重复评论，模拟多次爬取
+        comment_id = str(rng.randint(0, i)) if i and rng.random() < 0.05 else str(i)
+        comments.append(
+            {
+                "comment_id": comment_id,
+                "content": _text(rng),
+                "create_time": int(_time(rng).timestamp()),
+                "video_id": str(rng.randint(0, size // 50 + 1)),
+            }
+        )
+    return comments
+
+
+def make_wb_data(rng, size):
+    note_count = max(size // 10, 1)
+    notes = [
+        {"note_id": str(i), "content": _text(rng, 10, 80), "create_time": int(_time(rng).timestamp())}
+        for i in range(note_count)
+    ]
+    comments = [
+        {
+            "comment_id": str(i),
+            "note_id": str(rng.randrange(note_count)),
+            "content": _text(rng),
+            "create_time": int(_time(rng).timestamp()),
+        }
+        for i in range(size - note_count)
+    ]
+    return notes, comments
+
+
+def make_themed_posts(rng, size):
+    """distribute_themes 输出形状（汽车之家/B站/微博格式化后再分配主题）"""
+    posts = []
+    remaining = size
+    while remaining > 0:
+        reply_count = min(rng.randint(0, 20), remaining - 1)
+        posts.append(
+            {
+                "content": _text(rng, 10, 80),
+                "timestamp": int(_time(rng).timestamp()),
+                "themes": rng.sample(THEMES, rng.randint(0, 3)),
+                "replies": [
+                    {"content": _text(rng), "themes": rng.sample(THEMES, rng.randint(0, 2))}
+                    for _ in range(reply_count)
+                ],
+            }
+        )
+        remaining -= reply_count + 1
+    return posts
+
+
+def make_keywords(rng, primary=12, secondary=8):
+    return [
+        {
+            "primary_keyword": f"一级关键词{p} Primary {p}",
+            "secondary_keywords": [
+                {"keyword": f"二级关键词{p}-{s} Secondary {p}-{s}"} for s in range(secondary)
+            ],
+        }
+        for p in range(primary)
+    ]
+
+
+def make_hotel_data(rng, size, keywords=None):
+    """demo 中酒店数据的形状，keywords 不为空时带上分析结果字段"""
+    hotels = {name: [] for name in HOTELS}
+    remaining = size
+    post_id = 0
+    all_keywords = []
+    if keywords:
+        for k in keywords:
+            all_keywords.append(("primary_keyword", k["primary_keyword"]))
+            all_keywords += [("secondary_keyword", sk["keyword"]) for sk in k["secondary_keywords"]]
+
+    def mentioned():
+        result = {"primary_keyword": [], "secondary_keyword": []}
+        for level, kw in rng.sample(all_keywords, rng.randint(0, 3)):
+            result[level].append({"keyword": kw, "sentiment": rng.choice(["positive", "negative", "neutral"])})
+        return result
+
+    while remaining > 0:
+        reply_count = min(rng.randint(0, 15), remaining - 1)
+        post = {
+            "content": _text(rng, 10, 80),
+            "timestamp": _time(rng).strftime("%Y-%m-%d %H:%M"),
+            "link": f"https://example.com/p/{post_id}",
+            "note_id": str(post_id),
+            "replies": [],
+        }
+        for _ in range(reply_count):
+            reply_time = _time(rng).strftime("%Y-%m-%d %H:%M")
+            reply = {"content": _text(rng), "comment_content": "", "timestamp": reply_time, "comment_time": reply_time}
+            reply["comment_content"] = reply["content"]
+            if keywords:
+                reply["is_hotel_related"] = rng.random() < 0.7
+                reply["keywords_mentioned"] = mentioned()
+            post["replies"].append(reply)
+        if keywords:
+            post["is_hotel_related"] = rng.random() < 0.7
+            post["keywords_mentioned"] = mentioned()
+        hotels[rng.choice(HOTELS)].append(post)
+        post_id += 1
+        remaining -= reply_count + 1
+    return [{"hotel": name, "posts": posts} for name, posts in hotels.items()]
+
+
+# ---------------------------------------------------------------------------
+# 各阶段，setup 在计时之外准备输入，run 为被计时的部分
+# ---------------------------------------------------------------------------
+
+
+def _use_demo_modules():
+    """demo 下的脚本用 `from utils import *` 导入自己目录的 utils，需要切换 sys.path"""
+    for name in ("utils", "prompt"):
+        sys.modules.pop(name, None)
+    sys.path.insert(0, DEMO_DIR)
+
+
+def _with_keywords_dir(rng):
+    """demo 的 Keywords 从当前目录的 raw_data/keywords.json 读取关键词"""
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    os.makedirs(os.path.join(workdir, "raw_data"))
+    keywords = make_keywords(rng)
+    with open(os.path.join(workdir, "raw_data", "keywords.json"), "w", encoding="utf-8") as f:
+        json.dump(keywords, f, ensure_ascii=False)
+    os.chdir(workdir)
+    return keywords
+
+
+def setup_format_bili(rng, size):
+    from format_media_crawler_data import format_bili_data
+
+    return format_bili_data, (make_bili_comments(rng, size),)
+
+
+def setup_format_wb(rng, size):
+    from format_media_crawler_data import format_wb_data
+
+    return format_wb_data, make_wb_data(rng, size)
+
+
+def setup_count_themes(rng, size):
+    from count_themes import count_themes
+
+    return count_themes, (make_themed_posts(rng, size),)
+
+
+def setup_batch_generator(rng, size):
+    from count_themes import count_themes
+    from summarize_themes import batch_generator
+
+    theme_count = count_themes(make_themed_posts(rng, size))
+
+    def pack(theme_count, batch_size=200):
+        return sum(
+            len("\n".join(batch))
+            for data in theme_count.values()
+            for batch in batch_generator(data["content"], batch_size)
+        )
+
+    return pack, (theme_count,)
+
+
+def setup_compile_keywords(rng, size):
+    keywords = _with_keywords_dir(rng)
+    _use_demo_modules()
+    from data_count import compile_keywords_for_analyzed_data
+
+    return compile_keywords_for_analyzed_data, (make_hotel_data(rng, size, keywords),)
+
+
+def setup_filter_by_time(rng, size):
+    _use_demo_modules()
+    from utils import PostsFilter
+
+    return PostsFilter().filter_by_time, (make_hotel_data(rng, size),)
+
+
+def setup_parse_timestamp(rng, size):
+    _use_demo_modules()
+    import contextlib
+    import io
+
+    from utils import parse_timestamp
+
+    inputs = [rng.choice(XHS_TIMESTAMPS) for _ in range(size)]
+
+    def parse_all(inputs):
+        # 无法解析的时间会被打印出来，基准测试时丢弃这些输出
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [parse_timestamp(s) for s in inputs]
+
+    return parse_all, (inputs,)
+
+
+def setup_merge_new_posts(rng, size):
+    _use_demo_modules()
+    from hotel_store import HotelStore
+    from utils import merge_new_posts, write_to_json
+
+    existing = make_hotel_data(rng, size)
+    # 一半是已存在的帖子，一半是新帖子
+    delta = make_hotel_data(rng, max(size // 10, 1))
+    for hotel, new_hotel in zip(existing, delta):
+        new_hotel["posts"] += hotel["posts"][: len(new_hotel["posts"])]
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_"), "analyzed.json")
+    write_to_json(existing, path)
+    # 第一次合并时才从数据集文件建立分区，提前建立，只计时 demo main 中的增量合并
+    HotelStore(path).sync()
+
+    return merge_new_posts, (delta, path)
+
+
+def setup_search_index(rng, size):
+    from search_index import CorpusIndex, build_index
+
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    path = os.path.join(workdir, "posts.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(make_themed_posts(rng, size), f, ensure_ascii=False)
+    index_path = os.path.join(workdir, "corpus_index.sqlite")
+    build_index({"synthetic": path}, index_path)
+    queries = [(" ".join(rng.sample(WORDS, rng.randint(1, 2))), rng.choice(THEMES)) for _ in range(50)]
+
+    def search_all(queries):
+        # 只计时查询，建索引在准备阶段完成
+        with CorpusIndex(index_path) as index:
+            return sum(len(index.search(query, theme=theme)) for query, theme in queries)
+
+    return search_all, (queries,)
+
+
+def setup_distribute_themes_llm(rng, size):
+    from distribute_themes import analyze_posts_async
+
+    posts = make_themed_posts(rng, min(size, 10000))
+
+    def run(posts):
+        return asyncio.run(analyze_posts_async(posts))
+
+    return run, (posts,)
+
+
+STAGES = {
+    "format_bili_data": setup_format_bili,
+    "format_wb_data": setup_format_wb,
+    "count_themes": setup_count_themes,
+    "batch_generator": setup_batch_generator,
+    "compile_keywords_for_analyzed_data": setup_compile_keywords,
+    "filter_by_time": setup_filter_by_time,
+    "parse_timestamp": setup_parse_timestamp,
+    "merge_new_posts": setup_merge_new_posts,
+    "search_index": setup_search_index,
+}
+LLM_STAGES = {"distribute_themes_mock_llm": setup_distribute_themes_llm}
+
+
+# ---------------------------------------------------------------------------
+# 运行与报告
+# ---------------------------------------------------------------------------
+
+
+def _current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return 0.0
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _reset_peak_rss():
+    """把本进程的峰值 RSS（VmHWM）重置为当前 RSS，只在 Linux 上可用，成功时返回 True"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _hwm_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _run_stage(setup, size, seed, trace_alloc, queue):
+    try:
+        sys.path.insert(0, SCRIPTS_DIR)
+        rng = random.Random(seed)
+        func, args = setup(rng, size)
+        # 准备数据时的内存峰值不计入阶段。ru_maxrss 无法重置，Linux 上重置 VmHWM 后读取它；
+        # 其他平台只能用 ru_maxrss，准备数据的峰值更高时结果会偏大
+        isolated = _reset_peak_rss()
+        rss_before = _current_rss_mb()
+
+        start = time.perf_counter()
+        func(*args)
+        wall = time.perf_counter() - start
+        peak_rss = max((_hwm_rss_mb() if isolated else _peak_rss_mb()) - rss_before, 0.0)
+
+        peak_alloc = None
+        if trace_alloc:
+            # 重新准备一份输入，在 tracemalloc 下再跑一次统计分配
+            func, args = setup(random.Random(seed), size)
+            tracemalloc.start()
+            func(*args)
+            peak_alloc = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+
+        queue.put({"wall": wall, "peak_rss_mb": peak_rss, "peak_alloc_mb": peak_alloc})
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def _wait_result(process, queue, poll_interval=1.0):
+    """等待子进程的结果；子进程没有返回结果就退出（例如内存不足被杀掉）时记为失败"""
+    while True:
+        try:
+            return queue.get(timeout=poll_interval)
+        except Empty:
+            if not process.is_alive():
+                break
+    # 子进程退出前放入的结果可能还没读到
+    try:
+        return queue.get(timeout=poll_interval)
+    except Empty:
+        return {"error": f"子进程异常退出，exitcode={process.exitcode}"}
+
+
+def run_benchmarks(stages, sizes, seed=0, trace_alloc=True):
+    ctx = multiprocessing.get_context("fork")
+    results = []
+    for size in sizes:
+        for name, setup in stages.items():
+            queue = ctx.Queue()
+            process = ctx.Process(target=_run_stage, args=(setup, size, seed, trace_alloc, queue))
+            process.start()
+            result = _wait_result(process, queue)
+            process.join()
+            result.update({"stage": name, "size": size})
+            results.append(result)
+            print_result(result)
+    return results
+
+
+def print_result(result):
+    label = f"{result['stage']:<36}{result['size']:>9}"
+    if "error" in result:
+        print(f"{label}  失败: {result['error']}")
+        return
+    alloc = f"{result['peak_alloc_mb']:>10.1f}MB" if result["peak_alloc_mb"] is not None else f"{'-':>12}"
+    print(f"{label}{result['wall']:>11.3f}s{result['peak_rss_mb']:>10.1f}MB{alloc}")
+
+
+def compare(results, baseline_path, threshold):
+    """与之前的结果比较，返回回归的条目"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["stage"], r["size"]): r for r in json.load(f)["results"] if "error" not in r}
+    regressions = []
+    print(f"\n与 {baseline_path} 比较 (阈值 {threshold:.0%}):")
+    for result in results:
+        old = baseline.get((result["stage"], result["size"]))
+        if not old or "error" in result:
+            continue
+        ratio = result["wall"] / old["wall"] if old["wall"] > 0 else 1.0
+        flag = "回归" if ratio > 1 + threshold else ("提升" if ratio < 1 - threshold else "")
+        print(f"  {result['stage']:<36}{result['size']:>9}  {old['wall']:.3f}s -> {result['wall']:.3f}s  x{ratio:.2f} {flag}")
+        if flag == "回归":
+            regressions.append(result)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分析流水线 CPU 阶段基准测试")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="语料规模（条目数），逗号分隔")
+    parser.add_argument("--stages", help="只运行这些阶段，逗号分隔")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-alloc", action="store_true", help="不做 tracemalloc 分配统计（更快）")
+    parser.add_argument("--with-llm", action="store_true", help="同时对 OPENAI_API_BASE 指向的模拟服务跑 distribute_themes")
+    parser.add_argument("--output", help="结果保存为 JSON")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=0.2, help="耗时增加超过该比例视为回归")
+    args = parser.parse_args(argv)
+
+    stages = dict(STAGES)
+    if args.with_llm:
+        stages.update(LLM_STAGES)
+    if args.stages:
+        wanted = args.stages.split(",")
+        unknown = [s for s in wanted if s not in stages]
+        if unknown:
+            parser.error(f"未知的阶段: {', '.join(unknown)}，可选: {', '.join(stages)}")
+        stages = {name: stages[name] for name in wanted}
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    print(f"{'stage':<36}{'size':>9}{'wall':>12}{'peak RSS':>12}{'peak alloc':>12}")
+    results = run_benchmarks(stages, sizes, seed=args.seed, trace_alloc=not args.no_alloc)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"created_at": datetime.now().isoformat(timespec="seconds"), "results": results},
+                f,
+                ensure_ascii=False,
+                indent=4,
+            )
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
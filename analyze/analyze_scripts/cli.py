@@ -0,0 +1,266 @@
+"""
+分析流程的统一命令行入口。
+
+每个阶段一个子命令，输入输出路径都可以通过参数指定，默认值与 pipeline.py 相同（见 config.py）。
+子命令只在运行时导入自己用到的模块：openai 只在真正调用模型时导入，去重、统计、导出、检索等命令
+启动只需几十毫秒。用 + 分隔多个子命令可以在同一个进程中依次运行，省去重复启动解释器和导入模块的开销。
+各子命令都会按 PROFILE 环境变量剖析（见 profiling.py）。
+
+用法（在仓库根目录下运行）:
+    python analyze/analyze_scripts/cli.py dedup
+    python analyze/analyze_scripts/cli.py count + dedup + summarize --quote-mode ids + verify-quotes + merge + export
+    python analyze/analyze_scripts/cli.py index search 续航 --platform autohome
+    python analyze/analyze_scripts/cli.py pipeline --force
+"""
+import argparse
+import os
+import sys
+import time
+
+from config import (
+    CRAWL_DATES,
+    DISTRIBUTE_CONCURRENCY,
+    FORMATTED_DIR,
+    PLATFORMS,
+    RAW_DATA_DIR,
+    REPORT_PATH,
+    RESULTS_DIR,
+    SUMMARIES_EXPORT_DIR,
+)
+from profiling import profile_stage
+
+CHAIN_SEPARATOR = "+"
+# 调用模型的子命令结束后把调用指标写到 LLM_METRICS_DIR/<名称>.jsonl，与各脚本单独运行时相同
+METRICS_NAMES = {
+    "distribute": "distribute_themes",
+    "summarize": "summarize_themes",
+    "merge": "merge_duplicates",
+}
+# 已有命令行的脚本: 子命令 -> (模块, 说明)
+FORWARDED = {
+    "pipeline": ("pipeline", "运行带缓存的完整流水线，参数同 pipeline.py"),
+    "index": ("search_index", "建立或检索全文索引，参数同 search_index.py"),
+    "prefilter": ("prefilter", "训练预过滤分类器，参数同 prefilter.py"),
+    "benchmark": ("benchmark", "CPU 阶段基准测试，参数同 benchmark.py"),
+    "mock-llm": ("mock_llm_server", "启动本地模拟的 OpenAI 兼容服务，参数同 mock_llm_server.py"),
+}
+
+
+def format_bili(args):
+    from format_media_crawler_data import format_bili_data
+    from utils import read_json, write_json
+
+    data = []
+    for path in args.inputs:
+        data.extend(read_json(path))
+    write_json(format_bili_data(data), args.output, indent=None)
+
+
+def format_wb(args):
+    from format_media_crawler_data import format_wb_data
+    from utils import read_json, write_json
+
+    note_data, comment_data = [], []
+    for path in args.contents:
+        note_data.extend(read_json(path))
+    for path in args.comments:
+        comment_data.extend(read_json(path))
+    write_json(format_wb_data(note_data, comment_data), args.output, indent=None)
+
+
+def distribute(args):
+    import asyncio
+
+    from distribute_themes import analyze_files_async
+    from prefilter import build_themes_prefilter
+    from utils import read_json, write_json
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    def writer(path):
+        def on_done(analyzed_data):
+            write_json(analyzed_data, path, indent=None)
+            print(f"{path} 主题分配完成")
+
+        return on_done
+
+    jobs = [(read_json(path), writer(os.path.join(args.output_dir, os.path.basename(path)))) for path in args.inputs]
+    asyncio.run(
+        analyze_files_async(
+            jobs,
+            max_concurrent_tasks=args.concurrency,
+            prefilter=None if args.no_prefilter else build_themes_prefilter(),
+            platforms=[os.path.basename(path).removesuffix(".json") for path in args.inputs],
+        )
+    )
+
+
+def count(args):
+    from count_themes import count_themes
+    from json_io import write_json
+    from records import load_posts
+
+    posts = []
+    for path in args.inputs:
+        posts.extend(load_posts(path))
+    write_json(count_themes(posts), args.output, indent=None)
+
+
+def dedup(args):
+    from count_themes import dedup_theme_content
+    from json_io import read_json, write_json
+
+    write_json(dedup_theme_content(read_json(args.input)), args.output, indent=None)
+
+
+def summarize(args):
+    import asyncio
+
+    from summarize_themes import summarize_by_theme
+    from utils import read_json, write_json
+
+    options = {"max_concurrent_tasks": args.concurrency} if args.concurrency else {}
+    analyzed_data = asyncio.run(
+        summarize_by_theme(
+            read_json(args.input),
+            stream_path=os.path.splitext(args.output)[0] + ".jsonl",
+            quote_mode=args.quote_mode,
+            **options,
+        )
+    )
+    write_json(analyzed_data, args.output)
+
+
+def verify_quotes(args):
+    from verify_quotes import main as verify_main
+
+    verify_main(args.theme_count, args.input, args.output, args.report, args.mode, args.threshold)
+
+
+def merge(args):
+    import asyncio
+
+    from merge_duplicates import main as merge_main
+
+    asyncio.run(merge_main(input_file=args.input, output_file=args.output))
+
+
+def export(args):
+    from export_summaries import main as export_main
+
+    export_main(args.input, args.report, args.output_dir)
+
+
+def forward(args):
+    """已有命令行的脚本，剩余参数原样交给它的 main(argv)"""
+    module, _ = FORWARDED[args.command]
+    __import__(module).main(args.argv)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="主题分析各阶段的命令行入口，多个子命令之间用 + 分隔时在同一进程中依次运行"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("format-bili", help="整理 B 站爬虫数据")
+    p.add_argument("--inputs", nargs="+", default=[f"{RAW_DATA_DIR}/bili/search_comments_{d}.json" for d in CRAWL_DATES])
+    p.add_argument("--output", default=f"{FORMATTED_DIR}/bili.json")
+    p.set_defaults(func=format_bili)
+
+    p = subparsers.add_parser("format-wb", help="整理微博爬虫数据")
+    p.add_argument("--contents", nargs="+", default=[f"{RAW_DATA_DIR}/wb/search_contents_{d}.json" for d in CRAWL_DATES])
+    p.add_argument("--comments", nargs="+", default=[f"{RAW_DATA_DIR}/wb/search_comments_{d}.json" for d in CRAWL_DATES])
+    p.add_argument("--output", default=f"{FORMATTED_DIR}/wb.json")
+    p.set_defaults(func=format_wb)
+
+    p = subparsers.add_parser("distribute", help="为帖子和回复分配主题（调用模型）")
+    p.add_argument("--inputs", nargs="+", default=[f"{FORMATTED_DIR}/{platform}.json" for platform in PLATFORMS])
+    p.add_argument("--output-dir", default=RESULTS_DIR, help="结果按输入文件名写入该目录")
+    p.add_argument("--concurrency", type=int, default=DISTRIBUTE_CONCURRENCY, help="所有文件共用的并发请求数")
+    p.add_argument("--no-prefilter", action="store_true", help="不使用预过滤，所有条目都交给模型")
+    p.set_defaults(func=distribute)
+
+    p = subparsers.add_parser("count", help="按主题统计")
+    p.add_argument("--inputs", nargs="+", default=[f"{RESULTS_DIR}/{platform}.json" for platform in PLATFORMS])
+    p.add_argument("--output", default=f"{RESULTS_DIR}/theme_count.json")
+    p.set_defaults(func=count)
+
+    p = subparsers.add_parser("dedup", help="主题内容去重")
+    p.add_argument("--input", default=f"{RESULTS_DIR}/theme_count.json")
+    p.add_argument("--output", default=f"{RESULTS_DIR}/theme_count_dedup.json")
+    p.set_defaults(func=dedup)
+
+    p = subparsers.add_parser("summarize", help="按主题总结（调用模型）")
+    p.add_argument("--input", default=f"{RESULTS_DIR}/theme_count_dedup.json")
+    p.add_argument("--output", default=f"{RESULTS_DIR}/summarized.json")
+    p.add_argument("--concurrency", type=int, default=None, help="默认同 summarize_themes.SUMMARIZE_CONCURRENCY")
+    p.add_argument("--quote-mode", default=None, help="text 或 ids，默认由 SUMMARIZE_QUOTE_MODE 控制")
+    p.set_defaults(func=summarize)
+
+    p = subparsers.add_parser("verify-quotes", help="核对总结中的用户原声")
+    p.add_argument("--theme-count", default=f"{RESULTS_DIR}/theme_count_dedup.json")
+    p.add_argument("--input", default=f"{RESULTS_DIR}/summarized.json")
+    p.add_argument("--output", default=f"{RESULTS_DIR}/summarized_verified.json")
+    p.add_argument("--report", default=f"{RESULTS_DIR}/quote_report.json")
+    p.add_argument("--mode", choices=("flag", "anchor", "drop"), default="anchor")
+    p.add_argument("--threshold", type=float, default=0.8)
+    p.set_defaults(func=verify_quotes)
+
+    p = subparsers.add_parser("merge", help="合并重复的总结和要点（调用模型）")
+    p.add_argument("--input", default=f"{RESULTS_DIR}/summarized_verified.json")
+    p.add_argument("--output", default=f"{RESULTS_DIR}/merged_summarized.json")
+    p.set_defaults(func=merge)
+
+    p = subparsers.add_parser("export", help="导出前端按需加载的总结分片")
+    p.add_argument("--input", default=f"{RESULTS_DIR}/merged_summarized.json")
+    p.add_argument("--report", default=REPORT_PATH, help="提供总体分析和决策建议的文件")
+    p.add_argument("--output-dir", default=SUMMARIES_EXPORT_DIR)
+    p.set_defaults(func=export)
+
+    for name, (module, help_text) in FORWARDED.items():
+        p = subparsers.add_parser(name, help=help_text, add_help=False)
+        p.add_argument("argv", nargs=argparse.REMAINDER)
+    return parser
+
+
+def split_chain(argv):
+    """按 + 把参数拆成多段，每段是一个子命令"""
+    chain = [[]]
+    for arg in argv:
+        if arg == CHAIN_SEPARATOR:
+            chain.append([])
+        else:
+            chain[-1].append(arg)
+    return [segment for segment in chain if segment]
+
+
+def parse_command(parser, segment):
+    # argparse 的 REMAINDER 不会收下紧跟在子命令后的选项（例如 pipeline --force），转发的命令直接构造
+    if segment[0] in FORWARDED:
+        return argparse.Namespace(command=segment[0], argv=segment[1:], func=forward)
+    return parser.parse_args(segment)
+
+
+def main(argv=None):
+    parser = build_parser()
+    # 先解析全部子命令，参数有误时一个也不运行
+    commands = [parse_command(parser, segment) for segment in split_chain(sys.argv[1:] if argv is None else argv)]
+    if not commands:
+        parser.error("缺少子命令")
+
+    for args in commands:
+        start = time.perf_counter()
+        with profile_stage(args.command):
+            args.func(args)
+        if args.command in METRICS_NAMES:
+            from llm_metrics import METRICS
+
+            METRICS.dump(METRICS_NAMES[args.command])
+            METRICS.reset()
+        if len(commands) > 1:
+            print(f"[{args.command}] 完成，耗时 {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+流水线（pipeline.py）和命令行（cli.py）共用的数据路径与参数。
+
+只包含常量，不导入其他模块：cli.py 的子命令读取默认路径时不必加载整个流水线。
+路径都相对于仓库根目录。
+"""
+import os
+
+RAW_DATA_DIR = "analyze/raw_data"
+FORMATTED_DIR = "analyze/raw_data/formatted"
+RESULTS_DIR = "analyze/analyze_results"
+
+PLATFORMS = ["autohome", "dongchedi", "bili", "wb"]
+# 主题分配阶段中所有平台文件共用的并发请求额度
+DISTRIBUTE_CONCURRENCY = 200
+CRAWL_DATES = ["2025-05-20", "2025-05-21"]
+PREFILTER_MODEL_PATH = os.path.join(RESULTS_DIR, "prefilter_model.json")
+# 人工补充了总体分析和决策建议的合并结果，以及前端读取的导出目录
+REPORT_PATH = os.path.join(RESULTS_DIR, "merged_summarized_data.json")
+SUMMARIES_EXPORT_DIR = "public/data/summaries"
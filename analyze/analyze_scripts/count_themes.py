@@ -1,4 +1,6 @@
-from utils import *
+from json_io import write_json
+from records import load_posts
+from profiling import profile_stage
 
 questions_map = {
     "A": "用户决定下定、购买领克900的原因、理由；",
@@ -43,6 +45,13 @@ def count_themes(posts):
     return theme_count
 
 
+def dedup_theme_content(theme_count):
+    """对每个主题下的content去重，保持原有顺序以便输出稳定"""
+    for theme in theme_count.values():
+        theme["content"] = list(dict.fromkeys(theme["content"]))
+    return theme_count
+
+
 def main():
     posts = []
     file_paths = [
@@ -52,15 +61,17 @@ def main():
         "analyze/analyze_results/wb.json",
     ]
     for path in file_paths:
-        posts.extend(read_json(path))
+        # 转换为 Post 记录，四个平台的数据同时在内存中时占用更少
+        posts.extend(load_posts(path))
     theme_count = count_themes(posts)
     
     for theme, info in theme_count.items():
         count = info['count']
         print(f"主题 {theme} 出现的次数为 {count}")
 
-    write_json(theme_count, "analyze/analyze_results/theme_count.json")
+    write_json(theme_count, "analyze/analyze_results/theme_count.json", indent=None)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with profile_stage("count_themes"):
+        main()
\ No newline at end of file
@@ -6,13 +6,26 @@ from prompt import *
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+from profiling import profile_stage
+from prefilter import NaiveBayesClassifier, RelevancePrefilter, load_keyword_terms
 
-def analyzer(system_prompt, user_prompt):
-    openai_service = OpenAIService()
+HOTEL_TERMS = ["酒店", "入住", "前台", "房间", "早餐", "住宿", "客房", "退房", "会员"]
+
+
+def build_hotel_prefilter(hotel_names):
+    """酒店相关性分析使用的预过滤，关键词来自 keywords.json 和酒店名"""
+    terms = load_keyword_terms("raw_data/keywords.json") + list(hotel_names) + HOTEL_TERMS
+    classifier = NaiveBayesClassifier.load("analysis_result/prefilter_model.json")
+    return RelevancePrefilter(terms, classifier=classifier)
+
+
+def analyzer(system_prompt, user_prompt, stage="default", prompt_vars=None):
+    openai_service = OpenAIService(stage=stage)
     try:
         analysis = openai_service.infer(
             user_prompt=user_prompt,
             system_prompt=system_prompt,
+            prompt_vars=prompt_vars,
         )
     except Exception as e:
         print(f"Error analyzing content: {e}")
@@ -23,7 +36,7 @@ def analyzer(system_prompt, user_prompt):
         return None
 
 
-def analyze_is_hotel_related(raw_data, max_workers=200):
+def analyze_is_hotel_related(raw_data, max_workers=200, platform="default"):
     start_time = datetime.now()
 
     # 按平台读取所有酒店
@@ -35,6 +48,7 @@ def analyze_is_hotel_related(raw_data, max_workers=200):
 
     filtered_data = filter.filter_by_time(raw_data)
     simplified_data = filter.simplify_data(filtered_data)
+    prefilter = build_hotel_prefilter(hotel["hotel"] for hotel in simplified_data)
 
     # 计算总帖子数和回复数
     total_posts_to_analyze = 0
@@ -54,17 +68,33 @@ def analyze_is_hotel_related(raw_data, max_workers=200):
     analyzed_replies_count = 0
     tasks_submitted = 0
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    pool_size = thread_pool_size(max_workers, total_posts_to_analyze + total_replies_to_analyze)
+    with ThreadPoolExecutor(max_workers=pool_size) as executor:
         futures_map = {}
 
         # 提交帖子分析任务
         for hotel_index, hotel in enumerate(simplified_data):
             for post_index, post in enumerate(hotel["posts"]):
                 content = post.get("title", "") + "\n" + post["content"]
+                skip_reason = prefilter.check(content, platform)
+                if skip_reason:
+                    # 预过滤判定无关的帖子及其回复直接标记，不提交分析
+                    post["is_hotel_related"] = False
+                    post["is_hotel_related_reason"] = f"预过滤: {skip_reason}"
+                    post["is_ad"] = False
+                    post["is_ad_reason"] = ""
+                    for reply in post["replies"]:
+                        reply["is_hotel_related"] = False
+                        reply["is_hotel_related_reason"] = "所属帖子与酒店无关"
+                    total_posts_to_analyze -= 1
+                    total_replies_to_analyze -= len(post["replies"])
+                    continue
                 future = executor.submit(
                     analyzer,
                     is_hotel_related_system_prompt,
-                    is_hotel_related_user_prompt.format(post_content=content),
+                    is_hotel_related_user_prompt,
+                    "is_hotel_related",
+                    {"post_content": content},
                 )
                 futures_map[future] = {
                     "type": "post",
@@ -109,14 +139,15 @@ def analyze_is_hotel_related(raw_data, max_workers=200):
                 if is_related:
                     post = simplified_data[hotel_index]["posts"][post_index]
                     for reply_index, reply in enumerate(post["replies"]):
-                        # 对于内容长度小于10的评论，直接标记为False，不提交分析
-                        if len(reply["content"]) < 10:
+                        # 预过滤判定无关（过短且未提及关键词等）的评论直接标记为False，不提交分析
+                        skip_reason = prefilter.check(reply["content"], platform)
+                        if skip_reason:
                             simplified_data[hotel_index]["posts"][post_index][
                                 "replies"
                             ][reply_index]["is_hotel_related"] = False
                             simplified_data[hotel_index]["posts"][post_index][
                                 "replies"
-                            ][reply_index]["is_hotel_related_reason"] = "评论内容过短"
+                            ][reply_index]["is_hotel_related_reason"] = f"预过滤: {skip_reason}"
                             # 从总回复数中减去，因为它不被分析
                             total_replies_to_analyze -= 1
                             continue
@@ -124,9 +155,9 @@ def analyze_is_hotel_related(raw_data, max_workers=200):
                         reply_future = executor.submit(
                             analyzer,
                             is_hotel_related_system_prompt,
-                            is_hotel_related_user_prompt.format(
-                                post_content=reply["content"]
-                            ),
+                            is_hotel_related_user_prompt,
+                            "is_hotel_related",
+                            {"post_content": reply["content"]},
                         )
                         futures_map[reply_future] = {
                             "type": "reply",
@@ -232,6 +263,7 @@ def analyze_is_hotel_related(raw_data, max_workers=200):
                 ]["is_hotel_related_reason"] = f"处理错误: {exc}"
                 continue
         print("\n回复分析完成!")
+    prefilter.print_stats()
 
     # 统计分析结果
     final_hotel_related_posts = sum(
@@ -263,6 +295,7 @@ def analyze_is_hotel_related(raw_data, max_workers=200):
     print(f"总回复数 (实际分析): {total_replies_to_analyze}")
     print(f"- 与酒店相关回复数: {final_hotel_related_replies}")
     print(f"总耗时: {duration}")
+    METRICS.print_summary()
 
     return simplified_data
 
@@ -286,7 +319,7 @@ def analyze_keywords(analyzed_data, max_workers=500):
     print(f"找到 {total_posts} 个相关帖子和 {total_replies} 个相关回复")
 
     # 合并分析帖子和评论
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    with ThreadPoolExecutor(max_workers=thread_pool_size(max_workers, total_posts + total_replies)) as executor:
         futures_map = {}
 
         for hotel_index, hotel in enumerate(analyzed_data):
@@ -299,10 +332,11 @@ def analyze_keywords(analyzed_data, max_workers=500):
                     # 提交帖子分析任务
                     future_post = executor.submit(
                         analyzer,
-                        analyze_post_system_prompt.format(
-                            keywords=keywords, hotel=hotel_name
-                        ),
-                        analyze_post_user_prompt.format(post_content=post_content),
+                        analyze_post_system_prompt,
+                        analyze_post_user_prompt,
+                        "analyze_keywords:post",
+                        # 变量按从稳定到多变的顺序排列，prefix_cache 布局下能共享更长的前缀
+                        {"keywords": keywords, "hotel": hotel_name, "post_content": post_content},
                     )
                     futures_map[future_post] = {
                         "type": "post",
@@ -314,13 +348,15 @@ def analyze_keywords(analyzed_data, max_workers=500):
                         if reply.get("is_hotel_related"):
                             future_reply = executor.submit(
                                 analyzer,
-                                analyze_reply_system_prompt.format(
-                                    keywords=keywords, hotel=hotel_name
-                                ),
-                                analyze_reply_user_prompt.format(
-                                    reply_content=reply["content"],
-                                    post_content=post_content,
-                                ),
+                                analyze_reply_system_prompt,
+                                analyze_reply_user_prompt,
+                                "analyze_keywords:reply",
+                                {
+                                    "keywords": keywords,
+                                    "hotel": hotel_name,
+                                    "post_content": post_content,
+                                    "reply_content": reply["content"],
+                                },
                             )
                             futures_map[future_reply] = {
                                 "type": "reply",
@@ -382,6 +418,7 @@ def analyze_keywords(analyzed_data, max_workers=500):
     print(f"分析的帖子数: {total_posts}")
     print(f"分析的回复数: {total_replies}")
     print(f"总耗时: {duration}")
+    METRICS.print_summary()
 
     return analyzed_data
 
@@ -424,6 +461,7 @@ def extract_frequent_mentioned_words(keyword_content_map, max_workers=50):
                         primary_keyword=p_keyword,
                         secondary_keyword=s_keyword,
                     ),
+                    "extract_frequent_words",
                 )
                 tasks.append(future)
                 task_info_map[future] = (p_keyword, s_keyword)
@@ -465,7 +503,7 @@ def extract_typical_reviews_by_primary_keyword(keyword_content_map, max_workers=
     """
 
     def get_typical_reviews_for_primary_keyword(p_keyword, all_contents_for_p_keyword):
-        openai_service = OpenAIService()
+        openai_service = OpenAIService(stage="extract_typical_reviews")
         combined_content = "\n".join(all_contents_for_p_keyword)
         if not combined_content.strip():
             return {
@@ -588,6 +626,7 @@ def extract_user_focus(data, max_workers=20):
                 analyzer,
                 extract_user_focus_system_prompt,
                 extract_user_focus_user_prompt.format(content_chunk=chunk),
+                "extract_user_focus",
             ): chunk
             for chunk in chunks
         }
@@ -606,6 +645,7 @@ def extract_user_focus(data, max_workers=20):
         merge_user_focus_user_prompt.format(
             user_focus_keywords=", ".join(user_focus_list)
         ),
+        "merge_user_focus",
     )
     write_to_json(merged_user_focus_list, "analysis_result/user_focused_keywords.json")
     return merged_user_focus_list
@@ -620,6 +660,16 @@ def distribute_content_to_user_focus(contents):
         return {}
 
     result = {keyword: {"count": 0, "contents": []} for keyword in user_focus_keywords}
+
+    # 先用关键词匹配器做确定性的分配：内容中直接出现的关注点一定计入
+    matcher = KeywordMatcher.from_terms(user_focus_keywords)
+    matched = {}
+    for content in contents:
+        matched[content] = {hit["keyword"] for hit in matcher.find(content)}
+        for keyword in matched[content]:
+            result[keyword]["count"] += 1
+            result[keyword]["contents"].append(content)
+
     with ThreadPoolExecutor(max_workers=200) as executor:
         futures_map = {
             executor.submit(
@@ -628,6 +678,7 @@ def distribute_content_to_user_focus(contents):
                     user_focus_keywords=user_focus_keywords
                 ),
                 distribute_user_focus_user_prompt.format(content=content),
+                "distribute_user_focus",
             ): content
             for content in contents
         }
@@ -637,7 +688,7 @@ def distribute_content_to_user_focus(contents):
                 partial_res = future.result()
                 if partial_res:
                     for keyword in partial_res:
-                        if keyword not in result:
+                        if keyword not in result or keyword in matched[futures_map[future]]:
                             continue
                         result[keyword]["count"] += 1
                         result[keyword]["contents"].append(futures_map[future])
@@ -666,6 +717,7 @@ def summurize_user_focus():
                 summarize_user_focus_user_prompt.format(
                     content=f"帖子内容：\n".join(keyword_dict["contents"])
                 ),
+                "summarize_user_focus",
             ): keyword
             for keyword, keyword_dict in user_focus_keywords_count.items()
         }
@@ -712,7 +764,7 @@ def main():
     # first_analyzed_wb_data = analyze_is_hotel_related(unanalyzed_wb_data)
     # analyzed_wb_data = analyze_keywords(first_analyzed_wb_data)
     # print("分析完毕，正在写入文件")
-    # merge_data(analyzed_wb_data, "analysis_result/wb_analyzed.json")
+    # merge_new_posts(analyzed_wb_data, "analysis_result/wb_analyzed.json")
 
     # analyze more wb raw data from media crawler
     # hotels = ['亚朵轻居']
@@ -723,8 +775,8 @@ def main():
     #     formatted_data = format_wb_data_from_media_crawler_by_hotel(posts, comments, hotel)
     #     first_analyzed_data = analyze_is_hotel_related(formatted_data)
     #     analyzed_data = analyze_keywords(first_analyzed_data)
-    #     merge_data(formatted_data, 'raw_data/wb.json')
-    #     merge_data(analyzed_data, 'analysis_result/wb_analyzed.json')
+    #     merge_new_posts(formatted_data, 'raw_data/wb.json')
+    #     merge_new_posts(analyzed_data, 'analysis_result/wb_analyzed.json')
     #     print(f"{hotel} 的数据分析完毕")
 
     # analyze more xhs raw data from mobile crawler
@@ -748,12 +800,16 @@ def main():
     ]
     paths = [f"raw_data/xhs/5-19/filtered/xhs_{hotel}_all.json" for hotel in hotels]
     formatted_data = format_all_xhs_data_from_mobile(paths, hotels)
-    first_analyzed_data = analyze_is_hotel_related(formatted_data)
+    first_analyzed_data = analyze_is_hotel_related(formatted_data, platform="xhs")
     analyzed_data = analyze_keywords(first_analyzed_data)
-    merge_data(formatted_data, "raw_data/xhs.json")
-    merge_data(analyzed_data, "analysis_result/xhs_analyzed.json")
+    # 模型标注的关键词与原文中直接出现的关键词对照，用于检查提示词和同义词表
+    write_to_json(cross_check_keyword_labels(analyzed_data), "analysis_result/xhs_keyword_cross_check.json")
+    merge_new_posts(formatted_data, "raw_data/xhs.json")
+    merge_new_posts(analyzed_data, "analysis_result/xhs_analyzed.json")
     print("XHS 的数据分析完毕")
+    METRICS.dump("demo_analyze", metrics_dir="analysis_result/metrics")
 
 
 if __name__ == "__main__":
-    main()
+    with profile_stage("demo_analyze", output_dir="analysis_result/profiles"):
+        main()
@@ -4,6 +4,7 @@
 
 from openpyxl import Workbook
 from utils import *
+from profiling import profile_stage
 import pandas as pd
 import json  # Ensure json is imported
 from openpyxl import Workbook  # For creating new Excel files
@@ -246,13 +247,14 @@ def get_all_analyzed_data(file_paths):
 
 
 if __name__ == "__main__":
-    file_paths = [
-        "analysis_result/flyert_analyzed.json",
-        "analysis_result/wb_analyzed.json",
-        "analysis_result/xhs_analyzed.json",
-    ]
-    excel_file_path = "analysis_result/data_count.xlsx"
-    analyzed_data = get_all_analyzed_data(file_paths)
-    compiled_data = compile_keywords_for_analyzed_data(analyzed_data)
-    generate_excel_for_compiled_data(compiled_data, excel_file_path)
-    print(f"统计结果已保存在{excel_file_path}")
+    with profile_stage("demo_data_count", output_dir="analysis_result/profiles"):
+        file_paths = [
+            "analysis_result/flyert_analyzed.json",
+            "analysis_result/wb_analyzed.json",
+            "analysis_result/xhs_analyzed.json",
+        ]
+        excel_file_path = "analysis_result/data_count.xlsx"
+        analyzed_data = get_all_analyzed_data(file_paths)
+        compiled_data = compile_keywords_for_analyzed_data(analyzed_data)
+        generate_excel_for_compiled_data(compiled_data, excel_file_path)
+        print(f"统计结果已保存在{excel_file_path}")
@@ -0,0 +1,260 @@
+"""
+按酒店分区保存的帖子数据集（raw_data/*.json、analysis_result/*_analyzed.json），用于 merge_new_posts 的增量合并。
+
+数据集文件 path 是基准数据，基准之后合并进来的帖子保存在 path 旁边的 path.parts/ 目录中:
+    index.json        格式版本、基准文件的状态、是否有新增帖子、酒店 → 分区文件
+    <n>.jsonl         该酒店在基准之后新增的帖子，每行一条
+    <n>.keys          该酒店所有帖子（基准 + 新增）的键，每行为内容摘要和 note_id / link（存在时）
+
+合并新数据时只读取涉及的酒店的键文件做去重，新帖子追加到对应分区的末尾，不读写基准文件，
+读写量只与新数据量有关，而与整个数据集的大小无关；每条帖子也只保存一份（基准文件或分区）。
+完整的数据集由基准文件和分区拼接而成，统一通过 load()（demo 中为 get_raw_data(path)）读取。
+
+需要单个完整的 JSON 文件时（交给 prefilter.py train 等直接读文件的工具），用 export() 把新增的帖子
+写回基准文件，这一步要重写整个文件，不在合并时自动进行:
+    python hotel_store.py analysis_result/xhs_analyzed.json
+
+path 被其他代码整体重写（write_to_json 等）后，文件状态与 index.json 中记录的不一致，
+分区会以新的文件为基准重新建立，分区中的新增帖子以该文件为准。
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+# 单独运行时 json_io 等模块在上一级目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from json_io import read_json, write_json
+from records import to_json
+
+PARTS_SUFFIX = ".parts"
+INDEX_FILE = "index.json"
+# 1: 分区保存完整的数据集（旧格式）；2: 分区只保存基准之后新增的帖子
+FORMAT_VERSION = 2
+
+
+def content_hash(content):
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+def post_key(post):
+    """帖子的唯一标识，优先使用 note_id，其次 link，都没有时返回 None（只按内容去重）"""
+    for field in ("note_id", "link"):
+        if post.get(field):
+            return f"{field}:{post[field]}"
+    return None
+
+
+def _read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+class HotelStore:
+    def __init__(self, path):
+        self.path = path
+        self.parts_dir = path + PARTS_SUFFIX
+        self.index_path = os.path.join(self.parts_dir, INDEX_FILE)
+        self.index = None
+
+    @staticmethod
+    def has_partitions(path):
+        return os.path.exists(os.path.join(path + PARTS_SUFFIX, INDEX_FILE))
+
+    def _source_state(self):
+        if not os.path.exists(self.path):
+            return None
+        stat = os.stat(self.path)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _load_index(self):
+        if self.index is None and os.path.exists(self.index_path):
+            self.index = read_json(self.index_path)
+        return self.index
+
+    def is_current(self):
+        """分区是否以 path 的当前内容为基准"""
+        index = self._load_index()
+        return (
+            index is not None
+            and index.get("version") == FORMAT_VERSION
+            and index["source"] == self._source_state()
+        )
+
+    def has_additions(self):
+        """基准文件之后是否有合并进来、尚未导出的帖子"""
+        return self.is_current() and self.index["pending"]
+
+    def sync(self):
+        """确保分区以 path 为基准，不一致时从 path 重新建立键文件（读取整个文件，只在第一次或文件被重写后发生）"""
+        if self.is_current():
+            return
+        index = self.index
+        if index is not None and index.get("version") is None and index.get("dirty"):
+            # 旧格式的分区保存的是完整的数据集，其中未写回的修改先写回 path，再以 path 为基准
+            write_json(self._load_partitions(), self.path, default=to_json)
+        elif index is not None and index.get("pending"):
+            print(f"{self.path} 已被重写，分区中新增的帖子以该文件为准")
+
+        data = read_json(self.path) if os.path.exists(self.path) else []
+        os.makedirs(self.parts_dir, exist_ok=True)
+        for name in os.listdir(self.parts_dir):
+            os.remove(os.path.join(self.parts_dir, name))
+        self.index = {
+            "version": FORMAT_VERSION,
+            "source": self._source_state(),
+            "pending": False,
+            "hotels": {},
+        }
+        for hotel in data:
+            entry = self.index["hotels"].get(hotel["hotel"]) or self._add_hotel(hotel["hotel"])
+            self._append_keys(entry, hotel["posts"])
+        self._save_index()
+
+    # ------------------------------------------------------------------
+    # 分区
+    # ------------------------------------------------------------------
+
+    def _add_hotel(self, hotel_name):
+        entry = str(len(self.index["hotels"]))
+        self.index["hotels"][hotel_name] = entry
+        return entry
+
+    def _partition_path(self, entry, suffix=".jsonl"):
+        return os.path.join(self.parts_dir, entry + suffix)
+
+    def _append_keys(self, entry, posts):
+        with open(self._partition_path(entry, ".keys"), "a", encoding="utf-8") as f:
+            for post in posts:
+                digest = content_hash(post["content"]) if "content" in post else "-"
+                f.write(f"{digest} {post_key(post) or ''}\n")
+
+    def _append(self, entry, posts):
+        """把新增的帖子及其键追加到分区末尾"""
+        with open(self._partition_path(entry), "a", encoding="utf-8") as f:
+            for post in posts:
+                f.write(json.dumps(post, ensure_ascii=False, default=to_json) + "\n")
+        self._append_keys(entry, posts)
+
+    def _read_keys(self, entry):
+        seen_contents, seen_keys = set(), set()
+        for line in _read_lines(self._partition_path(entry, ".keys")):
+            digest, _, key = line.partition(" ")
+            seen_contents.add(digest)
+            if key:
+                seen_keys.add(key)
+        return seen_contents, seen_keys
+
+    def _read_partition(self, entry):
+        return [json.loads(line) for line in _read_lines(self._partition_path(entry)) if line]
+
+    def _load_partitions(self):
+        """按酒店顺序拼接所有分区（旧格式中即完整的数据集）"""
+        return [
+            {"hotel": hotel_name, "posts": self._read_partition(entry)}
+            for hotel_name, entry in self.index["hotels"].items()
+        ]
+
+    def _save_index(self):
+        write_json(self.index, self.index_path, indent=None)
+
+    # ------------------------------------------------------------------
+    # 合并、读取与导出
+    # ------------------------------------------------------------------
+
+    def upsert(self, formatted_data):
+        """
+        把 formatted_data 中尚不存在的帖子合并到对应酒店，已存在的帖子不修改。
+
+        帖子的 note_id / link（存在时）或内容与已有帖子相同即视为已存在，
+        formatted_data 内部的重复帖子也只保留第一条。
+
+        Returns:
+            dict: {酒店名: 新增的帖子列表}
+        """
+        self.sync()
+        added = {}
+        for formatted_hotel in formatted_data:
+            hotel_name = formatted_hotel["hotel"]
+            entry = self.index["hotels"].get(hotel_name)
+            if entry is not None:
+                seen_contents, seen_keys = self._read_keys(entry)
+            else:
+                seen_contents, seen_keys = set(), set()
+
+            new_posts = []
+            for post in formatted_hotel["posts"]:
+                if "content" not in post:
+                    continue
+                digest = content_hash(post["content"])
+                key = post_key(post)
+                if digest in seen_contents or (key and key in seen_keys):
+                    continue
+                seen_contents.add(digest)
+                if key:
+                    seen_keys.add(key)
+                new_posts.append(post)
+
+            if not new_posts:
+                continue
+            if entry is None:
+                entry = self._add_hotel(hotel_name)
+            self._append(entry, new_posts)
+            added[hotel_name] = new_posts
+
+        if added:
+            self.index["pending"] = True
+            self._save_index()
+        return added
+
+    def load(self):
+        """基准文件加上各酒店新增的帖子，结构与数据集文件相同"""
+        self.sync()
+        data = read_json(self.path) if os.path.exists(self.path) else []
+        if not self.index["pending"]:
+            return data
+
+        hotels = {}
+        for hotel in data:
+            hotels.setdefault(hotel["hotel"], hotel)
+        for hotel_name, entry in self.index["hotels"].items():
+            new_posts = self._read_partition(entry)
+            if not new_posts:
+                continue
+            if hotel_name in hotels:
+                hotels[hotel_name]["posts"].extend(new_posts)
+            else:
+                data.append({"hotel": hotel_name, "posts": new_posts})
+        return data
+
+    def export(self):
+        """把新增的帖子写回基准文件（重写整个文件），之后分区只保存键"""
+        if not self.has_additions():
+            return
+        write_json(self.load(), self.path, default=to_json)
+        for entry in self.index["hotels"].values():
+            partition_path = self._partition_path(entry)
+            if os.path.exists(partition_path):
+                os.remove(partition_path)
+        self.index["source"] = self._source_state()
+        self.index["pending"] = False
+        self._save_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把增量合并的帖子写回数据集文件")
+    parser.add_argument("paths", nargs="+", help="数据集文件，如 analysis_result/xhs_analyzed.json")
+    args = parser.parse_args()
+    for path in args.paths:
+        if not HotelStore.has_partitions(path):
+            print(f"{path} 没有分区，跳过")
+            continue
+        HotelStore(path).export()
+        print(f"{path} 已导出")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,132 @@
+from array import array
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
 import json
 import os
 from pprint import pprint
 import random
 import re
+import sys
+import time
 
 from openai import OpenAI
 
+# 与 analyze_scripts 共用的模块（llm_metrics 等）放在上一级目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_metrics import METRICS, CallStats
+from keyword_matcher import KeywordMatcher
+from prompt_layout import INLINE, PREFIX_CACHE, layout_prompts, prefix_digest
+from batch_backend import MAX_BATCH_SIZE, get_batch_submitter
+from model_router import ModelRouter, confidence_from_logprobs
+from records import Post, Reply, to_json
+from hotel_store import HotelStore
+import json_io
+
 
 class OpenAIService:
     """Service class for OpenAI API interactions."""
 
-    def __init__(self):
+    # 各阶段出现过的系统提示词摘要，demo 中每次调用都会新建 OpenAIService，因此放在类上
+    _prefixes = {}
+
+    def __init__(self, stage="default", prompt_layout=None, backend=None, router=None):
         self.client = OpenAI(
             api_key=os.environ.get("OPENAI_API_KEY"),
             base_url=os.environ.get("OPENAI_API_BASE"),
         )
+        # 调用指标里记录的阶段名
+        self.stage = stage
+        # prompt 布局（prompt_layout.INLINE / PREFIX_CACHE），默认由环境变量 OPENAI_PROMPT_LAYOUT 控制
+        self.prompt_layout = prompt_layout or os.environ.get("OPENAI_PROMPT_LAYOUT", INLINE)
+        # interactive 为普通接口，batch / batch_local 见 batch_backend.py，默认由环境变量 OPENAI_BACKEND 控制
+        self.backend = backend or os.environ.get("OPENAI_BACKEND", "interactive")
+        self.batch = get_batch_submitter(self.backend) if self.backend != "interactive" else None
+        # 按阶段选择模型（见 model_router.py），默认由环境变量 OPENAI_MODEL_ROUTING / OPENAI_MODEL_ROUTES 控制
+        self.router = router or ModelRouter.from_env()
 
     def infer(
         self,
         user_prompt: str,
         system_prompt: str,
-        model: str = "gpt-4.1-mini",
+        model: str = None,
         temperature: float = 0.8,
         retries: int = 3,
+        prompt_vars=None,
     ):
-        """Make an inference using OpenAI API."""
+        """
+        Make an inference using OpenAI API.
+
+        传入 prompt_vars 时 system_prompt / user_prompt 为模板，按 self.prompt_layout 填入变量。
+        不传 model 时按阶段由 self.router 选择模型，结果无效或置信度过低时升级到下一档
+        """
+        route = self.router.route(self.stage, model)
+        call = CallStats(self.stage, route.tiers[0])
+        system_prompt, user_prompt = layout_prompts(
+            system_prompt, user_prompt, prompt_vars, self.prompt_layout
+        )
+        if self.prompt_layout == PREFIX_CACHE:
+            digest = prefix_digest(system_prompt)
+            seen = OpenAIService._prefixes.setdefault(self.stage, set())
+            if seen and digest not in seen:
+                print(f"[{self.stage}] 系统提示词发生变化（第 {len(seen) + 1} 种），前缀缓存无法命中")
+            seen.add(digest)
+        status = "error"
+        try:
+            for tier, tier_model in enumerate(route.tiers):
+                last = tier == len(route.tiers) - 1
+                call.model = tier_model
+                call.logprobs = route.min_confidence is not None and not last
+                call.confidence = None
+                tier_started_at = time.time()
+                try:
+                    result = self._infer(user_prompt, system_prompt, tier_model, temperature, retries, call)
+                except Exception:
+                    call.add_tier(tier_model, time.time() - tier_started_at, False)
+                    if last:
+                        raise
+                    print(f"[{self.stage}] {tier_model} 调用失败，升级到 {route.tiers[tier + 1]}")
+                    continue
+                confident = (
+                    not call.logprobs
+                    or call.confidence is None
+                    or call.confidence >= route.min_confidence
+                )
+                accepted = result is not None and confident
+                call.add_tier(tier_model, time.time() - tier_started_at, accepted)
+                if accepted or last:
+                    break
+                reason = "结果无效" if result is None else f"置信度 {call.confidence:.2f} 过低"
+                print(f"[{self.stage}] {tier_model} {reason}，升级到 {route.tiers[tier + 1]}")
+            status = "ok" if result is not None else "invalid"
+            return result
+        finally:
+            METRICS.record(call, status)
+
+    def _infer(self, user_prompt, system_prompt, model, temperature, retries, call):
         for attempt in range(retries):
+            call.retries = attempt
             try:
-                completion = self.client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        ({"role": "system", "content": system_prompt}),
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    timeout=300,
-                    temperature=temperature,
-                )
+                messages = [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ]
+                kwargs = {"logprobs": True} if call.logprobs else {}
+                if self.batch:
+                    # 阻塞当前线程直到所在批次完成
+                    completion = self.batch.complete_sync(
+                        model=model, messages=messages, temperature=temperature, **kwargs
+                    )
+                else:
+                    completion = self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        timeout=300,
+                        temperature=temperature,
+                        **kwargs,
+                    )
+                call.add_usage(getattr(completion, "usage", None))
+                if call.logprobs:
+                    call.confidence = confidence_from_logprobs(completion)
                 res_raw = completion.choices[0].message.content
 
                 # Try to parse JSON if present
@@ -46,6 +136,7 @@ class OpenAIService:
                     try:
                         return json.loads(matches[0], strict=False)
                     except json.JSONDecodeError as e:
+                        call.parse_failures += 1
                         user_prompt += f"""**请严格按照要求的json格式返回结果，确保json格式正确，且不要返回多余的解释和注释**
                         请注意避免出现如下报错：
                         ```
@@ -54,6 +145,7 @@ class OpenAIService:
                         """
                         continue
                 else:
+                    call.parse_failures += 1
                     user_prompt += "**请严格按照要求的json格式返回结果，确保json格式正确，且不要返回多余的解释和注释**"
                     continue
 
@@ -63,96 +155,153 @@ class OpenAIService:
                     raise
 
 
+EPOCH = datetime(1970, 1, 1)
+
+
+def thread_pool_size(max_workers, item_count):
+    """
+    并发调用模型的线程数。批量后端中每个线程都阻塞在自己那条请求的结果上，线程数就是一个批次最多
+    能攒到的请求数，因此由环境变量 OPENAI_BACKEND 选择批量后端时，线程数提高到条目数（不超过单批上限），
+    让所有请求进入同一个批次，而不是拆成多个依次等待完成的小批次。
+    """
+    if os.environ.get("OPENAI_BACKEND", "interactive") == "interactive":
+        return max_workers
+    return max(max_workers, min(item_count, MAX_BATCH_SIZE))
+
+
+def to_epoch(dt):
+    """naive datetime 转为整数秒，只用于比较先后，不涉及时区"""
+    return (dt - EPOCH) // timedelta(seconds=1)
+
+
+class TimeIndex:
+    """
+    一个酒店下帖子时间的排序索引。
+
+    epochs 为解析后按时间排序的整数秒（int64 数组），positions 为对应帖子在 posts 中的下标。
+    没有时间或时间无法解析的帖子不进入索引，与原来逐条解析时跳过这些帖子的行为一致。
+    回复的索引在第一次按回复时间筛选时按帖子分别建立。
+    """
+
+    def __init__(self, posts):
+        self.posts = posts
+        self.size = len(posts)
+        parsed = []
+        for position, post in enumerate(posts):
+            if not post.get("timestamp", None):
+                continue
+            try:
+                post_time = datetime.strptime(post["timestamp"], "%Y-%m-%d %H:%M")
+            except ValueError:
+                print(f"无法解析时间格式: {post['timestamp']}")
+                print(f"跳过此条帖子: {post['link']}")
+                continue
+            parsed.append((to_epoch(post_time), position))
+        parsed.sort()
+        self.epochs = array("q", [epoch for epoch, _ in parsed])
+        self.positions = array("q", [position for _, position in parsed])
+        self._replies = {}
+
+    def select(self, start, end):
+        """时间在 [start, end] 内的帖子下标，按原有顺序返回"""
+        lo = bisect_left(self.epochs, start)
+        hi = bisect_right(self.epochs, end)
+        return sorted(self.positions[lo:hi])
+
+    def select_replies(self, position, start, end):
+        if position not in self._replies:
+            self._replies[position] = self._index_replies(self.posts[position]["replies"])
+        epochs, positions = self._replies[position]
+        return sorted(positions[bisect_left(epochs, start) : bisect_right(epochs, end)])
+
+    @staticmethod
+    def _index_replies(replies):
+        parsed = []
+        for position, reply in enumerate(replies):
+            # 原始数据中回复时间为 comment_time，simplify_data 之后为 timestamp
+            reply_time = reply.get("comment_time", None) or reply.get("timestamp", None)
+            if not reply_time:
+                continue
+            try:
+                parsed.append(
+                    (to_epoch(datetime.strptime(reply_time, "%Y-%m-%d %H:%M")), position)
+                )
+            except ValueError:
+                print(f"无法解析时间格式: {reply_time}")
+        parsed.sort()
+        return [epoch for epoch, _ in parsed], [position for _, position in parsed]
+
+
 class PostsFilter:
     def __init__(self, start_date=datetime(2024, 3, 1), end_date=datetime(2025, 2, 28)):
         self.start_date = start_date
         self.end_date = end_date
         self.data = []
+        # filter_by_time 的时间索引，对应最近一次筛选的 raw_data
+        self._indexed_data = None
+        self._index = []
 
     def simplify_data(self, data):
         """
         去掉raw_data中的author字段
         去掉replies中每个reply的commenter_name和commenter_link字段
+
+        帖子和回复转换为 records.Post / Reply，后续分析阶段原地写入结果，写 JSON 时按 dict 输出
         """
         simplified_data = []
         for hotel in data:
             simplified_posts = []
             for post in hotel["posts"]:
-                simplified_post = {
-                    "content": post["content"],
-                    "timestamp": post["timestamp"],
-                    "link": post["link"],
-                    "replies": [
-                        {
-                            "content": reply["comment_content"],
-                            "timestamp": reply["comment_time"],
-                        }
+                simplified_post = Post(
+                    content=post["content"],
+                    timestamp=post["timestamp"],
+                    link=post["link"],
+                    replies=[
+                        Reply(
+                            content=reply["comment_content"],
+                            timestamp=reply["comment_time"],
+                        )
                         for reply in post["replies"]
                     ],
-                }
+                )
                 # 检查 'note_id' 是否存在于 post 中，如果存在则添加
                 if "note_id" in post:
-                    simplified_post["note_id"] = post["note_id"]
+                    simplified_post.note_id = post["note_id"]
                 simplified_posts.append(simplified_post)
 
             simplified_hotel = {"hotel": hotel["hotel"], "posts": simplified_posts}
             simplified_data.append(simplified_hotel)
         return simplified_data
 
-    def filter_by_time(self, raw_data):
+    def filter_by_time(self, raw_data, filter_replies=False):
         """
-        从帖子列表中筛选出指定时间范围内的飞客茶馆帖子, 并且去掉多余字段
+        从帖子列表中筛选出指定时间范围内的飞客茶馆帖子
+
+        每个酒店的帖子时间只在第一次筛选时解析，保存为按时间排序的索引（见 TimeIndex），
+        之后修改 start_date / end_date 再次筛选同一份 raw_data 时只需二分查找。
+        raw_data 中的帖子时间被修改后需要调用 self.clear_index()。
 
         Args:
             raw_data: 原始飞客茶馆数据
+            filter_replies: 是否同时去掉时间范围外的回复，为 True 时返回的帖子是浅拷贝
 
         Returns:
-            list: 筛选后的帖子列表
+            list: 筛选后的帖子列表，帖子保持原有顺序
         """
+        index = self._get_index(raw_data)
+        start, end = to_epoch(self.start_date), to_epoch(self.end_date)
         self.data = []
-        for hotel in raw_data:
+        for hotel, hotel_index in zip(raw_data, index):
             filtered_posts = []
-            for post in hotel["posts"]:
-                if post.get("timestamp", None):
-                    try:
-                        post_time = datetime.strptime(
-                            post["timestamp"], "%Y-%m-%d %H:%M"
-                        )
-                        if self.start_date <= post_time <= self.end_date:
-                            # filter replies
-                            replies = []
-                            for reply in post["replies"]:
-                                if reply.get("timestamp", None):
-                                    try:
-                                        reply_time = datetime.strptime(
-                                            reply["comment_time"], "%Y-%m-%d %H:%M"
-                                        )
-                                        if (
-                                            self.start_date
-                                            <= reply_time
-                                            <= self.end_date
-                                        ):
-                                            tmp = {
-                                                "content": reply["content"],
-                                                "timestamp": reply["comment_time"],
-                                            }
-                                            replies.append(tmp)
-                                    except ValueError:
-                                        print(
-                                            f"无法解析时间格式: {reply['comment_time']}"
-                                        )
-
-                            tmp = {
-                                "link": post["link"],
-                                "timestamp": post["timestamp"],
-                                "content": post["content"],
-                                "replies": replies,
-                            }
-                            filtered_posts.append(post)
-                    except ValueError:
-                        print(f"无法解析时间格式: {post['timestamp']}")
-                        print(f"跳过此条帖子: {post['link']}")
-
+            for position in hotel_index.select(start, end):
+                post = hotel["posts"][position]
+                if filter_replies:
+                    post = dict(post)
+                    post["replies"] = [
+                        post["replies"][i]
+                        for i in hotel_index.select_replies(position, start, end)
+                    ]
+                filtered_posts.append(post)
             self.data.append(
                 {
                     "hotel": hotel["hotel"],
@@ -161,6 +310,22 @@ class PostsFilter:
             )
         return self.data
 
+    def _get_index(self, raw_data):
+        if self._indexed_data is not raw_data or len(self._index) != len(raw_data):
+            self._indexed_data = raw_data
+            self._index = []
+        for i, hotel in enumerate(raw_data):
+            if i == len(self._index):
+                self._index.append(TimeIndex(hotel["posts"]))
+            elif self._index[i].size != len(hotel["posts"]):
+                # 新增了帖子，重建该酒店的索引
+                self._index[i] = TimeIndex(hotel["posts"])
+        return self._index
+
+    def clear_index(self):
+        self._indexed_data = None
+        self._index = []
+
     def get_posts_by_hotel(self, raw_data, platform, hotel_name):
         """
         根据酒店名称获取该酒店的所有帖子
@@ -183,6 +348,10 @@ class PostsFilter:
 
 
 class Keywords:
+    # 编译好的关键词匹配器，keywords.json 修改后会重新编译
+    _matcher = None
+    _matcher_version = None
+
     @staticmethod
     def get_keywords():
         keywords_path = "raw_data/keywords.json"
@@ -291,24 +460,24 @@ class Keywords:
         return filtered_data
 
     @staticmethod
-    def format_keyword(keyword):
-        keywords = []
-        keywords_data = Keywords.get_keywords()
-        for keyword_dict in keywords_data:  # type: ignore
-            pk = keyword_dict["primary_keyword"]
-            if pk not in keywords:
-                keywords.append(pk)
-
-            for sk_dict in keyword_dict["secondary_keywords"]:
-                sk = sk_dict["keyword"]
-                if sk not in keywords:
-                    keywords.append(sk)
-
-        for standard_keyword in keywords:
-            if standard_keyword.replace(" ", "") == keyword.replace(" ", ""):
-                return standard_keyword
+    def get_matcher():
+        """
+        获取由 keywords.json 中一级、二级关键词及同义词编译成的 Aho–Corasick 匹配器。
+        同义词可以写在 keywords.json 条目的 synonyms 字段里，也可以放在 raw_data/keyword_synonyms.json
+        （{标准关键词: [同义词, ...]}）中。
+        """
+        paths = ["raw_data/keywords.json", "raw_data/keyword_synonyms.json"]
+        version = tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in paths)
+        if Keywords._matcher is None or Keywords._matcher_version != version:
+            synonyms = get_raw_data(paths[1]) if os.path.exists(paths[1]) else {}
+            Keywords._matcher = KeywordMatcher.from_keywords(Keywords.get_keywords(), synonyms)
+            Keywords._matcher_version = version
+        return Keywords._matcher
 
-        return None
+    @staticmethod
+    def format_keyword(keyword):
+        """忽略空格，将关键词（或其同义词）还原为 keywords.json 中的标准写法，找不到时返回 None"""
+        return Keywords.get_matcher().lookup(keyword)
 
     @staticmethod
     def get_sk_to_pk_map():
@@ -338,9 +507,11 @@ class Keywords:
 
 
 def get_raw_data(path):
+    # merge_new_posts 增量合并过的数据集由基准文件和分区拼接而成，见 hotel_store.py
+    if HotelStore.has_partitions(path):
+        return HotelStore(path).load()
     if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return json_io.read_json(path)
     else:
         print("path不存在")
         return None
@@ -348,8 +519,7 @@ def get_raw_data(path):
 
 def write_to_json(data, path):
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        json_io.write_json(data, path, default=to_json)
     except Exception as e:
         print(f"写入文件时发生错误: {e}")
         raise
@@ -366,11 +536,8 @@ def rearrange_flyert_data():
     with open(absolute_links_path, "r", encoding="utf-8") as f:
         links = json.load(f)
 
-    with open(absolute_raw_data_path, "r", encoding="utf-8") as f:
-        raw_data = json.load(f)
-
-    with open(absolute_analyzed_data_path, "r", encoding="utf-8") as f:
-        analyzed_data = json.load(f)
+    raw_data = get_raw_data(absolute_raw_data_path)
+    analyzed_data = get_raw_data(absolute_analyzed_data_path)
 
     raw_posts_list = [post for hotel in raw_data for post in hotel["posts"]]
     analyzed_posts_list = [post for hotel in analyzed_data for post in hotel["posts"]]
@@ -403,8 +570,7 @@ def format_xhs_data_from_mobile(file_path, hotel_name):
     """
     将从移动端爬取的xhs数据格式化成与flyert数据格式相同的格式，以便于分析
     """
-    with open("raw_data/xhs.json", "r", encoding="utf-8") as f:
-        existing_data = json.load(f)
+    existing_data = get_raw_data("raw_data/xhs.json")
 
     with open(file_path, "r", encoding="utf-8") as f:
         data = json.load(f)
@@ -475,63 +641,27 @@ def format_all_xhs_data_from_mobile(data_path, hotel_names):
     return all_data
 
 
-def merge_data(formatted_data, existing_data_path):
-    """
-    将格式化或分析后的数据合并到已有的数据中，并根据 post['content'] 进行去重。
+def merge_new_posts(formatted_data, existing_data_path):
     """
-    existing_data = get_raw_data(existing_data_path)
-    if existing_data is None:
-        print(f"警告: {existing_data_path} 不存在或为空")
-        raise
+    将格式化或分析后的数据合并到已有的数据中，按 note_id / link（存在时）或 post['content'] 去重。
 
-    for formatted_hotel in formatted_data:
-        found_hotel = False
-        for existing_hotel in existing_data:
-            if formatted_hotel["hotel"] == existing_hotel["hotel"]:
-                found_hotel = True
-                # 获取现有帖子的内容集合，用于去重
-                existing_contents = {
-                    post["content"]
-                    for post in existing_hotel["posts"]
-                    if "content" in post
-                }
+    数据集按酒店分区保存（见 hotel_store.py），只向有新帖子的酒店分区追加，不重写 existing_data_path，
+    合并后的完整数据通过 get_raw_data(existing_data_path) 读取。需要单个完整的文件时，
+    用 HotelStore(existing_data_path).export() 导出。
 
-                new_posts_to_add = []
-                for post_to_add in formatted_hotel["posts"]:
-                    if (
-                        "content" in post_to_add
-                        and post_to_add["content"] not in existing_contents
-                    ):
-                        new_posts_to_add.append(post_to_add)
-                        existing_contents.add(
-                            post_to_add["content"]
-                        )  # 将新添加的内容也加入，防止formatted_hotel内部重复
-
-                existing_hotel["posts"].extend(new_posts_to_add)
-                break
-
-        if not found_hotel:
-            # 如果在 existing_data 中没有找到对应的酒店，则将整个 formatted_hotel 添加进去
-            # (确保其帖子也是唯一的，因为formatted_data内部可能有重复)
-            unique_posts_for_new_hotel = []
-            seen_contents_for_new_hotel = set()
-            for post in formatted_hotel["posts"]:
-                if (
-                    "content" in post
-                    and post["content"] not in seen_contents_for_new_hotel
-                ):
-                    unique_posts_for_new_hotel.append(post)
-                    seen_contents_for_new_hotel.add(post["content"])
-            if unique_posts_for_new_hotel:  # 只有当有帖子时才添加酒店
-                existing_data.append(
-                    {
-                        "hotel": formatted_hotel["hotel"],
-                        "posts": unique_posts_for_new_hotel,
-                    }
-                )
+    Returns:
+        dict: {酒店名: 新增的帖子列表}
+    """
+    if not os.path.exists(existing_data_path) and not HotelStore.has_partitions(existing_data_path):
+        print(f"警告: {existing_data_path} 不存在或为空")
+        raise FileNotFoundError(existing_data_path)
 
-    write_to_json(existing_data, existing_data_path)
-    return existing_data
+    added = HotelStore(existing_data_path).upsert(formatted_data)
+    print(
+        f"{existing_data_path}: {len(added)} 个酒店新增 "
+        f"{sum(len(posts) for posts in added.values())} 条帖子"
+    )
+    return added
 
 
 def format_iso_timestamp_to_custom(iso_timestamp_str):
@@ -898,6 +1028,43 @@ def collect_huiting_content_by_keyword(data):
     return keyword_posts
 
 
+def cross_check_keyword_labels(data):
+    """
+    将 LLM 标注的 keywords_mentioned 与关键词匹配器在原文中找到的关键词进行比对，
+    llm_only / text_only 较多的关键词需要检查提示词或补充同义词。
+
+    Returns:
+        dict: 每个关键词的 both（两者都有）、llm_only（原文中未出现）、text_only（LLM 未标注）数量
+    """
+    matcher = Keywords.get_matcher()
+    result = {}
+
+    def count(keyword, key):
+        result.setdefault(keyword, {"both": 0, "llm_only": 0, "text_only": 0})[key] += 1
+
+    for hotel in data:
+        for post in hotel["posts"]:
+            for item in [post] + post.get("replies", []):
+                if not item.get("is_hotel_related"):
+                    continue
+                mentioned = item.get("keywords_mentioned") or {}
+                labelled = {
+                    kw["keyword"]
+                    for level in ("primary_keyword", "secondary_keyword")
+                    for kw in mentioned.get(level, [])
+                    if isinstance(kw, dict) and kw.get("keyword")
+                }
+                found = {hit["keyword"] for hit in matcher.find(item["content"])}
+                for keyword in labelled | found:
+                    if keyword in labelled and keyword in found:
+                        count(keyword, "both")
+                    elif keyword in labelled:
+                        count(keyword, "llm_only")
+                    else:
+                        count(keyword, "text_only")
+    return result
+
+
 def get_unanalyzed_posts(all_data, analyzed_data, platform):
     """
     从所有数据中获取未分析过的帖子
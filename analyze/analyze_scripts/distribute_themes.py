@@ -4,18 +4,21 @@
 import asyncio
 from utils import *
 from prompt import *
-
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from schemas import THEMES_SCHEMA
+from llm_metrics import METRICS
+from profiling import profile_stage
+from prefilter import build_themes_prefilter
 
 
 async def process_item(idx, content, type_, openai_service, reply_idx=None):
     """
     该函数负责调用 infer 并返回任务的位置信息，便于后续写回 posts 结构。
     """
-    user_prompt = distribute_themes_user_prompt.format(post_content=content)
     res = await openai_service.infer(
-        user_prompt=user_prompt,
-        system_prompt=distribute_themes_system_prompt
+        user_prompt=distribute_themes_user_prompt,
+        system_prompt=distribute_themes_system_prompt,
+        prompt_vars={"post_content": content},
+        response_schema=THEMES_SCHEMA,
     )
     if type_ == "post":
         location = idx
@@ -23,49 +26,111 @@ async def process_item(idx, content, type_, openai_service, reply_idx=None):
         location = (idx, reply_idx)
     return (location, type_, res)
 
-async def analyze_posts_async(posts, max_concurrent_tasks=200):
-    openai_service = OpenAIService()
-    tasks = []
-
+def iter_items(posts):
+    """
+    依次产出一个文件中所有需要分配主题的条目：(idx, reply_idx, content, type_)
+    """
     for idx, post in enumerate(posts):
-        content = post["content"]
-        # 为每个主 post 创建任务
-        task = asyncio.create_task(
-            process_item(
-                idx=idx,
-                content=content,
-                type_="post",
-                openai_service=openai_service
-            )
-        )
-        tasks.append(task)
-
-        # 为每个 reply 创建任务
-        replies = post.get("replies", [])
-        for i, reply in enumerate(replies):
-            task = asyncio.create_task(
-                process_item(
-                    idx=idx,
-                    reply_idx=i,
-                    content=reply["content"],
-                    type_="reply",
-                    openai_service=openai_service
+        yield idx, None, post["content"], "post"
+        for i, reply in enumerate(post.get("replies", [])):
+            yield idx, i, reply["content"], "reply"
+
+
+def write_back(posts, location, type_, res):
+    """将单条结果写回 posts 结构"""
+    if type_ == "post":
+        posts[location]["themes"] = res
+    else:
+        idx, reply_idx = location
+        posts[idx]["replies"][reply_idx]["themes"] = res
+
+
+async def analyze_files_async(
+    jobs, max_concurrent_tasks=200, openai_service=None, prefilter=None, platforms=None
+):
+    """
+    将多个文件的所有条目放进同一个任务队列，由固定数量的 worker 共享并发额度处理。
+
+    Args:
+        jobs: [(posts, on_done), ...]，某个文件的全部条目完成后会以 posts 调用 on_done
+        max_concurrent_tasks: 所有文件共用的最大并发请求数
+        prefilter: RelevancePrefilter，被跳过的条目直接标注为空列表，不调用 LLM
+        platforms: 与 jobs 对应的平台名，用于统计预过滤的跳过比例
+
+    Returns:
+        list: 每个文件分析后的 posts，顺序与 jobs 相同
+    """
+    openai_service = openai_service or OpenAIService(stage="distribute_themes")
+    queue = asyncio.Queue()
+    remaining = []
+    finished = []
+
+    for job_idx, (posts, _) in enumerate(jobs):
+        platform = platforms[job_idx] if platforms else "default"
+        count = 0
+        for idx, reply_idx, content, type_ in iter_items(posts):
+            if prefilter and prefilter.check(content, platform):
+                location = idx if type_ == "post" else (idx, reply_idx)
+                write_back(posts, location, type_, [])
+                continue
+            queue.put_nowait((job_idx, idx, reply_idx, content, type_))
+            count += 1
+        remaining.append(count)
+
+    async def finish(job_idx):
+        posts, on_done = jobs[job_idx]
+        if on_done:
+            # 写文件放到线程里，避免阻塞其他正在进行的请求
+            await asyncio.to_thread(on_done, posts)
+
+    async def worker():
+        while True:
+            try:
+                job_idx, idx, reply_idx, content, type_ = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                location, type_, res = await process_item(
+                    idx, content, type_, openai_service, reply_idx=reply_idx
                 )
-            )
-            tasks.append(task)
+            except Exception as e:
+                # 单条失败不影响同一队列里的其他文件
+                print(f"主题分配失败: {e}")
+                location = idx if type_ == "post" else (idx, reply_idx)
+                res = None
+            write_back(jobs[job_idx][0], location, type_, res)
+            remaining[job_idx] -= 1
+            if remaining[job_idx] == 0:
+                finished.append(asyncio.create_task(finish(job_idx)))
+
+    # 没有任何条目的文件直接完成
+    for job_idx, count in enumerate(remaining):
+        if count == 0:
+            finished.append(asyncio.create_task(finish(job_idx)))
+
+    if openai_service.batch:
+        # 批量后端中请求要等批次提交后才返回，所有条目需要同时在途才能放进同一个批次
+        max_concurrent_tasks = queue.qsize()
+    workers = [
+        asyncio.create_task(worker())
+        for _ in range(min(max_concurrent_tasks, queue.qsize()))
+    ]
+    await asyncio.gather(*workers)
+    await asyncio.gather(*finished)
+    if prefilter:
+        prefilter.print_stats()
+    return [posts for posts, _ in jobs]
 
-    # 并发执行所有任务
-    results = await asyncio.gather(*tasks)
 
-    # 将结果写入 posts
-    for location, type_, res in results:
-        if type_ == "post":
-            posts[location]["themes"] = res
-        else:
-            idx, reply_idx = location
-            posts[idx]["replies"][reply_idx]["themes"] = res
+async def analyze_posts_async(posts, max_concurrent_tasks=200, prefilter=None, platform="default"):
+    results = await analyze_files_async(
+        [(posts, None)],
+        max_concurrent_tasks=max_concurrent_tasks,
+        prefilter=prefilter,
+        platforms=[platform],
+    )
+    return results[0]
 
-    return posts
 
 async def main():
     file_names = [
@@ -74,18 +139,25 @@ async def main():
         "bili.json",
         "wb.json",
     ]
+
+    def writer(file_name):
+        def on_done(analyzed_data):
+            write_json(analyzed_data, f"analyze/analyze_results/{file_name}", indent=None)
+            print(f"{file_name} 主题分配完成")
+        return on_done
+
+    jobs = []
     for file_name in file_names:
         file_path = f"analyze/raw_data/formatted/{file_name}"
         data = read_json(file_path)
-        analyzed_data = await analyze_posts_async(data)
-        write_json(analyzed_data, f"analyze/analyze_results/{file_name}")
+        jobs.append((data, writer(file_name)))
+    await analyze_files_async(
+        jobs,
+        prefilter=build_themes_prefilter(),
+        platforms=[file_name.removesuffix(".json") for file_name in file_names],
+    )
+    METRICS.dump("distribute_themes")
 
 if __name__ == "__main__":
-    asyncio.run(main())
-                
-                
-
-                
-            
-            
-            
+    with profile_stage("distribute_themes"):
+        asyncio.run(main())
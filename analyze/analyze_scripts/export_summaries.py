@@ -0,0 +1,144 @@
+"""
+把合并后的总结导出为前端按需加载的分片。
+
+前端原来直接 import 整个 merged_summarized_data.json，首屏要下载所有主题的总结和用户原声。
+导出后 public/data/summaries/ 下有:
+    manifest.json                  总体分析、决策建议和目录（主题、各总结的原声数量、分片文件名）
+    themes/<序号>.<内容摘要>.json   每个主题一个分片，压缩空白；文件名带内容摘要，可以长期缓存
+
+每个文件旁边同时写出预压缩的 .gz 和 .br（需要安装 brotli），由 nginx 的 gzip_static / brotli_static
+或 CDN 直接返回，不需要在请求时压缩。manifest 最后写入，前端不会读到指向尚未写出的分片的目录。
+
+用法（在仓库根目录下运行）:
+    python analyze/analyze_scripts/export_summaries.py
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+
+from json_io import read_json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+INPUT_PATH = "analyze/analyze_results/merged_summarized.json"
+# 人工补充了总体分析和决策建议的版本
+REPORT_PATH = "analyze/analyze_results/merged_summarized_data.json"
+OUTPUT_DIR = "public/data/summaries"
+SHARD_DIR = "themes"
+
+
+def theme_id(theme):
+    """与前端一致的锚点 id"""
+    return theme.replace("*", "").replace(" ", "-")
+
+
+def content_count(summary):
+    return sum(len(point.get("original_content") or []) for point in summary.get("points") or [])
+
+
+def minify(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_compressed(path, payload):
+    """写出文件本身以及 .gz / .br，返回各文件的字节数"""
+    sizes = {}
+    variants = [("", payload), (".gz", gzip.compress(payload, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(payload, quality=11)))
+    for suffix, data in variants:
+        tmp_path = path + suffix + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path + suffix)
+        sizes[suffix or "raw"] = len(data)
+    return sizes
+
+
+def export(data, output_dir=OUTPUT_DIR, total_summary="", suggestion=""):
+    """
+    Args:
+        data: {主题: {"summary_list": [...]}}，即 merge_duplicates 的输出
+    Returns:
+        dict: manifest
+    """
+    shard_dir = os.path.join(output_dir, SHARD_DIR)
+    os.makedirs(shard_dir, exist_ok=True)
+    if brotli is None:
+        print("未安装 brotli，只生成 .gz 预压缩文件")
+
+    themes = []
+    shard_sizes = []
+    for index, (theme, theme_data) in enumerate(data.items()):
+        summary_list = theme_data.get("summary_list") or []
+        payload = minify({"theme": theme, "summary_list": summary_list})
+        digest = hashlib.sha256(payload).hexdigest()[:12]
+        shard = f"{SHARD_DIR}/{index}.{digest}.json"
+        shard_sizes.append(write_compressed(os.path.join(output_dir, shard), payload))
+
+        summaries = [
+            {"summary": summary.get("summary", ""), "count": content_count(summary)}
+            for summary in summary_list
+        ]
+        themes.append(
+            {
+                "theme": theme,
+                "id": theme_id(theme),
+                "shard": shard,
+                "count": sum(s["count"] for s in summaries),
+                "bytes": len(payload),
+                # 目录按讨论度（原声数量）降序，与前端的排序一致
+                "summaries": sorted(summaries, key=lambda s: s["count"], reverse=True),
+            }
+        )
+
+    manifest = {
+        "version": hashlib.sha256("".join(t["shard"] for t in themes).encode("utf-8")).hexdigest()[:12],
+        "total_summary": total_summary,
+        "suggestion": suggestion,
+        "themes": themes,
+    }
+    manifest_sizes = write_compressed(os.path.join(output_dir, "manifest.json"), minify(manifest))
+
+    # 清理不再被引用的旧分片
+    current = {os.path.basename(t["shard"]) for t in themes}
+    for name in os.listdir(shard_dir):
+        if name.split(".json")[0] + ".json" not in current:
+            os.remove(os.path.join(shard_dir, name))
+
+    total = {key: sum(sizes.get(key, 0) for sizes in shard_sizes) for key in manifest_sizes}
+    print(
+        f"已导出 {len(themes)} 个主题到 {output_dir}，首屏 manifest "
+        + ", ".join(f"{key} {size / 1024:.1f}KB" for key, size in manifest_sizes.items())
+        + "；全部分片 "
+        + ", ".join(f"{key} {size / 1024:.1f}KB" for key, size in total.items())
+    )
+    return manifest
+
+
+def main(input_path=INPUT_PATH, report_path=REPORT_PATH, output_dir=OUTPUT_DIR):
+    data = read_json(input_path)
+    report = read_json(report_path) if report_path and os.path.exists(report_path) else {}
+    # 也可以直接导出 {"data": ..., "total_summary": ..., "suggestion": ...} 格式的文件
+    if "data" in data and isinstance(data["data"], dict):
+        report, data = data, data["data"]
+    return export(
+        data,
+        output_dir,
+        total_summary=report.get("total_summary", ""),
+        suggestion=report.get("suggestion", ""),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出前端按需加载的总结分片")
+    parser.add_argument("--input", default=INPUT_PATH)
+    parser.add_argument("--report", default=REPORT_PATH, help="提供总体分析和决策建议的文件")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    args = parser.parse_args()
+    main(args.input, args.report, args.output_dir)
@@ -59,12 +59,12 @@ def format_wb_data(note_data, comment_data):
 def main():
     data = read_json("analyze/raw_data/bili/search_comments_2025-05-20.json") + read_json("analyze/raw_data/bili/search_comments_2025-05-21.json")
     formatted_data = format_bili_data(data)
-    write_json(formatted_data, "analyze/raw_data/formatted/bili.json")
+    write_json(formatted_data, "analyze/raw_data/formatted/bili.json", indent=None)
     
     note_data = read_json("analyze/raw_data/wb/search_contents_2025-05-20.json") + read_json("analyze/raw_data/wb/search_contents_2025-05-21.json")
     comment_data = read_json("analyze/raw_data/wb/search_comments_2025-05-20.json") + read_json("analyze/raw_data/wb/search_comments_2025-05-21.json")
     formatted_data = format_wb_data(note_data, comment_data)
-    write_json(formatted_data, "analyze/raw_data/formatted/wb.json")
+    write_json(formatted_data, "analyze/raw_data/formatted/wb.json", indent=None)
     
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+"""
+对 LLM 请求做对冲（hedged requests），降低长尾延迟。
+
+某个请求的耗时超过该阶段、该模型近期请求延迟的某个分位数（默认 p95）时，再发一个相同的请求，
+取先返回的结果并取消另一个。为了不让对冲请求过多，进程内所有请求共用一个额度：
+对冲请求数不超过总请求数的 budget_ratio（默认 5%）。近期样本不足 min_samples 时不对冲。
+
+summarize_themes、merge_duplicates 默认开启（见 utils.HEDGED_STAGES），其他阶段需要设置 OPENAI_HEDGE=1；
+OPENAI_HEDGE=0 时全部关闭。批量后端中不生效。
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+from llm_metrics import percentile
+
+HEDGE_PERCENTILE = float(os.environ.get("OPENAI_HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET_RATIO = float(os.environ.get("OPENAI_HEDGE_BUDGET", "0.05"))
+
+
+class Hedger:
+    def __init__(
+        self,
+        q=HEDGE_PERCENTILE,
+        budget_ratio=HEDGE_BUDGET_RATIO,
+        min_samples=20,
+        window=500,
+        min_delay=1.0,
+    ):
+        self.q = q
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def threshold(self, key):
+        """key 对应的近期延迟分位数，样本不足时返回 None"""
+        with self._lock:
+            samples = self._latencies.get(key)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            values = sorted(samples)
+        return max(percentile(values, self.q), self.min_delay)
+
+    def observe(self, key, latency):
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self.window)).append(latency)
+
+    def _acquire_hedge(self):
+        with self._lock:
+            if self.hedges + 1 > self.budget_ratio * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    async def run(self, key, make_request, call=None):
+        """
+        执行 make_request()，超过阈值且有额度时发出一个对冲请求，返回先成功的结果。
+
+        Args:
+            key: 延迟统计的分组，通常为 (stage, model)
+            make_request: 返回 awaitable 的无参函数，每次调用发出一个新的请求
+            call: llm_metrics.CallStats，记录对冲次数和落败请求的用量
+        """
+        with self._lock:
+            self.requests += 1
+        delay = self.threshold(key)
+        started_at = time.perf_counter()
+        primary = asyncio.ensure_future(make_request())
+
+        if delay is not None:
+            try:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+            except asyncio.CancelledError:
+                # asyncio.wait 不会取消传入的任务，调用方被取消时主请求需要一起取消
+                primary.cancel()
+                raise
+            if not done and self._acquire_hedge():
+                if call is not None:
+                    call.hedges += 1
+                return await self._race(key, primary, make_request, started_at, call)
+
+        result = await primary
+        self.observe(key, time.perf_counter() - started_at)
+        return result
+
+    async def _race(self, key, primary, make_request, started_at, call=None):
+        hedge = asyncio.ensure_future(make_request())
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                if winner is None:
+                    continue
+                # 统计的始终是主请求的耗时：主请求落败时它还没有返回，到此刻的耗时是它的下限。
+                # 只记录不受长尾影响的请求会让分位数越来越小，对冲越发越早
+                if not (primary.done() and primary.exception() is not None):
+                    self.observe(key, time.perf_counter() - started_at)
+                if winner is hedge:
+                    with self._lock:
+                        self.hedge_wins += 1
+                if call is not None:
+                    self._charge_loser(call, hedge if winner is primary else primary, winner)
+                return winner.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    def _charge_loser(call, loser, winner):
+        """
+        落败的请求同样计费。已经返回的按它自己的用量计算；被取消的请求服务端已经处理了 prompt，
+        这里按相同请求（胜出请求）的用量估算。落败请求本身出错时不计。
+        """
+        if loser.done() and not loser.cancelled():
+            if loser.exception() is not None:
+                return
+            usage = getattr(loser.result(), "usage", None)
+        else:
+            usage = getattr(winner.result(), "usage", None)
+        call.add_usage(usage)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedge_rate": self.hedges / self.requests if self.requests else 0.0,
+            }
+
+
+HEDGER = Hedger()
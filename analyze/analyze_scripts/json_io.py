@@ -0,0 +1,128 @@
+"""
+各阶段共用的 JSON / JSONL 读写。
+
+- 安装了 orjson 时用它编解码，未安装时回退到标准库 json。两者的结果有以下不同:
+    * NaN / Infinity: orjson 写为 null，标准库写为非标准的 NaN / Infinity；
+      读取时 orjson 不接受 NaN / Infinity，此时改用标准库解析，读回 float
+    * 超出 64 位的整数: orjson 写入时报错，此时改用标准库编码；
+      读取时 orjson 把超出范围的整数读为 float（丢失精度），标准库读回 int
+- 按扩展名透明压缩: .gz 为 gzip，.zst 为 zstd（需要安装 zstandard），例如 wb.json.zst；
+- 写入时先写同目录下的临时文件，完成后再 os.replace 为目标文件，进程中途崩溃或被中断时
+  目标文件要么是旧内容、要么是完整的新内容，不会留下写了一半的结果；
+- write_json 默认与原来一样缩进 4 个空格（人会打开查看或手工修改的文件）；
+  只由下一阶段读取的中间结果传 indent=None，输出紧凑格式，编码更快、文件也更小。
+"""
+import gzip
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+
+
+def _codec(path):
+    for suffix in COMPRESSED_SUFFIXES:
+        if path.endswith(suffix):
+            return suffix
+    return None
+
+
+def _open(path, mode, codec):
+    """按 codec 打开文件，文本模式统一使用 utf-8"""
+    encoding = "utf-8" if "t" in mode else None
+    if codec == ".gz":
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL, encoding=encoding)
+    if codec == ".zst":
+        if zstandard is None:
+            raise RuntimeError(f"读写 {path} 需要安装 zstandard")
+        cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL) if "w" in mode else None
+        return zstandard.open(path, mode, cctx=cctx, encoding=encoding)
+    return open(path, mode.replace("t", ""), encoding=encoding)
+
+
+def open_file(path, mode="rt"):
+    """打开文件，按扩展名透明解压或压缩"""
+    return _open(path, mode, _codec(path))
+
+
+@contextmanager
+def atomic_open(path, mode="wb"):
+    """
+    写入同目录下的临时文件，with 块正常结束后替换为 path；出错时删除临时文件，path 保持原样。
+    压缩方式由 path 的扩展名决定。
+    """
+    directory, name = os.path.split(path)
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with _open(temp_path, mode, _codec(path)) as f:
+            yield f
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def dumps(data, indent=None, default=None):
+    """编码为 utf-8 字节串；indent 为 None 时输出紧凑格式"""
+    if orjson is not None and indent in (None, 2):
+        # 记录类型（records.Record）和其他自定义类型交给 default，与标准库 json 的行为保持一致
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent == 2:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(data, default=default, option=option)
+        except orjson.JSONEncodeError:
+            # 超出 64 位的整数等 orjson 不支持的值交给标准库；default 本身出错时标准库会再次报错
+            pass
+    separators = (",", ":") if indent is None else None
+    return json.dumps(data, ensure_ascii=False, indent=indent, separators=separators, default=default).encode("utf-8")
+
+
+def loads(text):
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            # 标准库写出的 NaN / Infinity；内容确实无效时标准库同样抛出 json.JSONDecodeError
+            pass
+    return json.loads(text)
+
+
+def read_json(path):
+    with open_file(path, "rb") as f:
+        return loads(f.read())
+
+
+def write_json(data, path, indent=4, default=None):
+    payload = dumps(data, indent=indent, default=default)
+    with atomic_open(path, "wb") as f:
+        f.write(payload)
+
+
+def read_jsonl(path):
+    """逐行读取 JSONL，跳过空行"""
+    with open_file(path, "rt") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def write_jsonl(items, path, default=None):
+    """每个元素写一行，items 可以是生成器，不需要先全部放进内存"""
+    with atomic_open(path, "wb") as f:
+        for item in items:
+            f.write(dumps(item, default=default) + b"\n")
@@ -0,0 +1,166 @@
+"""
+基于 Aho–Corasick 自动机的多模式关键词匹配。
+
+关键词（一级、二级关键词及其同义词）在归一化（转小写、去掉空白）后编译进同一个自动机，
+每条内容只需扫描一遍就能找出所有命中的关键词及其在原文中的位置，耗时只与内容长度有关，
+与关键词表的大小无关。可以用来在 LLM 标注之前做确定性的初筛，或者核对 LLM 标注的关键词。
+"""
+from collections import deque
+
+
+def normalize(text):
+    """
+    转小写并去掉空白，返回归一化后的文本以及每个字符在原文中的下标。
+    """
+    chars = []
+    positions = []
+    for i, char in enumerate(text or ""):
+        if char.isspace():
+            continue
+        chars.append(char.lower())
+        positions.append(i)
+    return "".join(chars), positions
+
+
+class AhoCorasick:
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        # 每个状态结束的模式: [(模式长度, value), ...]
+        self.output = [[]]
+        self.built = False
+
+    def add(self, pattern, value):
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append((len(pattern), value))
+        self.built = False
+
+    def build(self):
+        """按 BFS 顺序计算失配指针，并把失配链上的输出合并到每个状态"""
+        queue = deque(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+        self.built = True
+        return self
+
+    def iter_matches(self, text):
+        """产出 (start, end, value)，位置是 text 中的下标，重叠的匹配也会全部产出"""
+        if not self.built:
+            self.build()
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in output[state]:
+                yield i - length + 1, i + 1, value
+
+
+class KeywordMatcher:
+    """
+    关键词表的匹配器。
+
+    entries 中每一项为 (匹配用的词, 标准关键词, 级别, 所属一级关键词)，
+    级别为 "primary_keyword"、"secondary_keyword"，没有层级的词表为 "term"。
+    """
+
+    def __init__(self, entries):
+        self.automaton = AhoCorasick()
+        self.index = {}
+        # lookup 用的索引：与原来的 format_keyword 一样只去掉空格，区分大小写
+        self.standard = {}
+        for term, keyword, level, primary_keyword in entries:
+            normalized, _ = normalize(term)
+            if not normalized:
+                continue
+            self.standard.setdefault(term.replace(" ", ""), keyword)
+            info = {"keyword": keyword, "level": level, "primary_keyword": primary_keyword}
+            # 同一个词只保留第一次出现的标准关键词，与原来线性查找的结果一致
+            if normalized in self.index:
+                continue
+            self.index[normalized] = info
+            self.automaton.add(normalized, info)
+        self.automaton.build()
+
+    @classmethod
+    def from_keywords(cls, keywords, synonyms=None):
+        """
+        根据 keywords.json 格式的数据构建匹配器。
+
+        Args:
+            keywords: [{"primary_keyword": ..., "secondary_keywords": [{"keyword": ...}, ...]}, ...]，
+                一级关键词和二级关键词条目中可以带 "synonyms" 列表
+            synonyms: {标准关键词: [同义词, ...]}，额外的同义词表
+        """
+        synonyms = synonyms or {}
+        entries = []
+        aliases = []
+        for item in keywords:
+            pk = item["primary_keyword"]
+            entries.append((pk, pk, "primary_keyword", pk))
+            for alias in item.get("synonyms", []) + synonyms.get(pk, []):
+                aliases.append((alias, pk, "primary_keyword", pk))
+            for sk_dict in item.get("secondary_keywords", []):
+                sk = sk_dict["keyword"]
+                entries.append((sk, sk, "secondary_keyword", pk))
+                for alias in sk_dict.get("synonyms", []) + synonyms.get(sk, []):
+                    aliases.append((alias, sk, "secondary_keyword", pk))
+        # 标准关键词优先于同义词
+        return cls(entries + aliases)
+
+    @classmethod
+    def from_terms(cls, terms):
+        """没有层级的词表，例如预过滤使用的实体名"""
+        return cls((term, term, "term", None) for term in terms)
+
+    def lookup(self, keyword):
+        """把可能带有多余空格的关键词（或同义词）还原成标准关键词，找不到时返回 None"""
+        return self.standard.get(keyword.replace(" ", ""))
+
+    def find(self, text):
+        """
+        扫描一遍 text，返回所有命中的关键词。
+
+        Returns:
+            [{"keyword", "level", "primary_keyword", "start", "end", "text"}, ...]，
+            start / end 为命中内容在原文中的位置（左闭右开）
+        """
+        normalized, positions = normalize(text)
+        hits = []
+        for start, end, info in self.automaton.iter_matches(normalized):
+            original_start = positions[start]
+            original_end = positions[end - 1] + 1
+            hits.append(
+                {
+                    **info,
+                    "start": original_start,
+                    "end": original_end,
+                    "text": text[original_start:original_end],
+                }
+            )
+        return hits
+
+    def contains_any(self, text):
+        normalized, _ = normalize(text)
+        return next(self.automaton.iter_matches(normalized), None) is not None
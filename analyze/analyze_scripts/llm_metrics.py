@@ -0,0 +1,280 @@
+"""
+LLM 调用的进程内指标统计。
+
+OpenAIService 每完成一次 infer 调用就向 METRICS 记录一条：阶段名、模型、token 用量、耗时、
+重试次数、JSON 解析失败次数、缓存命中的 token 数和估算费用，启用模型路由（model_router.py）时
+还有每一档模型的尝试耗时和是否采用。
+记录可以导出为 JSONL（逐条明细）和 Prometheus 文本格式（按阶段汇总），
+也可以打印每个阶段的 p50/p95/p99 延迟和吞吐，用来确定并发数和批大小。
+"""
+import math
+import os
+import threading
+import time
+
+from json_io import write_jsonl
+
+# LLM_METRICS_DIR 在写出时读取，OpenAIService 初始化时才加载 .env
+DEFAULT_METRICS_DIR = "analyze/analyze_results/metrics"
+
+# 每百万 token 的价格（美元）：输入、缓存命中的输入、输出
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    prices = MODEL_PRICES.get(model)
+    if not prices:
+        return 0.0
+    input_price, cached_price, output_price = prices
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (
+        uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price
+    ) / 1_000_000
+
+
+def percentile(sorted_values, q):
+    """最近秩法计算分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class CallStats:
+    """单次 infer 调用过程中累积的统计，传给各次请求共同填写"""
+
+    def __init__(self, stage, model):
+        self.stage = stage
+        self.model = model
+        self.started_at = time.time()
+        self.requests = 0
+        self.retries = 0
+        self.parse_failures = 0
+        self.hedges = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cost = 0.0
+        # 模型路由: 是否请求 logprobs、最近一次请求的置信度、每一档模型的尝试记录
+        self.logprobs = False
+        self.confidence = None
+        self.tiers = []
+
+    def add_usage(self, usage):
+        self.requests += 1
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cached_tokens += cached_tokens
+        # 升级模型时各档价格不同，按发出请求时的模型累计费用
+        self.cost += estimate_cost(self.model, prompt_tokens, completion_tokens, cached_tokens)
+
+    def add_tier(self, model, latency, accepted):
+        self.tiers.append(
+            {
+                "model": model,
+                "latency": round(latency, 6),
+                "accepted": accepted,
+                "confidence": self.confidence,
+            }
+        )
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = []
+
+    def record(self, call, status):
+        finished_at = time.time()
+        record = {
+            "stage": call.stage,
+            "model": call.model,
+            "status": status,
+            "started_at": round(call.started_at, 6),
+            "latency": round(finished_at - call.started_at, 6),
+            "requests": call.requests,
+            "retries": call.retries,
+            "parse_failures": call.parse_failures,
+            "hedges": call.hedges,
+            "prompt_tokens": call.prompt_tokens,
+            "completion_tokens": call.completion_tokens,
+            "cached_tokens": call.cached_tokens,
+            "cache_hit": call.cached_tokens > 0,
+            "cost": round(call.cost, 8),
+            "escalations": max(len(call.tiers) - 1, 0),
+            "tiers": call.tiers,
+        }
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def reset(self):
+        with self._lock:
+            self.records = []
+
+    def _by_stage(self):
+        with self._lock:
+            records = list(self.records)
+        stages = {}
+        for record in records:
+            stages.setdefault(record["stage"], []).append(record)
+        return stages
+
+    def summary(self):
+        """按阶段汇总: 调用数、失败数、延迟分位数、吞吐、token、重试、费用"""
+        result = {}
+        for stage, records in self._by_stage().items():
+            latencies = sorted(r["latency"] for r in records)
+            window = max(r["started_at"] + r["latency"] for r in records) - min(
+                r["started_at"] for r in records
+            )
+            result[stage] = {
+                "calls": len(records),
+                "failed": sum(1 for r in records if r["status"] != "ok"),
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": latencies[-1],
+                "throughput": len(records) / window if window > 0 else 0.0,
+                "requests": sum(r["requests"] for r in records),
+                "retries": sum(r["retries"] for r in records),
+                "parse_failures": sum(r["parse_failures"] for r in records),
+                "hedges": sum(r.get("hedges", 0) for r in records),
+                "cache_hits": sum(1 for r in records if r["cache_hit"]),
+                "prompt_tokens": sum(r["prompt_tokens"] for r in records),
+                "completion_tokens": sum(r["completion_tokens"] for r in records),
+                "cached_tokens": sum(r["cached_tokens"] for r in records),
+                "cost": sum(r["cost"] for r in records),
+            }
+            prompt_tokens = result[stage]["prompt_tokens"]
+            result[stage]["cache_hit_rate"] = (
+                result[stage]["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0
+            )
+            result[stage]["escalations"] = sum(r.get("escalations", 0) for r in records)
+            result[stage]["tiers"] = self._tier_summary(records)
+        return result
+
+    @staticmethod
+    def _tier_summary(records):
+        """按模型汇总路由的每一档: 尝试次数、被采用次数（命中率）和该档的延迟分位数"""
+        attempts = {}
+        for record in records:
+            for tier in record.get("tiers", []):
+                attempts.setdefault(tier["model"], []).append(tier)
+        result = {}
+        for model, tiers in attempts.items():
+            latencies = sorted(t["latency"] for t in tiers)
+            accepted = sum(1 for t in tiers if t["accepted"])
+            result[model] = {
+                "attempts": len(tiers),
+                "accepted": accepted,
+                "hit_rate": accepted / len(tiers),
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+            }
+        return result
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary:
+            return
+        print("\nLLM 调用统计:")
+        for stage, s in summary.items():
+            print(
+                f"  [{stage}] 调用 {s['calls']} 次(失败 {s['failed']}), "
+                f"延迟 p50/p95/p99 = {s['p50']:.2f}/{s['p95']:.2f}/{s['p99']:.2f}s, "
+                f"吞吐 {s['throughput']:.2f} 次/s, 重试 {s['retries']} 次, 对冲 {s['hedges']} 次, "
+                f"解析失败 {s['parse_failures']} 次, 缓存命中 {s['cache_hits']} 次"
+                f"(输入 token 命中率 {s['cache_hit_rate']:.1%}), "
+                f"token {s['prompt_tokens']}+{s['completion_tokens']}, 费用 ${s['cost']:.4f}"
+            )
+            if len(s["tiers"]) > 1 or s["escalations"]:
+                for model, t in s["tiers"].items():
+                    print(
+                        f"    {model}: 尝试 {t['attempts']} 次, 采用 {t['accepted']} 次"
+                        f"(命中率 {t['hit_rate']:.1%}), 延迟 p50/p95 = {t['p50']:.2f}/{t['p95']:.2f}s"
+                    )
+
+    def export_jsonl(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            records = list(self.records)
+        write_jsonl(records, path)
+
+    def export_prometheus(self, path):
+        counters = [
+            ("llm_calls_total", "calls", "Number of infer calls"),
+            ("llm_failed_calls_total", "failed", "Infer calls without a valid result"),
+            ("llm_requests_total", "requests", "Chat completion requests sent, including retries and hedges"),
+            ("llm_retries_total", "retries", "Retried attempts"),
+            ("llm_parse_failures_total", "parse_failures", "Responses that failed JSON parsing or validation"),
+            ("llm_hedged_requests_total", "hedges", "Duplicate requests sent to cut tail latency"),
+            ("llm_escalations_total", "escalations", "Calls escalated to a stronger model tier"),
+            ("llm_cache_hits_total", "cache_hits", "Calls with prompt cache hits"),
+            ("llm_prompt_tokens_total", "prompt_tokens", "Prompt tokens"),
+            ("llm_completion_tokens_total", "completion_tokens", "Completion tokens"),
+            ("llm_cached_tokens_total", "cached_tokens", "Prompt tokens served from cache"),
+            ("llm_cost_usd_total", "cost", "Estimated cost in USD"),
+        ]
+        summary = self.summary()
+        lines = []
+        for name, key, help_text in counters:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for stage, s in summary.items():
+                lines.append(f'{name}{{stage="{stage}"}} {s[key]}')
+
+        lines.append("# HELP llm_prompt_cache_hit_ratio Share of prompt tokens served from cache")
+        lines.append("# TYPE llm_prompt_cache_hit_ratio gauge")
+        for stage, s in summary.items():
+            lines.append(f'llm_prompt_cache_hit_ratio{{stage="{stage}"}} {s["cache_hit_rate"]}')
+
+        for name, key, help_text in (
+            ("llm_tier_attempts_total", "attempts", "Infer attempts per model routing tier"),
+            ("llm_tier_accepted_total", "accepted", "Results accepted per model routing tier"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for stage, s in summary.items():
+                for model, t in s["tiers"].items():
+                    lines.append(f'{name}{{stage="{stage}",model="{model}"}} {t[key]}')
+
+        lines.append("# HELP llm_latency_seconds Infer call latency")
+        lines.append("# TYPE llm_latency_seconds summary")
+        for stage, records in self._by_stage().items():
+            s = summary[stage]
+            for q, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(f'llm_latency_seconds{{stage="{stage}",quantile="{q}"}} {s[key]}')
+            lines.append(
+                f'llm_latency_seconds_sum{{stage="{stage}"}} {sum(r["latency"] for r in records)}'
+            )
+            lines.append(f'llm_latency_seconds_count{{stage="{stage}"}} {len(records)}')
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def dump(self, name, metrics_dir=None):
+        """打印汇总并把明细和汇总写到 metrics_dir/{name}.jsonl 与 {name}.prom"""
+        if not self.records:
+            return
+        metrics_dir = metrics_dir or os.environ.get("LLM_METRICS_DIR", DEFAULT_METRICS_DIR)
+        self.print_summary()
+        self.export_jsonl(os.path.join(metrics_dir, f"{name}.jsonl"))
+        self.export_prometheus(os.path.join(metrics_dir, f"{name}.prom"))
+        print(f"LLM 调用指标已写入 {metrics_dir}/{name}.jsonl 和 {name}.prom")
+
+
+METRICS = MetricsRegistry()
@@ -1,97 +1,221 @@
 import asyncio
-import json
 from utils import OpenAIService, read_json, write_json # Assuming these are in utils.py
-from prompt import MERGE_ITEMS_SYSTEM_PROMPT, MERGE_ITEMS_USER_PROMPT
-
-async def call_llm_for_merging(openai_service, items_to_merge, item_type_description):
-    """Helper function to call LLM for merging items."""
-    if not items_to_merge:
-        return []
-
-    items_json_string = json.dumps(items_to_merge, ensure_ascii=False, indent=4)
-    
-    user_prompt = MERGE_ITEMS_USER_PROMPT.format(items_json_string=items_json_string)
-    system_prompt = MERGE_ITEMS_SYSTEM_PROMPT
-
-    # print(f"Calling LLM to merge {item_type_description}...")
-
-    try:
-        merged_items = await openai_service.infer(
-            user_prompt=user_prompt,
-            system_prompt=system_prompt
+from prompt import MERGE_GROUPS_SYSTEM_PROMPT, MERGE_GROUPS_USER_PROMPT
+from schemas import MERGE_GROUPS_SCHEMA
+from llm_metrics import METRICS
+from profiling import profile_stage
+from task_graph import TaskGraph
+
+CHECKPOINT_DIR = "analyze/analyze_results/.merge_checkpoints"
+# Global cap on in-flight merge calls across all themes
+MERGE_CONCURRENCY = 50
+# 合并节点失败后由任务图按指数退避重试，节点内的 infer 只调用一次（解析失败时仍会修复一次），
+# 429 或服务中断时不会立即连续重试，每个节点最多执行 MERGE_NODE_RETRIES 次
+MERGE_NODE_RETRIES = 3
+MERGE_INFER_RETRIES = 1
+# Bump when the shape of a node result changes; prompt and schema edits are picked up by checkpoint_version
+CHECKPOINT_FORMAT = 2
+
+
+class MergeError(RuntimeError):
+    """The LLM did not return a valid merge result."""
+
+
+def format_merge_items(texts):
+    """One "[id] text" line per item; the model only sees the summary / point text, never the quotes."""
+    return "\n".join(f"[{i}] {' '.join(text.split())}" for i, text in enumerate(texts))
+
+
+def resolve_groups(groups, count):
+    """
+    Turns the model's groups into a partition of range(count). Unknown or repeated IDs are ignored
+    and items the model left out become groups of their own, so no item can be lost or duplicated.
+
+    Returns:
+        [(merged text, [ids]), ...] ordered by each group's first item
+    """
+    assigned = set()
+    resolved = []
+    for group in groups:
+        ids = [
+            i
+            for i in dict.fromkeys(group.get("ids", []))
+            if isinstance(i, int) and 0 <= i < count and i not in assigned
+        ]
+        if ids:
+            assigned.update(ids)
+            resolved.append((group.get("text", "").strip(), sorted(ids)))
+    resolved += [("", [i]) for i in range(count) if i not in assigned]
+    return sorted(resolved, key=lambda group: group[1][0])
+
+
+async def call_llm_for_grouping(openai_service, texts, item_type_description, stage):
+    """
+    Asks the LLM which items are duplicates. Raises MergeError so the task graph can retry the node.
+
+    Returns:
+        [(merged text, [ids]), ...], see resolve_groups
+    """
+    if len(texts) < 2:
+        return [("", [i]) for i in range(len(texts))]
+
+    groups = await openai_service.infer(
+        user_prompt=MERGE_GROUPS_USER_PROMPT,
+        system_prompt=MERGE_GROUPS_SYSTEM_PROMPT,
+        prompt_vars={"items": format_merge_items(texts)},
+        response_schema=MERGE_GROUPS_SCHEMA,
+        stage=stage,
+        retries=MERGE_INFER_RETRIES,
+    )
+    if groups is None:
+        raise MergeError(f"No valid merge result for {item_type_description}")
+    return resolve_groups(groups, len(texts))
+
+
+def checkpoint_version():
+    """Part of every checkpoint key: results saved with another prompt, schema or result format are not reused."""
+    return [
+        CHECKPOINT_FORMAT,
+        MERGE_GROUPS_SYSTEM_PROMPT,
+        MERGE_GROUPS_USER_PROMPT,
+        MERGE_GROUPS_SCHEMA.response_format(),
+    ]
+
+
+def union_quotes(points):
+    """All original_content quotes of the given points, in order and without duplicates."""
+    return list(dict.fromkeys(quote for point in points for quote in point.get("original_content", [])))
+
+
+def add_theme_nodes(graph, theme_key, summary_list, openai_service):
+    """
+    Adds the summary-merge node for a theme. Once it succeeds, one point-merge node per
+    (merged) summary is added, depending on it.
+
+    Only the summary / point texts are sent to the LLM; the points of merged summaries are
+    concatenated and the quotes of merged points are unioned locally.
+    """
+    summaries_node_id = f"summaries:{theme_key}"
+
+    async def merge_summaries(summary_list):
+        if len(summary_list) < 2:
+            return summary_list
+        groups = await call_llm_for_grouping(
+            openai_service,
+            [summary.get("summary", "") for summary in summary_list],
+            f"summaries for theme '{theme_key}'",
+            "merge_duplicates:merged_summaries",
         )
-        # print(f"Successfully merged {item_type_description}.")
-        return merged_items
-    except Exception as e:
-        print(f"An error occurred during LLM call for {item_type_description}: {e}")
-        return items_to_merge
-
-async def merge_points_for_summary_task(summary_object, openai_service):
-    """Merges semantically similar points within a single summary object. Designed to be a task for asyncio.gather."""
-    points = summary_object.get("points", [])
-    if not points or len(points) < 2:
-        return summary_object
-
-    merged_points = await call_llm_for_merging(openai_service, points, f"points for summary '{summary_object.get('summary', 'Untitled')[:30]}...'" )
-    summary_object["points"] = merged_points
-    return summary_object
-
-async def merge_summaries_and_their_points_for_theme_task(theme_key, summary_list, openai_service):
-    """Merges summaries for a theme, then merges points within each of those (potentially merged) summaries. Designed for asyncio.gather."""
-    if not summary_list or len(summary_list) < 2:
-        # If no summaries or only one, still process its points if any
-        processed_summaries = []
-        if summary_list: # Potentially a list with one summary
-            point_merge_tasks = [merge_points_for_summary_task(s_obj, openai_service) for s_obj in summary_list]
-            processed_summaries = await asyncio.gather(*point_merge_tasks)
-        return theme_key, processed_summaries
-
-    # Step 1: Merge summaries for the theme
-    # print(f"Calling LLM to merge summaries for theme '{theme_key}'...")
-    merged_summaries_from_llm = await call_llm_for_merging(openai_service, summary_list, f"summaries for theme '{theme_key}'")
-    # print(f"Summaries merged for theme '{theme_key}'. Now merging points within them.")
-
-    # Step 2: Concurrently merge points for each (newly merged or original) summary
-    point_merge_tasks = []
-    for summary_obj in merged_summaries_from_llm:
-        point_merge_tasks.append(merge_points_for_summary_task(summary_obj, openai_service))
-    
-    final_processed_summaries = await asyncio.gather(*point_merge_tasks)
-    # print(f"Points merged for summaries in theme '{theme_key}'.")
-    return theme_key, final_processed_summaries
-
-async def main():
-    input_file = "analyze/analyze_results/summarized.json"
-    output_file = "analyze/analyze_results/merged_summarized.json"
+        merged = []
+        for text, ids in groups:
+            if len(ids) == 1:
+                merged.append(summary_list[ids[0]])
+                continue
+            merged.append(
+                {
+                    "summary": text or summary_list[ids[0]].get("summary", ""),
+                    "points": [point for i in ids for point in summary_list[i].get("points", [])],
+                }
+            )
+        return merged
+
+    async def merge_points(summary_object):
+        points = summary_object.get("points", [])
+        if len(points) < 2:
+            return points
+        groups = await call_llm_for_grouping(
+            openai_service,
+            [point.get("point", "") for point in points],
+            f"points for summary '{summary_object.get('summary', 'Untitled')[:30]}...'",
+            "merge_duplicates:merged_points",
+        )
+        merged = []
+        for text, ids in groups:
+            if len(ids) == 1:
+                merged.append(points[ids[0]])
+                continue
+            group_points = [points[i] for i in ids]
+            merged.append(
+                {
+                    "point": text or group_points[0].get("point", ""),
+                    "original_content": union_quotes(group_points),
+                }
+            )
+        return merged
+
+    def add_point_nodes(merged_summaries):
+        for i, summary_object in enumerate(merged_summaries):
+            graph.add(
+                f"points:{theme_key}:{i}",
+                merge_points,
+                inputs=summary_object,
+                deps=[summaries_node_id],
+            )
+
+    graph.add(summaries_node_id, merge_summaries, inputs=summary_list, then=add_point_nodes)
+
+
+def collect_results(graph, summarized_data):
+    """Builds the merged output; nodes that failed keep their unmerged input and are reported."""
+    final_merged_data = {}
+    failed = []
+    for theme_key, theme_value in summarized_data.items():
+        summaries_node = graph.nodes[f"summaries:{theme_key}"]
+        if summaries_node.status in ("ok", "cached"):
+            summaries = summaries_node.result
+        else:
+            failed.append(summaries_node.node_id)
+            summaries = summaries_node.inputs
 
+        processed_summaries = []
+        for i, summary_object in enumerate(summaries):
+            summary_object = dict(summary_object)
+            points_node = graph.nodes.get(f"points:{theme_key}:{i}")
+            if points_node and points_node.status in ("ok", "cached"):
+                summary_object["points"] = points_node.result
+            elif points_node:
+                failed.append(points_node.node_id)
+            processed_summaries.append(summary_object)
+        final_merged_data[theme_key] = {"summary_list": processed_summaries}
+    return final_merged_data, failed
+
+
+async def main(
+    input_file="analyze/analyze_results/summarized.json",
+    output_file="analyze/analyze_results/merged_summarized.json",
+    checkpoint_dir=CHECKPOINT_DIR,
+    max_concurrent_tasks=MERGE_CONCURRENCY,
+):
     summarized_data = read_json(input_file)
     if not summarized_data:
         print(f"Could not read or parse {input_file}. Exiting.")
         return
 
-    openai_service = OpenAIService()
-    merged_data_intermediate = {}
-
-    # Create tasks for processing each theme concurrently
-    theme_processing_tasks = []
+    openai_service = OpenAIService(stage="merge_duplicates")
+    graph = TaskGraph(
+        max_concurrency=max_concurrent_tasks,
+        retries=MERGE_NODE_RETRIES,
+        checkpoint_dir=checkpoint_dir,
+        version=checkpoint_version(),
+    )
     for theme_key, theme_value in summarized_data.items():
-        print(f"Queueing theme for processing: {theme_key}")
-        summary_list = theme_value.get("summary_list", [])
-        task = merge_summaries_and_their_points_for_theme_task(theme_key, summary_list, openai_service)
-        theme_processing_tasks.append(task)
-    
-    # Gather results from all theme processing tasks
-    print(f"\nStarting concurrent processing of {len(theme_processing_tasks)} themes...")
-    theme_results = await asyncio.gather(*theme_processing_tasks)
-    print("\nAll themes processed.")
-
-    # Populate the final merged_data dictionary
-    final_merged_data = {}
-    for theme_key, processed_summary_list in theme_results:
-        final_merged_data[theme_key] = {"summary_list": processed_summary_list}
+        add_theme_nodes(graph, theme_key, theme_value.get("summary_list", []), openai_service)
+
+    print(f"\nStarting merge task graph for {len(summarized_data)} themes...")
+    await graph.run()
+    graph.print_report()
+
+    final_merged_data, failed = collect_results(graph, summarized_data)
+    if failed:
+        print(
+            f"\n{len(failed)} merge nodes failed and were left unmerged; rerun to retry only these: "
+            + ", ".join(failed)
+        )
 
     write_json(final_merged_data, output_file)
-    print(f"\nSuccessfully merged summaries and points concurrently. Output saved to {output_file}")
+    print(f"\nSuccessfully merged summaries and points. Output saved to {output_file}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    with profile_stage("merge_duplicates"):
+        asyncio.run(main())
+    METRICS.dump("merge_duplicates")
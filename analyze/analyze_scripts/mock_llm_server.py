@@ -0,0 +1,418 @@
+"""
+本地模拟的 OpenAI 兼容服务，用于在没有真实接口的情况下压测、调试分析流水线。
+
+服务根据 system prompt 识别 prompt.py 与 demo/prompt.py 中的各类任务，返回格式正确的假结果；
+可以配置延迟分布、429 比例和返回非法 JSON 的比例，也可以回放之前录制的真实请求。
+只依赖标准库，使用 asyncio 实现 HTTP/1.1 keep-alive，可通过 --processes 在多个进程上共享端口。
+
+用法:
+    python analyze/analyze_scripts/mock_llm_server.py --port 8000 --latency lognormal:-1.5,0.6 --rate-429 0.02 --malformed 0.01
+    export OPENAI_API_BASE=http://127.0.0.1:8000/v1 OPENAI_API_KEY=mock
+
+    # 通过代理真实接口录制，之后离线回放
+    python analyze/analyze_scripts/mock_llm_server.py --upstream https://api.openai.com/v1 --record llm_log.jsonl
+    python analyze/analyze_scripts/mock_llm_server.py --replay llm_log.jsonl
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import urllib.error
+import urllib.request
+
+THEME_LETTERS = [chr(c) for c in range(ord("A"), ord("O") + 1)]
+SENTIMENTS = ["positive", "negative", "neutral"]
+
+
+def request_key(body):
+    """录制/回放时用来匹配请求的键：模型 + 全部消息"""
+    payload = json.dumps(
+        {"model": body.get("model"), "messages": body.get("messages")},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _between(text, start, end):
+    match = re.search(re.escape(start) + r"([\s\S]*?)" + re.escape(end), text)
+    return match.group(1).strip() if match else ""
+
+
+def _lines(text):
+    return [line.strip() for line in text.strip("`\n ").splitlines() if line.strip()]
+
+
+def _quoted_keywords(text):
+    return re.findall(r"""['"]keyword['"]\s*:\s*['"]([^'"]+)['"]""", text)
+
+
+# ---------------------------------------------------------------------------
+# 各类任务的假结果生成
+# ---------------------------------------------------------------------------
+
+
+def fake_distribute_themes(rng, system, user):
+    return sorted(rng.sample(THEME_LETTERS, rng.choice([0, 0, 1, 1, 2, 3])))
+
+
+def fake_summarize_theme(rng, system, user):
+    lines = _lines(_between(user, "<帖子内容>", "</帖子内容>")) or ["（无内容）"]
+    summaries = []
+    for i in range(rng.randint(1, 3)):
+        points = []
+        for j in range(rng.randint(1, 5)):
+            quotes = rng.sample(lines, min(len(lines), rng.randint(1, 3)))
+            points.append({"point": f"要点{i + 1}-{j + 1}", "original_content": quotes})
+        summaries.append({"summary": f"结论{i + 1}", "points": points})
+    return summaries
+
+
+def fake_summarize_theme_ids(rng, system, user):
+    ids = re.findall(r"^\[(\d+)\]", _between(user, "<帖子内容>", "</帖子内容>"), re.M) or ["0"]
+    summaries = []
+    for i in range(rng.randint(1, 3)):
+        points = []
+        for j in range(rng.randint(1, 5)):
+            sources = rng.sample(ids, min(len(ids), rng.randint(1, 3)))
+            points.append({"point": f"要点{i + 1}-{j + 1}", "sources": sources})
+        summaries.append({"summary": f"结论{i + 1}", "points": points})
+    return summaries
+
+
+def fake_merge_groups(rng, system, user):
+    ids = [int(i) for i in re.findall(r"^\[(\d+)\]", _between(user, "<项目列表>", "</项目列表>"), re.M)]
+    rng.shuffle(ids)
+    groups = []
+    while ids:
+        size = rng.randint(1, 3)
+        groups.append({"ids": sorted(ids[:size]), "text": f"合并项{len(groups) + 1}"})
+        ids = ids[size:]
+    return groups
+
+
+def fake_is_hotel_related(rng, system, user):
+    related = rng.random() < 0.6
+    return {
+        "is_hotel_related": related,
+        "is_hotel_related_reason": "模拟结果",
+        "is_ad": rng.random() < 0.1,
+        "is_ad_reason": "模拟结果",
+    }
+
+
+def fake_analyze_keywords(rng, system, user):
+    keywords = _quoted_keywords(system)
+    picked = rng.sample(keywords, min(len(keywords), rng.randint(0, 3)))
+    return {
+        "keywords_mentioned": {
+            "primary_keyword": [],
+            "secondary_keyword": [
+                {"keyword": kw, "sentiment": rng.choice(SENTIMENTS), "reason": "模拟结果"}
+                for kw in picked
+            ],
+        }
+    }
+
+
+def fake_frequent_words(rng, system, user):
+    return [
+        {"keyword": f"模拟关键词{i} mock word {i}", "sentiment": rng.choice(SENTIMENTS[:2])}
+        for i in range(3)
+    ]
+
+
+def fake_typical_reviews(rng, system, user):
+    review = {"title": "模拟案例：", "points": ["模拟评价点"]}
+    return {"typical_positive_reviews": [review], "typical_negative_reviews": [review]}
+
+
+def fake_topic_list(rng, system, user):
+    return [f"主题{i}" for i in range(1, rng.randint(3, 10))]
+
+
+def fake_distribute_user_focus(rng, system, user):
+    candidates = re.findall(r"""['"]([^'"\n]{1,20})['"]""", _between(system, "<给定关键词列表>", "</给定关键词列表>"))
+    return rng.sample(candidates, min(len(candidates), rng.randint(0, 2)))
+
+
+def fake_summarize_user_focus(rng, system, user):
+    return {"advantage": ["模拟正面总结"], "disadvantage": ["模拟负面总结"]}
+
+
+def fake_json_repair(rng, system, user):
+    raw = _between(user, "<待修复的输出>", "</待修复的输出>")
+    match = re.search(r"[\[{][\s\S]*[\]}]", raw)
+    try:
+        return json.loads(match.group(0)) if match else []
+    except json.JSONDecodeError:
+        return []
+
+
+# (任务名, system prompt 中的特征文本, 生成函数)，按顺序匹配
+PROMPT_FAMILIES = [
+    ("json_repair", "JSON修复器", fake_json_repair),
+    ("distribute_themes", "厂商关注点的列表", fake_distribute_themes),
+    ("summarize_themes_ids", "来源编号", fake_summarize_theme_ids),
+    ("summarize_themes", "结构性结论", fake_summarize_theme),
+    ("merge_groups", "智能文本处理器", fake_merge_groups),
+    ("is_hotel_related", "是否在谈论酒店相关内容", fake_is_hotel_related),
+    ("analyze_keywords", "找出在给定的关键词列表中", fake_analyze_keywords),
+    ("extract_frequent_words", "请勿将一级或二级主题作为关键词", fake_frequent_words),
+    ("extract_typical_reviews", "典型的正面及负面反馈", fake_typical_reviews),
+    ("extract_user_focus", "用户最关注的酒店行业的相关主题", fake_topic_list),
+    ("merge_user_focus", "将这些主题词进行聚类", fake_topic_list),
+    ("distribute_user_focus", "从给定的关键词列表中选出", fake_distribute_user_focus),
+    ("summarize_user_focus", "社媒监听专家", fake_summarize_user_focus),
+]
+
+
+def detect_family(system):
+    for name, marker, generator in PROMPT_FAMILIES:
+        if marker in system:
+            return name, generator
+    return "unknown", lambda rng, system, user: {}
+
+
+def wrap_for_schema(value, response_format):
+    """请求使用 json_schema 结构化输出且顶层要求对象时，把列表结果包到唯一的字段下"""
+    schema = (response_format or {}).get("json_schema", {}).get("schema", {})
+    if schema.get("type") == "object" and not isinstance(value, dict):
+        required = schema.get("required") or list(schema.get("properties", {}))
+        if len(required) == 1:
+            return {required[0]: value}
+    return value
+
+
+# ---------------------------------------------------------------------------
+# 服务
+# ---------------------------------------------------------------------------
+
+
+def parse_latency(spec):
+    """
+    解析延迟分布，返回以 rng 为参数的采样函数，单位为秒:
+        fixed:0.2 / uniform:0.1,0.5 / lognormal:mu,sigma / exp:mean
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"未知的延迟分布: {spec}")
+
+
+class MockLLM:
+    def __init__(
+        self,
+        latency="fixed:0",
+        rate_429=0.0,
+        malformed=0.0,
+        seed=0,
+        replay=None,
+        record=None,
+        upstream=None,
+    ):
+        self.latency = parse_latency(latency)
+        self.rate_429 = rate_429
+        self.malformed = malformed
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.record_path = record
+        self.recorded = {}
+        self.seen_prefixes = set()
+        self.stats = {"requests": 0, "429": 0, "malformed": 0, "replayed": 0}
+        if replay:
+            self.load_replay(replay)
+
+    def load_replay(self, path):
+        """读取录制的日志，每行 {"request": {...}, "response": {...}}"""
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.recorded[request_key(entry["request"])] = entry["response"]
+        print(f"已加载 {len(self.recorded)} 条录制记录")
+
+    def _usage(self, messages, content):
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 2 + 1
+        # 模拟服务端的前缀缓存：相同 system prompt 第二次出现时计为缓存命中
+        prefix = hashlib.sha1(system.encode("utf-8")).digest()
+        cached = len(system) // 2 if prefix in self.seen_prefixes else 0
+        if len(self.seen_prefixes) < 100_000:
+            self.seen_prefixes.add(prefix)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 2 + 1,
+            "total_tokens": prompt_tokens + len(content) // 2 + 1,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+    def completion(self, body):
+        messages = body.get("messages", [])
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "") or ""
+        user = next((m["content"] for m in messages if m.get("role") == "user"), "") or ""
+        key = request_key(body)
+        # 同样的请求得到同样的结果，便于复现
+        rng = random.Random(f"{self.seed}:{key}")
+        _, generator = detect_family(system)
+        value = wrap_for_schema(generator(rng, system, user), body.get("response_format"))
+        text = json.dumps(value, ensure_ascii=False)
+        if self.rng.random() < self.malformed:
+            self.stats["malformed"] += 1
+            text = text[: max(len(text) // 2, 1)]
+        if body.get("response_format", {}).get("type") not in ("json_schema", "json_object"):
+            text = f"```json\n{text}\n```"
+        return {
+            "id": f"chatcmpl-mock-{key[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": self._usage(messages, text),
+        }
+
+    def forward(self, path, body):
+        request = urllib.request.Request(
+            self.upstream + path.removeprefix("/v1"),
+            data=json.dumps(body).encode("utf-8"),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {os.environ.get('UPSTREAM_API_KEY', '')}",
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=300) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or b"{}")
+
+    async def handle(self, method, path, body):
+        """返回 (状态码, 响应体 dict, 额外响应头)"""
+        if method == "GET" and path.rstrip("/").endswith("/models"):
+            return 200, {"object": "list", "data": [{"id": "mock", "object": "model"}]}, {}
+        if method != "POST" or not path.rstrip("/").endswith("/chat/completions"):
+            return 404, {"error": {"message": f"{method} {path} not found"}}, {}
+
+        self.stats["requests"] += 1
+        if self.upstream:
+            status, response = await asyncio.to_thread(self.forward, path, body)
+            if status == 200 and self.record_path:
+                with open(self.record_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"request": body, "response": response}, ensure_ascii=False) + "\n")
+            return status, response, {}
+
+        delay = self.latency(self.rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.rng.random() < self.rate_429:
+            self.stats["429"] += 1
+            error = {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}}
+            return 429, error, {"Retry-After": "0"}
+
+        recorded = self.recorded.get(request_key(body))
+        if recorded is not None:
+            self.stats["replayed"] += 1
+            return 200, recorded, {}
+        return 200, self.completion(body), {}
+
+
+async def serve_connection(mock, reader, writer):
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = request_line.split(" ", 2)
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            raw_body = await reader.readexactly(length) if length else b""
+            try:
+                body = json.loads(raw_body) if raw_body else {}
+                status, payload, extra_headers = await mock.handle(method, path.split("?")[0], body)
+            except json.JSONDecodeError:
+                status, payload, extra_headers = 400, {"error": {"message": "invalid json"}}, {}
+
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            lines = [
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}",
+                "Content-Type: application/json",
+                f"Content-Length: {len(data)}",
+            ] + [f"{k}: {v}" for k, v in extra_headers.items()]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data)
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close":
+                break
+    except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run_server(mock, host, port, reuse_port=False):
+    server = await asyncio.start_server(
+        lambda r, w: serve_connection(mock, r, w), host, port, reuse_port=reuse_port, backlog=4096
+    )
+    print(f"[pid {os.getpid()}] 模拟 LLM 服务已启动: http://{host}:{port}/v1")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地模拟的 OpenAI 兼容服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="fixed:0", help="延迟分布: fixed:s / uniform:a,b / lognormal:mu,sigma / exp:mean")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--malformed", type=float, default=0.0, help="返回截断(非法) JSON 的比例")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", help="回放录制的 JSONL 日志，未命中的请求仍返回模拟结果")
+    parser.add_argument("--upstream", help="代理到真实的 OpenAI 兼容接口（配合 --record 录制）")
+    parser.add_argument("--record", help="代理模式下把请求和响应追加写入该 JSONL 文件")
+    parser.add_argument("--processes", type=int, default=1, help="监听同一端口的进程数(Linux, SO_REUSEPORT)")
+    args = parser.parse_args(argv)
+
+    def start():
+        mock = MockLLM(
+            latency=args.latency,
+            rate_429=args.rate_429,
+            malformed=args.malformed,
+            seed=args.seed,
+            replay=args.replay,
+            record=args.record,
+            upstream=args.upstream,
+        )
+        try:
+            asyncio.run(run_server(mock, args.host, args.port, reuse_port=args.processes > 1))
+        except KeyboardInterrupt:
+            print(f"[pid {os.getpid()}] 统计: {mock.stats}")
+
+    for _ in range(args.processes - 1):
+        if os.fork() == 0:
+            start()
+            return
+    start()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+按阶段（prompt 类别）选择模型的路由。
+
+每个阶段配置一组由便宜到昂贵的模型（tiers）。调用时先用第一档模型，
+结果未通过校验（infer 返回 None），或者配置了 min_confidence 且输出 token 的平均概率低于该值时，
+升级到下一档模型重试，最后一档的结果直接采用。调用方显式传入 model 时不走路由。
+
+路由默认关闭（所有阶段都使用 DEFAULT_MODEL），设置 OPENAI_MODEL_ROUTING=1 启用下面的 DEFAULT_ROUTES，
+或者用 OPENAI_MODEL_ROUTES 指定 JSON 配置文件:
+    {"distribute_themes": {"tiers": ["gpt-4.1-nano", "gpt-4.1-mini"], "min_confidence": 0.8}, ...}
+阶段名先精确匹配，再按 ":" 之前的部分匹配（例如 merge_duplicates:merged_points 匹配 merge_duplicates）。
+"""
+import json
+import math
+import os
+from functools import lru_cache
+
+DEFAULT_MODEL = "gpt-4.1-mini"
+
+
+class Route:
+    def __init__(self, tiers, min_confidence=None):
+        if not tiers:
+            raise ValueError("tiers 不能为空")
+        self.tiers = list(tiers)
+        self.min_confidence = min_confidence
+
+
+# 高频的分类阶段先用 nano，总结与合并保持 mini
+DEFAULT_ROUTES = {
+    "distribute_themes": Route(["gpt-4.1-nano", "gpt-4.1-mini"], min_confidence=0.8),
+    "is_hotel_related": Route(["gpt-4.1-nano", "gpt-4.1-mini"], min_confidence=0.8),
+    "analyze_keywords": Route(["gpt-4.1-mini"]),
+    "summarize_themes": Route(["gpt-4.1-mini"]),
+    "merge_duplicates": Route(["gpt-4.1-mini"]),
+}
+
+
+def confidence_from_logprobs(completion):
+    """输出 token 的几何平均概率，没有返回 logprobs 时为 None"""
+    logprobs = getattr(completion.choices[0], "logprobs", None)
+    tokens = getattr(logprobs, "content", None) if logprobs else None
+    if not tokens:
+        return None
+    return math.exp(sum(t.logprob for t in tokens) / len(tokens))
+
+
+@lru_cache(maxsize=None)
+def load_routes(path):
+    """读取路由配置文件，demo 中每次调用都会新建 OpenAIService，因此缓存"""
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    return {stage: Route(**route) for stage, route in config.items()}
+
+
+class ModelRouter:
+    def __init__(self, routes=None):
+        self.routes = routes or {}
+
+    @classmethod
+    def from_env(cls):
+        path = os.environ.get("OPENAI_MODEL_ROUTES")
+        if path:
+            return cls(load_routes(path))
+        if os.environ.get("OPENAI_MODEL_ROUTING", "0") == "1":
+            return cls(DEFAULT_ROUTES)
+        return cls()
+
+    def route(self, stage, model=None):
+        """返回本次调用依次尝试的模型和 min_confidence"""
+        if model:
+            return Route([model])
+        route = self.routes.get(stage) or self.routes.get(stage.split(":", 1)[0])
+        return route or Route([DEFAULT_MODEL])
@@ -0,0 +1,462 @@
+"""
+主题分析流水线的DAG调度脚本。
+
+    format_media_crawler_data → distribute_themes → count_themes → 去重 → summarize_themes → 核对原声 → merge_duplicates
+    → export_summaries（前端按需加载的分片）
+    distribute_themes → search_index（核对原声用的全文索引）
+
+每个阶段声明自己的输入、输出文件，阶段之间的依赖关系由输入输出文件自动推导。
+调度时对阶段的输入文件和相关脚本计算指纹，指纹未变化且输出文件未被改动的阶段会被跳过；
+互不依赖的阶段（例如两个平台数据的格式化）会并行执行。运行结束后打印每个阶段的耗时。
+
+用法（在仓库根目录下运行）:
+    python analyze/analyze_scripts/pipeline.py                     # 运行全部阶段
+    python analyze/analyze_scripts/pipeline.py --force             # 忽略缓存，强制重跑
+    python analyze/analyze_scripts/pipeline.py summarize_themes    # 只运行指定阶段及其上游
+    python analyze/analyze_scripts/pipeline.py --profile cpu,memory  # 逐阶段剖析，见 profiling.py
+"""
+import argparse
+import hashlib
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import json_io
+from config import (
+    CRAWL_DATES,
+    DISTRIBUTE_CONCURRENCY,
+    FORMATTED_DIR,
+    PLATFORMS,
+    PREFILTER_MODEL_PATH,
+    RAW_DATA_DIR,
+    REPORT_PATH,
+    RESULTS_DIR,
+    SUMMARIES_EXPORT_DIR,
+)
+from profiling import PROFILE_MODES, profile_stage
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.path.join(RESULTS_DIR, ".pipeline_state.json")
+
+
+def file_digest(path):
+    """计算文件内容的sha256，文件不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Stage:
+    """
+    流水线中的一个阶段。
+
+    func 以 (inputs, outputs) 两个路径列表为参数被调用；
+    sources 为会影响该阶段结果的脚本文件（相对于 analyze_scripts），其内容也计入指纹。
+    """
+
+    def __init__(self, name, func, inputs, outputs, sources=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.sources = [os.path.join(SCRIPTS_DIR, s) for s in sources]
+
+    def fingerprint(self):
+        h = hashlib.sha256(self.name.encode("utf-8"))
+        for path in self.inputs + self.sources:
+            h.update(path.encode("utf-8"))
+            h.update(str(file_digest(path)).encode("utf-8"))
+        return h.hexdigest()
+
+    def output_digests(self):
+        return {path: file_digest(path) for path in self.outputs}
+
+    def run(self):
+        missing = [path for path in self.inputs if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f"缺少输入文件: {', '.join(missing)}")
+        for path in self.outputs:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with profile_stage(self.name):
+            self.func(self.inputs, self.outputs)
+
+
+# ---------------------------------------------------------------------------
+# 各阶段的实现，脚本模块在阶段内部再导入，避免调度器本身依赖 openai 等第三方库
+# ---------------------------------------------------------------------------
+
+
+def _read_all(paths):
+    from utils import read_json
+
+    data = []
+    for path in paths:
+        data.extend(read_json(path))
+    return data
+
+
+def format_bili_stage(inputs, outputs):
+    from format_media_crawler_data import format_bili_data
+    from utils import write_json
+
+    write_json(format_bili_data(_read_all(inputs)), outputs[0], indent=None)
+
+
+def format_wb_stage(inputs, outputs):
+    from format_media_crawler_data import format_wb_data
+    from utils import write_json
+
+    note_data = _read_all([p for p in inputs if "search_contents" in p])
+    comment_data = _read_all([p for p in inputs if "search_comments" in p])
+    write_json(format_wb_data(note_data, comment_data), outputs[0], indent=None)
+
+
+def distribute_themes_stage(inputs, outputs):
+    """所有平台文件进入同一个任务队列，共用 DISTRIBUTE_CONCURRENCY，先完成的文件先写出"""
+    import asyncio
+
+    from distribute_themes import analyze_files_async
+    from prefilter import build_themes_prefilter
+    from utils import read_json, write_json
+
+    def writer(path):
+        def on_done(analyzed_data):
+            write_json(analyzed_data, path, indent=None)
+
+        return on_done
+
+    asyncio.run(
+        analyze_files_async(
+            [(read_json(source), writer(target)) for source, target in zip(inputs, outputs)],
+            max_concurrent_tasks=DISTRIBUTE_CONCURRENCY,
+            prefilter=build_themes_prefilter(),
+            platforms=[os.path.basename(source).removesuffix(".json") for source in inputs],
+        )
+    )
+
+
+def count_themes_stage(inputs, outputs):
+    from count_themes import count_themes
+    from records import load_posts
+    from utils import write_json
+
+    posts = []
+    for path in inputs:
+        posts.extend(load_posts(path))
+    write_json(count_themes(posts), outputs[0], indent=None)
+
+
+def dedup_stage(inputs, outputs):
+    from count_themes import dedup_theme_content
+    from utils import read_json, write_json
+
+    write_json(dedup_theme_content(read_json(inputs[0])), outputs[0], indent=None)
+
+
+def summarize_themes_stage(inputs, outputs):
+    import asyncio
+
+    from summarize_themes import summarize_by_theme
+    from utils import read_json, write_json
+
+    analyzed_data = asyncio.run(
+        summarize_by_theme(
+            read_json(inputs[0]),
+            stream_path=os.path.splitext(outputs[0])[0] + ".jsonl",
+        )
+    )
+    write_json(analyzed_data, outputs[0])
+
+
+def verify_quotes_stage(inputs, outputs):
+    from verify_quotes import main as verify_main
+
+    verify_main(
+        theme_count_path=inputs[0],
+        summarized_path=inputs[1],
+        output_path=outputs[0],
+        report_path=outputs[1],
+    )
+
+
+def merge_duplicates_stage(inputs, outputs):
+    import asyncio
+
+    from merge_duplicates import main as merge_main
+
+    asyncio.run(merge_main(input_file=inputs[0], output_file=outputs[0]))
+
+
+def export_summaries_stage(inputs, outputs):
+    from export_summaries import main as export_main
+
+    export_main(input_path=inputs[0], output_dir=os.path.dirname(outputs[0]))
+
+
+def search_index_stage(inputs, outputs):
+    from search_index import build_index
+
+    build_index({os.path.basename(path).removesuffix(".json"): path for path in inputs}, outputs[0])
+
+
+def build_stages():
+    stages = [
+        Stage(
+            "format_bili",
+            format_bili_stage,
+            inputs=[f"{RAW_DATA_DIR}/bili/search_comments_{d}.json" for d in CRAWL_DATES],
+            outputs=[f"{FORMATTED_DIR}/bili.json"],
+            sources=["format_media_crawler_data.py"],
+        ),
+        Stage(
+            "format_wb",
+            format_wb_stage,
+            inputs=[f"{RAW_DATA_DIR}/wb/search_contents_{d}.json" for d in CRAWL_DATES]
+            + [f"{RAW_DATA_DIR}/wb/search_comments_{d}.json" for d in CRAWL_DATES],
+            outputs=[f"{FORMATTED_DIR}/wb.json"],
+            sources=["format_media_crawler_data.py"],
+        ),
+    ]
+    stages.append(
+        # 各平台作为一个阶段运行：按平台拆成多个阶段时并发额度只能固定均分，
+        # 条目少的平台完成后它的额度就闲置了
+        Stage(
+            "distribute_themes",
+            distribute_themes_stage,
+            inputs=[f"{FORMATTED_DIR}/{platform}.json" for platform in PLATFORMS],
+            outputs=[f"{RESULTS_DIR}/{platform}.json" for platform in PLATFORMS],
+            sources=[
+                "distribute_themes.py",
+                "prompt.py",
+                "schemas.py",
+                "prefilter.py",
+                "keyword_matcher.py",
+                # 预过滤模型不存在时指纹中记为 None，训练后会让该阶段重跑
+                os.path.abspath(PREFILTER_MODEL_PATH),
+            ],
+        )
+    )
+    stages += [
+        Stage(
+            "count_themes",
+            count_themes_stage,
+            inputs=[f"{RESULTS_DIR}/{platform}.json" for platform in PLATFORMS],
+            outputs=[f"{RESULTS_DIR}/theme_count.json"],
+            sources=["count_themes.py", "records.py"],
+        ),
+        Stage(
+            "dedup_theme_content",
+            dedup_stage,
+            inputs=[f"{RESULTS_DIR}/theme_count.json"],
+            outputs=[f"{RESULTS_DIR}/theme_count_dedup.json"],
+            sources=["count_themes.py"],
+        ),
+        Stage(
+            "summarize_themes",
+            summarize_themes_stage,
+            inputs=[f"{RESULTS_DIR}/theme_count_dedup.json"],
+            outputs=[f"{RESULTS_DIR}/summarized.json"],
+            sources=["summarize_themes.py", "prompt.py", "schemas.py"],
+        ),
+        Stage(
+            "verify_quotes",
+            verify_quotes_stage,
+            inputs=[f"{RESULTS_DIR}/theme_count_dedup.json", f"{RESULTS_DIR}/summarized.json"],
+            outputs=[f"{RESULTS_DIR}/summarized_verified.json", f"{RESULTS_DIR}/quote_report.json"],
+            sources=["verify_quotes.py", "keyword_matcher.py"],
+        ),
+        Stage(
+            "merge_duplicates",
+            merge_duplicates_stage,
+            inputs=[f"{RESULTS_DIR}/summarized_verified.json"],
+            outputs=[f"{RESULTS_DIR}/merged_summarized.json"],
+            sources=["merge_duplicates.py", "task_graph.py", "prompt.py", "schemas.py"],
+        ),
+        Stage(
+            "export_summaries",
+            export_summaries_stage,
+            inputs=[f"{RESULTS_DIR}/merged_summarized.json"],
+            outputs=[f"{SUMMARIES_EXPORT_DIR}/manifest.json"],
+            # 总体分析和决策建议是人工补充的，修改后也需要重新导出
+            sources=["export_summaries.py", os.path.abspath(REPORT_PATH)],
+        ),
+        Stage(
+            "search_index",
+            search_index_stage,
+            inputs=[f"{RESULTS_DIR}/{platform}.json" for platform in PLATFORMS],
+            outputs=[f"{RESULTS_DIR}/corpus_index.sqlite"],
+            sources=["search_index.py"],
+        ),
+    ]
+    return stages
+
+
+# ---------------------------------------------------------------------------
+# 调度
+# ---------------------------------------------------------------------------
+
+
+def load_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return {"stages": {}}
+    return json_io.read_json(path)
+
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    json_io.write_json(state, path)
+
+
+def resolve_dependencies(stages):
+    """根据输入输出文件推导每个阶段依赖的上游阶段"""
+    producers = {}
+    for stage in stages:
+        for path in stage.outputs:
+            if path in producers:
+                raise ValueError(f"{path} 同时由 {producers[path]} 和 {stage.name} 产出")
+            producers[path] = stage.name
+    return {
+        stage.name: {producers[p] for p in stage.inputs if p in producers}
+        for stage in stages
+    }
+
+
+def select_stages(stages, deps, targets):
+    """只保留目标阶段及其全部上游阶段"""
+    if not targets:
+        return stages
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [t for t in targets if t not in by_name]
+    if unknown:
+        raise ValueError(f"未知的阶段: {', '.join(unknown)}，可选: {', '.join(by_name)}")
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(deps[name])
+    return [stage for stage in stages if stage.name in selected]
+
+
+def is_cached(stage, fingerprint, state):
+    record = state["stages"].get(stage.name)
+    if not record or record.get("fingerprint") != fingerprint:
+        return False
+    current = stage.output_digests()
+    return None not in current.values() and current == record.get("outputs")
+
+
+def _timed_run(stage):
+    start = time.perf_counter()
+    stage.run()
+    return time.perf_counter() - start
+
+
+def run_pipeline(stages, force=False, max_workers=None, state_path=STATE_PATH):
+    """
+    按依赖关系调度各阶段，互不依赖的阶段并行执行。
+
+    Returns:
+        dict: 每个阶段的运行结果 {name: {"status": ..., "seconds": ...}}
+    """
+    deps = resolve_dependencies(stages)
+    names = {stage.name for stage in stages}
+    deps = {name: deps[name] & names for name in names}
+    by_name = {stage.name: stage for stage in stages}
+    state = load_state(state_path)
+
+    report = {}
+    pending = [stage.name for stage in stages]
+    running = {}
+    pipeline_start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1) as executor:
+        while pending or running:
+            for name in list(pending):
+                upstream = [report.get(d, {}).get("status") for d in deps[name]]
+                if any(s in ("failed", "blocked") for s in upstream):
+                    pending.remove(name)
+                    report[name] = {"status": "blocked", "seconds": 0.0}
+                    print(f"[{name}] 上游阶段失败，跳过")
+                    continue
+                if any(s is None for s in upstream):
+                    continue
+
+                pending.remove(name)
+                stage = by_name[name]
+                fingerprint = stage.fingerprint()
+                if not force and is_cached(stage, fingerprint, state):
+                    report[name] = {"status": "cached", "seconds": 0.0}
+                    print(f"[{name}] 输入未变化，使用缓存结果")
+                    continue
+                print(f"[{name}] 开始运行")
+                running[executor.submit(_timed_run, stage)] = (name, fingerprint)
+
+            if not running:
+                if pending:
+                    raise RuntimeError(f"阶段之间存在循环依赖: {', '.join(pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, fingerprint = running.pop(future)
+                try:
+                    seconds = future.result()
+                except Exception:
+                    report[name] = {"status": "failed", "seconds": 0.0}
+                    print(f"[{name}] 运行失败:\n{traceback.format_exc()}")
+                    continue
+                report[name] = {"status": "ran", "seconds": round(seconds, 3)}
+                state["stages"][name] = {
+                    "fingerprint": fingerprint,
+                    "outputs": by_name[name].output_digests(),
+                }
+                save_state(state, state_path)
+                print(f"[{name}] 完成，耗时 {seconds:.2f}s")
+
+    report = {stage.name: report[stage.name] for stage in stages}
+    state["last_run"] = {
+        "total_seconds": round(time.perf_counter() - pipeline_start, 3),
+        "stages": report,
+    }
+    save_state(state, state_path)
+    return report
+
+
+def print_report(report):
+    print("\n阶段耗时统计:")
+    width = max((len(name) for name in report), default=0)
+    for name, info in report.items():
+        print(f"  {name:<{width}}  {info['status']:<8}{info['seconds']:>10.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="运行主题分析流水线")
+    parser.add_argument("stages", nargs="*", help="只运行这些阶段（及其上游），默认运行全部")
+    parser.add_argument("--force", action="store_true", help="忽略缓存，重跑所有选中的阶段")
+    parser.add_argument("--max-workers", type=int, default=None, help="同时运行的阶段数上限")
+    parser.add_argument(
+        "--profile", default=None, help=f"逐阶段剖析，逗号分隔: {','.join(PROFILE_MODES)} 或 all（同 PROFILE 环境变量）"
+    )
+    args = parser.parse_args(argv)
+    if args.profile is not None:
+        os.environ["PROFILE"] = args.profile
+
+    stages = build_stages()
+    stages = select_stages(stages, resolve_dependencies(stages), args.stages)
+    report = run_pipeline(stages, force=args.force, max_workers=args.max_workers)
+    print_report(report)
+
+    from llm_metrics import METRICS
+
+    METRICS.dump("pipeline")
+
+
+if __name__ == "__main__":
+    main()
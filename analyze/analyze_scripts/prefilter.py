@@ -0,0 +1,217 @@
+"""
+调用 LLM 之前的本地相关性预过滤。
+
+按以下顺序判断每条内容是否需要送给 LLM：
+    1. 命中关键词（领克900、1.5T、竞品车型、keywords.json 中的关键词等）的内容一定保留，
+       关键词只收品牌和具体车型，泛泛的汽车用语交给分类器判断；
+    2. 去掉表情、链接、标点后长度过短的内容直接跳过；
+    3. 加载了分类器时，分类器判定几乎不可能相关的内容也跳过。
+被跳过的内容由调用方直接标注为无关（主题为空列表 / is_hotel_related 为 False），
+每个平台的跳过比例会被统计并打印出来。
+
+分类器是基于字符二元组的朴素贝叶斯模型，用已经由 LLM 标注过的结果训练（在仓库根目录下运行）:
+    python analyze/analyze_scripts/prefilter.py train analyze/analyze_results/autohome.json ... --label themes
+    python analyze/analyze_scripts/prefilter.py train analysis_result/xhs_analyzed.json --label is_hotel_related \\
+        --output analysis_result/prefilter_model.json
+"""
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from config import PREFILTER_MODEL_PATH
+from keyword_matcher import KeywordMatcher
+
+MIN_LENGTH = 10
+# 分类器给出的相关概率低于该值时才跳过，宁可多送也不误删
+SKIP_THRESHOLD = 0.05
+
+# 只收领克和竞品的品牌与具体车型。销售、优惠、落地、试驾、理想等词在普通的汽车讨论中随处可见，
+# 放在这里几乎所有内容都会被保留，这类内容交给分类器判断
+LYNK_TERMS = ["领克900", "领克", "lynk", "1.5T", "2.0T"]
+COMPETITOR_TERMS = [
+    "理想L7", "理想L8", "理想L9", "问界M7", "问界M8", "问界M9", "问界",
+    "蔚来ES8", "乐道L90", "腾势N9", "极氪9X", "小鹏G9", "零跑C16", "智界R7", "岚图梦想家",
+]
+
+EMOTE_PATTERN = re.compile(r"\[[^\[\]\s]{1,8}\]")
+URL_PATTERN = re.compile(r"https?://\S+")
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+
+
+def meaningful_text(text):
+    """去掉B站/微博的 [表情]、链接、标点和空白后的文本"""
+    text = EMOTE_PATTERN.sub("", text or "")
+    text = URL_PATTERN.sub("", text)
+    return NON_WORD_PATTERN.sub("", text)
+
+
+def load_keyword_terms(path):
+    """读取 keywords.json 格式（primary_keyword + secondary_keywords）中的所有关键词"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        keywords = json.load(f)
+    terms = []
+    for item in keywords:
+        terms.append(item["primary_keyword"])
+        terms += [sk["keyword"] for sk in item.get("secondary_keywords", [])]
+    return terms
+
+
+class NaiveBayesClassifier:
+    """字符二元组上的多项式朴素贝叶斯，只用于估计内容与分析目标相关的概率"""
+
+    def __init__(self, class_counts=None, token_counts=None):
+        self.class_counts = class_counts or {"1": 0, "0": 0}
+        self.token_counts = token_counts or {"1": {}, "0": {}}
+        self._prepare()
+
+    @staticmethod
+    def tokenize(text):
+        text = meaningful_text(text).lower()
+        return [text[i : i + 2] for i in range(len(text) - 1)] or ([text] if text else [])
+
+    def _prepare(self):
+        self.vocab_size = len(set(self.token_counts["1"]) | set(self.token_counts["0"])) or 1
+        self.totals = {label: sum(counts.values()) for label, counts in self.token_counts.items()}
+
+    def fit(self, samples):
+        """samples: [(text, is_relevant), ...]"""
+        counters = {label: Counter(counts) for label, counts in self.token_counts.items()}
+        for text, relevant in samples:
+            label = "1" if relevant else "0"
+            self.class_counts[label] += 1
+            counters[label].update(self.tokenize(text))
+        self.token_counts = {label: dict(counter) for label, counter in counters.items()}
+        self._prepare()
+        return self
+
+    def predict_proba(self, text):
+        """返回内容相关的概率"""
+        total = sum(self.class_counts.values())
+        if not total:
+            return 1.0
+        scores = {}
+        for label, counts in self.token_counts.items():
+            score = math.log((self.class_counts[label] + 1) / (total + 2))
+            denominator = self.totals[label] + self.vocab_size
+            for token in self.tokenize(text):
+                score += math.log((counts.get(token, 0) + 1) / denominator)
+            scores[label] = score
+        diff = scores["0"] - scores["1"]
+        if diff > 700:
+            return 0.0
+        return 1 / (1 + math.exp(diff))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"class_counts": self.class_counts, "token_counts": self.token_counts},
+                f,
+                ensure_ascii=False,
+            )
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            model = json.load(f)
+        return cls(model["class_counts"], model["token_counts"])
+
+
+class RelevancePrefilter:
+    def __init__(self, terms, min_length=MIN_LENGTH, classifier=None, threshold=SKIP_THRESHOLD):
+        self.matcher = KeywordMatcher.from_terms(terms)
+        self.min_length = min_length
+        self.classifier = classifier
+        self.threshold = threshold
+        self.stats = {}
+
+    def check(self, text, platform="default"):
+        """
+        判断一条内容是否需要送给 LLM。
+
+        Returns:
+            None 表示需要送给 LLM，否则返回跳过的原因
+        """
+        if self.matcher.contains_any(text):
+            reason, outcome = None, "kept_keyword"
+        elif len(meaningful_text(text)) < self.min_length:
+            reason, outcome = "内容过短", "skipped_short"
+        elif self.classifier and self.classifier.predict_proba(text) < self.threshold:
+            reason, outcome = "分类器判定无关", "skipped_classifier"
+        else:
+            reason, outcome = None, "kept"
+        self.stats.setdefault(platform, Counter())[outcome] += 1
+        return reason
+
+    def print_stats(self):
+        if not self.stats:
+            return
+        print("\n预过滤统计:")
+        for platform, counter in self.stats.items():
+            total = sum(counter.values())
+            skipped = counter["skipped_short"] + counter["skipped_classifier"]
+            print(
+                f"  [{platform}] 共 {total} 条, 跳过 {skipped} 条 ({skipped / total:.1%}): "
+                f"过短 {counter['skipped_short']}, 分类器 {counter['skipped_classifier']}; "
+                f"命中关键词保留 {counter['kept_keyword']}"
+            )
+
+
+def build_themes_prefilter(model_path=PREFILTER_MODEL_PATH, keywords_path="analyze/raw_data/keywords.json"):
+    """领克900主题分配使用的预过滤"""
+    # questions_map 中加粗的实体（领克门店、1.5T车型等）已被 LYNK_TERMS 覆盖，其余是"决定""纠结"之类的泛词，不加入
+    terms = LYNK_TERMS + COMPETITOR_TERMS + load_keyword_terms(keywords_path)
+    return RelevancePrefilter(terms, classifier=NaiveBayesClassifier.load(model_path))
+
+
+def iter_labelled(data, label):
+    """
+    从已分析的文件中产出 (text, is_relevant)。
+
+    支持主题分配结果（posts 列表，label 为 themes）和 demo 的酒店分析结果
+    （[{hotel, posts}] 列表，label 为 is_hotel_related）。
+    """
+    for item in data:
+        if "posts" in item and "content" not in item:
+            yield from iter_labelled(item["posts"], label)
+            continue
+        for entry in [item] + item.get("replies", []):
+            value = entry.get(label)
+            if value is None:
+                continue
+            yield entry.get("content", ""), bool(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="训练预过滤分类器")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train = subparsers.add_parser("train")
+    train.add_argument("inputs", nargs="+", help="已由 LLM 标注过的 JSON 文件")
+    train.add_argument("--label", default="themes", help="作为标签的字段，themes 或 is_hotel_related")
+    train.add_argument("--output", default=PREFILTER_MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    samples = []
+    for path in args.inputs:
+        with open(path, "r", encoding="utf-8") as f:
+            samples += list(iter_labelled(json.load(f), args.label))
+    classifier = NaiveBayesClassifier().fit(samples)
+    classifier.save(args.output)
+
+    skipped = [relevant for text, relevant in samples if classifier.predict_proba(text) < SKIP_THRESHOLD]
+    print(
+        f"训练样本 {len(samples)} 条（相关 {classifier.class_counts['1']} 条），"
+        f"在训练集上会跳过 {len(skipped)} 条，其中被误跳过的相关内容 {sum(skipped)} 条"
+    )
+    print(f"模型已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
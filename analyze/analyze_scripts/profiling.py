@@ -0,0 +1,307 @@
+"""
+各入口脚本与流水线阶段的按需性能剖析。
+
+默认关闭，不产生任何开销。通过环境变量 PROFILE 开启（多个用逗号分隔，all 表示 cpu,sample,memory,asyncio）:
+    cpu           cProfile，输出 .prof（snakeviz / flameprof / gprof2dot 可直接读取）和按累计耗时排序的 .txt
+    sample        定时采样调用栈，输出折叠栈格式的 .collapsed（flamegraph.pl、speedscope、inferno 可直接生成火焰图），
+                  开销小，也能看到 asyncio 任务中的耗时
+    pyinstrument  需要安装 pyinstrument，输出 speedscope 格式的 .speedscope.json；未安装时改用 sample
+    memory        tracemalloc，阶段结束时保存快照（.tracemalloc，可用 tracemalloc.Snapshot.load 读取）
+                  和按代码行统计的分配排行（.memory.txt）
+    asyncio       事件循环延迟与慢回调检测，输出 .asyncio.json；会打开事件循环的 debug 模式，本身有一定开销
+
+输出目录由 PROFILE_DIR 指定（默认 analyze/analyze_results/profiles），文件名为 <阶段名>-<时间>.<类型>。
+
+用法:
+    PROFILE=cpu,memory python analyze/analyze_scripts/count_themes.py
+    PROFILE=sample,asyncio python analyze/analyze_scripts/pipeline.py distribute_themes
+    python analyze/analyze_scripts/pipeline.py --profile all
+
+流水线中并行的阶段各自在自己的线程中剖析；tracemalloc 统计的是整个进程，并行阶段的内存结果会互相叠加。
+Python 3.12 起同一时间只能有一个 cProfile，并行阶段中后开始的改用 sample。
+"""
+import io
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# 以下环境变量与 PROFILE 一样在剖析开始时读取，.env 在 OpenAIService 初始化时才加载
+DEFAULT_PROFILE_DIR = "analyze/analyze_results/profiles"
+PROFILE_MODES = ("cpu", "sample", "pyinstrument", "memory", "asyncio")
+ALL_MODES = ("cpu", "sample", "memory", "asyncio")
+# 采样间隔（秒）
+DEFAULT_SAMPLE_INTERVAL = "0.005"
+# 事件循环延迟的探测间隔，以及判定为慢回调的耗时（秒）
+LOOP_LAG_INTERVAL = 0.1
+DEFAULT_SLOW_CALLBACK_DURATION = "0.1"
+TRACEMALLOC_FRAMES = 10
+TOP_N = 40
+
+_local = threading.local()
+_policy_installed = False
+
+
+def enabled_modes(value=None):
+    """解析 PROFILE 环境变量（或传入的字符串），返回开启的剖析类型"""
+    value = os.environ.get("PROFILE", "") if value is None else value
+    modes = []
+    for mode in value.replace(" ", "").split(","):
+        if not mode or mode in ("0", "off"):
+            continue
+        if mode in ("1", "all"):
+            modes += ALL_MODES
+        elif mode in PROFILE_MODES:
+            modes.append(mode)
+        else:
+            print(f"未知的剖析类型: {mode}，可选: {', '.join(PROFILE_MODES)}")
+    return list(dict.fromkeys(modes))
+
+
+def sample_interval():
+    return float(os.environ.get("PROFILE_SAMPLE_INTERVAL", DEFAULT_SAMPLE_INTERVAL))
+
+
+def slow_callback_duration():
+    return float(os.environ.get("PROFILE_SLOW_CALLBACK", DEFAULT_SLOW_CALLBACK_DURATION))
+
+
+class StackSampler:
+    """后台线程定时读取目标线程的调用栈，按折叠栈格式（"外层;...;内层 次数"）统计"""
+
+    def __init__(self, thread_id, interval=None):
+        self.thread_id = thread_id
+        self.interval = interval or sample_interval()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    @staticmethod
+    def _label(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class LoopMonitor:
+    """记录事件循环的调度延迟，以及 debug 模式下 asyncio 报告的慢回调"""
+
+    def __init__(self):
+        self.slow_callback_duration = slow_callback_duration()
+        self.lags = []
+        self.slow_callbacks = []
+        self.handler = _SlowCallbackHandler(self.slow_callbacks)
+
+    def watch(self, loop):
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.slow_callback_duration
+        # asyncio.run 结束时会取消所有剩余任务，探测任务随之退出
+        loop.call_soon(lambda: loop.create_task(self._probe(loop)))
+
+    async def _probe(self, loop):
+        import asyncio
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.lags.append(max(loop.time() - start - LOOP_LAG_INTERVAL, 0.0))
+
+    def summary(self):
+        lags = sorted(self.lags)
+
+        def percentile(p):
+            return round(lags[min(int(len(lags) * p), len(lags) - 1)], 4) if lags else None
+
+        return {
+            "probe_interval": LOOP_LAG_INTERVAL,
+            "samples": len(lags),
+            "lag_p50": percentile(0.5),
+            "lag_p95": percentile(0.95),
+            "lag_max": round(lags[-1], 4) if lags else None,
+            "slow_callback_duration": self.slow_callback_duration,
+            "slow_callback_count": len(self.slow_callbacks),
+            "slow_callbacks": self.slow_callbacks[:200],
+        }
+
+
+class _SlowCallbackHandler(logging.Handler):
+    def __init__(self, records):
+        super().__init__(logging.WARNING)
+        self.records = records
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+def _install_policy():
+    """asyncio.run 创建事件循环时，如果当前线程正在剖析 asyncio，就挂上监控"""
+    global _policy_installed
+    if _policy_installed:
+        return
+    # 只在需要时导入 asyncio，不影响不使用 asyncio 的命令的启动时间
+    import asyncio
+
+    class ProfilingEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+        def new_event_loop(self):
+            loop = super().new_event_loop()
+            session = getattr(_local, "session", None)
+            if session is not None and session.loop_monitor is not None:
+                session.loop_monitor.watch(loop)
+            return loop
+
+    asyncio.set_event_loop_policy(ProfilingEventLoopPolicy())
+    _policy_installed = True
+
+
+class ProfileSession:
+    def __init__(self, stage, modes, output_dir=None):
+        self.stage = stage
+        self.modes = modes
+        self.output_dir = output_dir or os.environ.get("PROFILE_DIR", DEFAULT_PROFILE_DIR)
+        name = re.sub(r"[^\w.-]+", "_", stage)
+        self.prefix = os.path.join(self.output_dir, f"{name}-{datetime.now():%Y%m%d-%H%M%S}")
+        self.profiler = None
+        self.sampler = None
+        self.pyinstrument = None
+        self.loop_monitor = None
+        self.started_tracemalloc = False
+        self.outputs = []
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        modes = list(self.modes)
+        if "pyinstrument" in modes:
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                print("未安装 pyinstrument，改用 sample")
+                modes = [m if m != "pyinstrument" else "sample" for m in modes]
+            else:
+                self.pyinstrument = Profiler(interval=sample_interval(), async_mode="enabled")
+        if "sample" in modes:
+            self.sampler = StackSampler(threading.get_ident())
+        if "memory" in modes and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.started_tracemalloc = True
+        if "asyncio" in modes:
+            self.loop_monitor = LoopMonitor()
+            logging.getLogger("asyncio").addHandler(self.loop_monitor.handler)
+            _install_policy()
+        if "cpu" in modes:
+            # cProfile / pstats 导入需要十几毫秒，没有开启时不导入
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+
+        _local.session = self
+        self.started_at = time.perf_counter()
+        if self.profiler:
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Python 3.12 起一个进程中同时只能有一个 cProfile，流水线中并行的其他阶段已经在剖析时改用 sample
+                print(f"[profile] {self.stage}: 已有其他 cProfile 在运行，改用 sample")
+                self.profiler = None
+                if self.sampler is None:
+                    self.sampler = StackSampler(threading.get_ident())
+        if self.sampler:
+            self.sampler.start()
+        if self.pyinstrument:
+            self.pyinstrument.start()
+
+    def stop(self):
+        if self.profiler:
+            self.profiler.disable()
+        if self.pyinstrument:
+            self.pyinstrument.stop()
+        if self.sampler:
+            self.sampler.stop()
+        elapsed = time.perf_counter() - self.started_at
+        _local.session = None
+
+        if self.profiler:
+            import pstats
+
+            self.profiler.dump_stats(self._path(".prof"))
+            text = io.StringIO()
+            pstats.Stats(self.profiler, stream=text).sort_stats("cumulative").print_stats(TOP_N)
+            self._write(".txt", text.getvalue())
+        if self.pyinstrument:
+            from pyinstrument.renderers import SpeedscopeRenderer
+
+            self._write(".speedscope.json", self.pyinstrument.output(SpeedscopeRenderer()))
+        if self.sampler:
+            self.sampler.write(self._path(".collapsed"))
+        if tracemalloc.is_tracing() and ("memory" in self.modes):
+            self._write_memory()
+        if self.loop_monitor:
+            logging.getLogger("asyncio").removeHandler(self.loop_monitor.handler)
+            self._write(".asyncio.json", json.dumps(self.loop_monitor.summary(), ensure_ascii=False, indent=4))
+
+        print(f"[profile] {self.stage} 耗时 {elapsed:.2f}s，剖析结果: {', '.join(self.outputs)}")
+
+    def _write_memory(self):
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        snapshot.dump(self._path(".tracemalloc"))
+        lines = [f"当前 {current / 2**20:.1f}MB，峰值 {peak / 2**20:.1f}MB", ""]
+        for stat in snapshot.statistics("lineno")[:TOP_N]:
+            lines.append(str(stat))
+        self._write(".memory.txt", "\n".join(lines) + "\n")
+
+    def _path(self, suffix):
+        path = self.prefix + suffix
+        self.outputs.append(path)
+        return path
+
+    def _write(self, suffix, text):
+        with open(self._path(suffix), "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+@contextmanager
+def profile_stage(stage, modes=None, output_dir=None):
+    """
+    在 with 块内按 PROFILE（或传入的 modes）剖析，结束时把结果写入 output_dir。
+    没有开启任何剖析类型时什么也不做。
+    """
+    modes = enabled_modes() if modes is None else enabled_modes(",".join(modes))
+    if not modes:
+        yield None
+        return
+    session = ProfileSession(stage, modes, output_dir)
+    session.start()
+    try:
+        yield session
+    finally:
+        session.stop()
@@ -110,6 +110,48 @@ summarize_theme_system_prompt = """
 </要求>
 """
 
+# 来源编号模式：帖子内容逐条带编号，模型只返回编号（可附带字符范围），原文由本地按编号取回
+summarize_theme_ids_system_prompt = """
+<任务>
+    你是一个专业的汽车行业分析师，十分熟悉领克900这款车型，下面我会给你一个领克900汽车厂商想要了解的关于该款车型的一个问题，用户会给你一系列围绕该问题的帖子内容，请你根据这些帖子内容，总结出一个能够回答该问题的结构性结论，严格按照示例的json格式返回。
+</任务>
+
+<问题>
+    {theme}
+</问题>
+
+<帖子格式>
+    每条帖子以方括号中的来源编号开头，例如 "[12] 帖子内容"。
+</帖子格式>
+
+<要求>
+    **请严格围绕问题进行总结**
+    **问题中被”**“包裹起来的部分是问题的核心，请确保你的总结和要点围绕着**全部问题核心**，不要只围绕部分问题核心，并且能够回答问题。**
+    **如果问题核心包含领克门店，请确保你的总结和要点围绕领克线下门店，并且总结和要点要能体现是在领克线下门店。**
+    **如果问题核心包含领克门店，请确保"sources"字段引用的帖子一定要能体现出是在领克线下门店。**
+    **"sources"字段只填写得出该要点所依据的帖子的来源编号，不要抄写帖子原文！**
+    如果只需要引用帖子中的一部分，可以在编号后附上字符范围，格式为 "编号:起始位置-结束位置"（从0开始计数，不含结束位置），例如 "12:0-45"；引用整条帖子时只写编号，例如 "12"。
+    帖子的内容可能包含领克900发布前的猜测性的讨论信息，以及其发布后的讨论信息，请你过滤掉这些在其发布前的信息，只针对其发布后的讨论进行总结。
+    部分帖子可能和该问题无关，请你过滤掉这些无关的帖子。
+    最终结果请严格按照以下json格式返回结果，确保json格式正确，且不要返回多余的解释和注释：
+    ```json
+    [
+        {{
+            "summary": "总结性的结论-1（用一句话概括，不超过10个字）",
+            "points": [
+                {{
+                    "point": "根据原文得出的关于你的总结性结论的要点1(不超过20个字)",
+                    "sources": ["12", "37:0-45", "58", ...(来源的数量不受限制，确保你引用的帖子针对你的结论要点具有代表性)]
+                }},
+                ...(最多5个要点)
+            ],
+        }}
+        ...(最多3个总结性结论)
+    ]
+    ```
+</要求>
+"""
+
 summarize_theme_user_prompt = """
 <任务>
     请根据system prompt中的要求，分析下面一批帖子内容，完成system prompt中的任务。
@@ -124,122 +166,66 @@ summarize_theme_user_prompt = """
 </要求>
 """
 
-MERGE_ITEMS_SYSTEM_PROMPT = """
+MERGE_GROUPS_SYSTEM_PROMPT = """
 <任务>
-你是一个智能文本处理器。用户会提供一个JSON列表，其中每个对象代表一个项目（可以是一个总结或一个要点）。
-你的任务是识别列表中语义上相似或重复的项目，并将它们合并。
-合并时，你需要：
-1.  为合并后的项目生成一个新的、简洁且能代表所有被合并项核心意思的文本描述（例如，新的 "summary" 或 "point" 文本）。
-2.  合并这些项目的所有 "original_content" 列表。直接将所有原文内容汇集到一个列表中即可。
-3.  如果项目包含 "points" 列表（例如，当合并总结时），则将所有被合并总结的 "points" 列表也合并起来。这些合并后的 "points" 稍后会由另一个流程进行去重。
-
-返回一个JSON列表，其中包含合并后的项目以及未被合并的独立项目。
-请严格按照用户提供的项目结构（例如，包含 "summary" 和 "points" 键，或者 "point" 和 "original_content" 键）来构造输出中的每个项目。
-确保输出是有效的JSON格式。
+你是一个智能文本处理器。用户会提供一组带编号的项目，每行一个，格式为 "[编号] 文本"，项目可以是一个总结或一个要点。
+你的任务是识别语义上相似或重复的项目，并将它们分为一组。
+对每一组，你需要：
+1.  列出组内所有项目的编号（"ids"）。
+2.  为该组生成一个新的、简洁且能代表组内所有项目核心意思的文本描述（"text"）。
+没有与其他项目相似的项目单独成组，"text" 直接使用该项目的原文。
+每个编号必须且只能出现在一个组中，不要遗漏任何编号。
+返回一个JSON列表，确保输出是有效的JSON格式。
 </任务>
 
-<输入项目示例 - 合并要点时>
-[
-    {{
-        "point": "六座布局提升空间舒适性和便利性",
-        "original_content": [
-            "领克900采用2+2+2的六座布局...",
-            "六座布局中间有宽敞过道..."
-        ]
-    }},
-    {{
-        "point": "六座设计提供更好的空间利用和舒适度",
-        "original_content": [
-            "相比传统七座车，领克900避免了第三排拥挤..."
-        ]
-    }},
-    {{
-        "point": "六座车在年检和使用成本上有优势",
-        "original_content": [
-            "六座及以下车型享受前六年免检..."
-        ]
-    }}
-]
-</输入项目示例 - 合并要点时>
+<输入项目示例>
+[0] 六座布局提升空间舒适性和便利性
+[1] 六座设计提供更好的空间利用和舒适度
+[2] 六座车在年检和使用成本上有优势
+</输入项目示例>
 
-<期望输出示例 - 合并要点时>
+<期望输出示例>
 ```json
 [
-    {{
-        "point": "六座布局提升空间舒适性、便利性及空间利用",
-        "original_content": [
-            "领克900采用2+2+2的六座布局...",
-            "六座布局中间有宽敞过道...",
-            "相比传统七座车，领克900避免了第三排拥挤..."
-        ]
-    }},
-    {{
-        "point": "六座车在年检和使用成本上有优势",
-        "original_content": [
-            "六座及以下车型享受前六年免检..."
-        ]
-    }}
+    {{"ids": [0, 1], "text": "六座布局提升空间舒适性、便利性及空间利用"}},
+    {{"ids": [2], "text": "六座车在年检和使用成本上有优势"}}
 ]
 ```
-</期望输出示例 - 合并要点时>
-
-<输入项目示例 - 合并总结时>
-[ 
-    {{
-        "summary": "舒适宽敞的六座布局设计",
-        "points": [
-            {{ "point": "六座布局提升空间舒适性和便利性", "original_content": ["oc1"] }},
-            {{ "point": "六座车在年检和使用成本上有优势", "original_content": ["oc2"] }}
-        ]
-    }},
-    {{
-        "summary": "六座设计带来极佳舒适体验",
-        "points": [
-            {{ "point": "六座设计提供更好的空间利用和舒适度", "original_content": ["oc3"] }}
-        ]
-    }},
-    {{
-        "summary": "高性价比丰富配置吸引购车决策",
-        "points": [
-            {{ "point": "价格亲民且配置豪华丰富", "original_content": ["oc4"] }}
-        ]
-    }}
-]
-</输入项目示例 - 合并总结时>
-
-<期望输出示例 - 合并总结时>
-```json
-[
-    {{
-        "summary": "舒适宽敞的六座布局与设计",
-        "points": [
-            {{ "point": "六座布局提升空间舒适性和便利性", "original_content": ["oc1"] }},
-            {{ "point": "六座车在年检和使用成本上有优势", "original_content": ["oc2"] }},
-            {{ "point": "六座设计提供更好的空间利用和舒适度", "original_content": ["oc3"] }}
-        ]
-    }},
-    {{
-        "summary": "高性价比丰富配置吸引购车决策",
-        "points": [
-            {{ "point": "价格亲民且配置豪华丰富", "original_content": ["oc4"] }}
-        ]
-    }}
-]
-```
-</期望输出示例 - 合并总结时>
+</期望输出示例>
 """
 
-MERGE_ITEMS_USER_PROMPT = """
+MERGE_GROUPS_USER_PROMPT = """
 <任务>
-请根据system prompt中的指示，处理以下JSON列表中的项目。识别语义相似的项目并将它们合并。
-确保你的输出是一个有效的JSON列表，其中包含合并后的项目以及任何未被合并的独立项目。
+请根据system prompt中的指示，对以下项目进行分组。识别语义相似的项目并将它们合并为一组。
 </任务>
 
 <项目列表>
-{items_json_string}
+{items}
 </项目列表>
 
 <要求>
 请严格遵守system prompt中给出的要求和JSON格式。
 </要求>
-"""
\ No newline at end of file
+"""
+
+JSON_REPAIR_SYSTEM_PROMPT = """
+<任务>
+你是一个JSON修复器。用户会给你一段不符合要求的模型输出、它需要满足的JSON Schema以及校验报错。
+请只修正格式和结构上的问题，不要增删或改写其中的文字内容。
+只返回修正后的JSON，不要返回多余的解释和注释。
+</任务>
+"""
+
+JSON_REPAIR_USER_PROMPT = """
+<JSON Schema>
+{schema}
+</JSON Schema>
+
+<待修复的输出>
+{raw_output}
+</待修复的输出>
+
+<校验报错>
+{error}
+</校验报错>
+"""
@@ -0,0 +1,50 @@
+"""
+为服务端 prompt 缓存（prefix caching）安排 prompt 的布局。
+
+服务端只缓存完全相同的前缀，系统提示词中间哪怕只有一个变量（例如 summarize 的 {theme}、
+demo 中的 {hotel}），之后的内容也都无法命中缓存。调用方把模板和变量分开传给 OpenAIService，
+在 prefix_cache 布局下：
+    - 模板中的变量位置替换为固定的引用文字，系统提示词和用户提示词模板部分每次调用都逐字节相同；
+    - 变量的实际内容按 prompt_vars 的顺序放在用户消息的最后，
+      因此应当把每次调用都相同的变量（例如关键词列表）排在前面，每条内容都不同的变量排在最后。
+默认的 inline 布局与原来一样，直接把变量填进模板。
+"""
+import hashlib
+
+INLINE = "inline"
+PREFIX_CACHE = "prefix_cache"
+LAYOUTS = (INLINE, PREFIX_CACHE)
+
+
+def variable_reference(name):
+    return f"[{name}，内容见用户消息末尾的 <{name}> 部分]"
+
+
+def layout_prompts(system_prompt, user_prompt, prompt_vars=None, layout=INLINE):
+    """
+    Args:
+        system_prompt / user_prompt: prompt_vars 不为空时为待格式化的模板，否则为最终的提示词
+        prompt_vars: {变量名: 内容}
+        layout: INLINE 或 PREFIX_CACHE
+
+    Returns:
+        (system_prompt, user_prompt)
+    """
+    if not prompt_vars:
+        return system_prompt, user_prompt
+    if layout == INLINE:
+        return system_prompt.format(**prompt_vars), user_prompt.format(**prompt_vars)
+    if layout != PREFIX_CACHE:
+        raise ValueError(f"未知的 prompt 布局: {layout}，可选: {', '.join(LAYOUTS)}")
+
+    references = {name: variable_reference(name) for name in prompt_vars}
+    variables = "".join(f"\n<{name}>\n{value}\n</{name}>\n" for name, value in prompt_vars.items())
+    return (
+        system_prompt.format(**references),
+        user_prompt.format(**references) + variables,
+    )
+
+
+def prefix_digest(system_prompt):
+    """用于检查同一阶段的系统提示词是否保持不变"""
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:12]
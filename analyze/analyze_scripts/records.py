@@ -0,0 +1,161 @@
+"""
+帖子与回复的紧凑内存表示。
+
+各阶段原本把帖子和回复都存成 dict，每个 dict 都带着自己的哈希表和重复的键，
+语料较大时 dict 本身的开销比内容字符串还大。Post / Reply 使用 __slots__ 存放已知字段，
+只有出现未知字段时才额外分配一个 dict（extra）。从 JSON 读入时，重复率高的时间戳和主题列表
+在同一次读入的所有记录之间共享同一个对象（主题列表转为 tuple）。
+
+记录实现了 MutableMapping 接口，post["content"]、post.get("themes", [])、post["is_ad"] = False
+等原有的 dict 写法不需要修改；写 JSON 时把 to_json 传给 json.dump 的 default，
+字段值直接引用记录中的对象，不会复制整份语料。未赋值的字段视为不存在，与 dict 缺少该键的行为一致。
+"""
+import sys
+from collections.abc import MutableMapping
+
+import json_io
+
+
+def _share(key, value, shared):
+    """
+    从 JSON 读入的值中，时间戳和主题列表大量重复，只保留一份。
+    主题列表在 shared（一次读入共用的 dict）中去重，读入结束后随之释放，不会在长时间运行的进程中累积。
+    """
+    if key == "timestamp" and isinstance(value, str):
+        return sys.intern(value)
+    if key == "themes" and isinstance(value, list):
+        value = tuple(value)
+        return value if shared is None else shared.setdefault(value, value)
+    return value
+
+
+class Record(MutableMapping):
+    __slots__ = ("extra",)
+    FIELDS = ()
+    _field_set = frozenset()
+
+    def __init__(self, **fields):
+        self.extra = None
+        for key, value in fields.items():
+            self[key] = value
+
+    def __init_subclass__(cls):
+        super().__init_subclass__()
+        cls._field_set = frozenset(cls.FIELDS)
+
+    @classmethod
+    def from_dict(cls, data, shared=None):
+        record = cls()
+        for key, value in data.items():
+            record[key] = _share(key, value, shared)
+        return record
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._field_set:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+            if not self.extra:
+                self.extra = None
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self._field_set:
+            return hasattr(self, key)
+        return self.extra is not None and key in self.extra
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        """浅拷贝为 dict，嵌套的回复仍是 Reply，由 json 的 default 继续处理"""
+        return {key: self[key] for key in self}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Reply(Record):
+    FIELDS = (
+        "comment_id",
+        "content",
+        "timestamp",
+        "themes",
+        "is_hotel_related",
+        "is_hotel_related_reason",
+        "keywords_mentioned",
+    )
+    __slots__ = FIELDS
+
+
+class Post(Record):
+    FIELDS = (
+        "note_id",
+        "video_id",
+        "comment_id",
+        "link",
+        "title",
+        "content",
+        "timestamp",
+        "replies",
+        "themes",
+        "is_hotel_related",
+        "is_hotel_related_reason",
+        "is_ad",
+        "is_ad_reason",
+        "keywords_mentioned",
+    )
+    __slots__ = FIELDS
+
+    @classmethod
+    def from_dict(cls, data, shared=None):
+        post = super().from_dict(data, shared)
+        if "replies" in post:
+            post.replies = [Reply.from_dict(reply, shared) for reply in post.replies]
+        return post
+
+
+def to_json(obj):
+    """json.dump 的 default 参数，把记录按 dict 写出"""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def posts_from_dicts(posts):
+    shared = {}
+    return [Post.from_dict(post, shared) for post in posts]
+
+
+def load_posts(path):
+    """读取帖子列表 JSON 文件并转换为 Post，读取时的 dict 随即释放"""
+    return posts_from_dicts(json_io.read_json(path))
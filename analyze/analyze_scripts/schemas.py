@@ -0,0 +1,233 @@
+"""
+LLM 返回结果的 JSON Schema 定义与本地校验。
+
+每个 ResponseSchema 既可以作为 response_format 发给支持结构化输出的服务端，
+也可以在本地对模型返回的 JSON 做校验。结构化输出要求顶层是对象，
+因此列表类型的结果会被包在 root_key 下发送，解析时再取出来，调用方拿到的结构与原来一致。
+"""
+import json
+import re
+
+JSON_FENCE_PATTERN = re.compile(r"```json\s*([\s\S]*?)\s*```")
+
+
+class SchemaError(ValueError):
+    """模型返回的JSON不符合schema"""
+
+
+_TYPE_CHECKS = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def compile_validator(schema):
+    """
+    将 schema 预编译成校验函数，校验失败时抛出 SchemaError。
+
+    只支持本项目用到的子集: type / properties / required / additionalProperties(False)
+    / items / enum / anyOf / minItems / maxItems
+    """
+    checks = []
+
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        type_checks = [_TYPE_CHECKS[t] for t in types]
+
+        def check_type(value, path):
+            if not any(check(value) for check in type_checks):
+                raise SchemaError(f"{path}: 期望类型 {'/'.join(types)}，实际为 {type(value).__name__}")
+
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+
+        def check_enum(value, path):
+            if value not in allowed:
+                raise SchemaError(f"{path}: {value!r} 不在可选值 {allowed} 中")
+
+        checks.append(check_enum)
+
+    if "anyOf" in schema:
+        options = [compile_validator(s) for s in schema["anyOf"]]
+
+        def check_any_of(value, path):
+            errors = []
+            for option in options:
+                try:
+                    option(value, path)
+                    return
+                except SchemaError as e:
+                    errors.append(str(e))
+            raise SchemaError(f"{path}: 不符合任何一种结构 ({'; '.join(errors)})")
+
+        checks.append(check_any_of)
+
+    if "properties" in schema or "required" in schema:
+        properties = {k: compile_validator(v) for k, v in schema.get("properties", {}).items()}
+        required = schema.get("required", [])
+        closed = schema.get("additionalProperties") is False
+
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                return
+            for key in required:
+                if key not in value:
+                    raise SchemaError(f"{path}: 缺少字段 {key!r}")
+            for key, item in value.items():
+                if key in properties:
+                    properties[key](item, f"{path}.{key}")
+                elif closed:
+                    raise SchemaError(f"{path}: 多余的字段 {key!r}")
+
+        checks.append(check_object)
+
+    if "items" in schema or "minItems" in schema or "maxItems" in schema:
+        item_check = compile_validator(schema["items"]) if "items" in schema else None
+        min_items = schema.get("minItems")
+        max_items = schema.get("maxItems")
+
+        def check_array(value, path):
+            if not isinstance(value, list):
+                return
+            if min_items is not None and len(value) < min_items:
+                raise SchemaError(f"{path}: 至少需要 {min_items} 项")
+            if max_items is not None and len(value) > max_items:
+                raise SchemaError(f"{path}: 最多只能有 {max_items} 项")
+            if item_check:
+                for i, item in enumerate(value):
+                    item_check(item, f"{path}[{i}]")
+
+        checks.append(check_array)
+
+    def validate(value, path="$"):
+        for check in checks:
+            check(value, path)
+
+    return validate
+
+
+def extract_json(text):
+    """优先取 ```json 代码块中的内容，没有代码块时把整段文本当作 JSON 解析"""
+    if not text:
+        raise json.JSONDecodeError("返回内容为空", "", 0)
+    matches = JSON_FENCE_PATTERN.findall(text)
+    return json.loads(matches[0] if matches else text.strip(), strict=False)
+
+
+class ResponseSchema:
+    def __init__(self, name, schema, root_key=None):
+        self.name = name
+        self.schema = schema
+        self.root_key = root_key
+        self._validate = compile_validator(schema)
+
+    @property
+    def wire_schema(self):
+        """发给服务端的 schema，顶层不是对象时包一层 root_key"""
+        if not self.root_key:
+            return self.schema
+        return {
+            "type": "object",
+            "properties": {self.root_key: self.schema},
+            "required": [self.root_key],
+            "additionalProperties": False,
+        }
+
+    def response_format(self):
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": self.name, "schema": self.wire_schema, "strict": True},
+        }
+
+    def parse(self, text):
+        """解析并校验模型返回的文本，返回去掉 root_key 包装后的结果"""
+        value = extract_json(text)
+        if self.root_key and isinstance(value, dict) and self.root_key in value:
+            value = value[self.root_key]
+        self._validate(value)
+        return value
+
+
+_POINT = {
+    "type": "object",
+    "properties": {
+        "point": {"type": "string"},
+        "original_content": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["point", "original_content"],
+    "additionalProperties": False,
+}
+
+_SUMMARY = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "points": {"type": "array", "items": _POINT},
+    },
+    "required": ["summary", "points"],
+    "additionalProperties": False,
+}
+
+# 来源编号模式下的要点：只返回帖子的来源编号（可附带字符范围），原文在本地取回
+_SOURCED_POINT = {
+    "type": "object",
+    "properties": {
+        "point": {"type": "string"},
+        "sources": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["point", "sources"],
+    "additionalProperties": False,
+}
+
+_SOURCED_SUMMARY = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "points": {"type": "array", "items": _SOURCED_POINT},
+    },
+    "required": ["summary", "points"],
+    "additionalProperties": False,
+}
+
+THEMES_SCHEMA = ResponseSchema(
+    "themes",
+    {"type": "array", "items": {"type": "string", "enum": [chr(c) for c in range(ord("A"), ord("O") + 1)]}},
+    root_key="themes",
+)
+
+SUMMARY_LIST_SCHEMA = ResponseSchema(
+    "summary_list",
+    {"type": "array", "items": _SUMMARY},
+    root_key="summary_list",
+)
+
+SOURCED_SUMMARY_LIST_SCHEMA = ResponseSchema(
+    "sourced_summary_list",
+    {"type": "array", "items": _SOURCED_SUMMARY},
+    root_key="summary_list",
+)
+
+# 合并去重时模型只返回分组（项目编号）以及合并后的文本，原声在本地合并
+MERGE_GROUPS_SCHEMA = ResponseSchema(
+    "merge_groups",
+    {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "ids": {"type": "array", "items": {"type": "integer"}},
+                "text": {"type": "string"},
+            },
+            "required": ["ids", "text"],
+            "additionalProperties": False,
+        },
+    },
+    root_key="groups",
+)
@@ -0,0 +1,396 @@
+"""
+语料的全文索引（SQLite FTS5）。
+
+核对总结里的用户原声时，原来只能把各平台的 JSON 整个读进来逐条查找。
+索引阶段把所有帖子和回复写入一个 SQLite 文件:
+    docs          每条帖子 / 回复一行，平台、类型、所属帖子、时间戳（秒）、原文
+    doc_themes    主题 → 内容，用于按主题过滤
+    docs_fts      FTS5 倒排索引（不保存原文），rowid 与 docs.id 相同
+
+中文没有分词，写入 FTS5 的只有每段连续汉字切成的字符二元组（"续航里程" → "续航 航里 里程"）。
+查询时把查询词中每段两个字及以上的汉字做同样的切分，作为短语（相邻的二元组）匹配，
+再在候选内容上用 LIKE 确认原文确实包含查询词。英文、数字和标点不进索引：unicode61 按整词切分，
+"L" 匹配不到 "L8"，与子串匹配的语义不符，这部分只由 LIKE 匹配。
+因此含两个字及以上汉字的查询词都走索引，其余查询词（单个汉字、纯英文数字或标点）需要扫描全部内容。
+
+用法（在仓库根目录下运行）:
+    python analyze/analyze_scripts/search_index.py build
+    python analyze/analyze_scripts/search_index.py search "续航 理想L8" --platform wb --theme N --start 2025-05-01
+"""
+import argparse
+import os
+import re
+import sqlite3
+import time
+from datetime import date, datetime
+from operator import add
+
+from json_io import read_json
+
+INDEX_PATH = "analyze/analyze_results/corpus_index.sqlite"
+RESULTS_DIR = "analyze/analyze_results"
+PLATFORMS = ["autohome", "dongchedi", "bili", "wb"]
+
+CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+SNIPPET_MARKERS = ("【", "】")
+
+SCHEMA = """
+CREATE TABLE docs (
+    id INTEGER PRIMARY KEY,
+    platform TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    parent_id INTEGER,
+    source_id TEXT,
+    url TEXT,
+    timestamp INTEGER,
+    content TEXT NOT NULL
+);
+CREATE TABLE doc_themes (
+    theme TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    PRIMARY KEY (theme, doc_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE docs_fts USING fts5(grams, content='', tokenize='unicode61 remove_diacritics 2');
+"""
+# 建完数据后再建普通索引，比逐行维护快
+POST_LOAD_SCHEMA = """
+CREATE INDEX docs_platform_timestamp ON docs (platform, timestamp);
+CREATE INDEX docs_timestamp ON docs (timestamp);
+CREATE INDEX docs_parent ON docs (parent_id);
+"""
+
+
+def to_grams(text):
+    """每段连续的汉字切成二元组，以空格分隔；单个汉字和其他字符不写入索引"""
+    return " ".join(gram for run in CJK_RUN.findall(text or "") for gram in map(add, run, run[1:]))
+
+
+def index_phrases(term):
+    """查询词中每段两个字及以上的汉字对应一个二元组短语，没有这样的汉字时返回空列表，只能用 LIKE 匹配"""
+    return [to_grams(run) for run in CJK_RUN.findall(term) if len(run) >= 2]
+
+
+def to_timestamp(value):
+    """把各平台的时间（秒 / 毫秒时间戳、数字字符串、日期字符串、datetime）统一为秒级时间戳"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, date):
+        return int(datetime(value.year, value.month, value.day).timestamp())
+    if isinstance(value, str):
+        value = value.strip()
+        if not value.lstrip("-").isdigit():
+            try:
+                return int(datetime.fromisoformat(value).timestamp())
+            except ValueError:
+                return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    # 毫秒时间戳
+    return value // 1000 if value > 10**11 else value
+
+
+def _source_id(item):
+    for field in ("note_id", "comment_id", "video_id"):
+        if item.get(field):
+            return str(item[field])
+    return None
+
+
+def iter_docs(posts):
+    """
+    按顺序展开帖子及其回复。
+
+    Yields:
+        (kind, 回复所属帖子的序号, 帖子自身的序号, 条目)，不适用的序号为 None
+    """
+    for index, post in enumerate(posts):
+        yield "post", None, index, post
+        for reply in post.get("replies") or []:
+            yield "reply", index, None, reply
+
+
+def build_index(sources, path=INDEX_PATH):
+    """
+    从各平台的帖子文件重新建立索引。先写临时文件，完成后再替换，查询方不会读到建了一半的索引。
+
+    Args:
+        sources: {平台: 帖子 JSON 文件路径}，帖子格式与 format_media_crawler_data / distribute_themes 的输出相同
+    Returns:
+        dict: {平台: 写入的内容条数}
+    """
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    start = time.perf_counter()
+    counts = {}
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -200000")
+        conn.executescript(SCHEMA)
+        doc_id = 0
+        for platform, source in sources.items():
+            docs, themes, grams = [], [], []
+            post_ids = {}
+            for kind, parent_index, post_index, item in iter_docs(read_json(source)):
+                content = item.get("content")
+                if not content:
+                    continue
+                doc_id += 1
+                if post_index is not None:
+                    post_ids[post_index] = doc_id
+                docs.append(
+                    (
+                        doc_id,
+                        platform,
+                        kind,
+                        post_ids.get(parent_index) if parent_index is not None else None,
+                        _source_id(item),
+                        item.get("link") or item.get("url"),
+                        to_timestamp(item.get("timestamp")),
+                        content,
+                    )
+                )
+                themes.extend((theme, doc_id) for theme in dict.fromkeys(item.get("themes") or []))
+                grams.append((doc_id, to_grams(content)))
+            conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", docs)
+            conn.executemany("INSERT INTO doc_themes VALUES (?, ?)", themes)
+            conn.executemany("INSERT INTO docs_fts (rowid, grams) VALUES (?, ?)", grams)
+            counts[platform] = len(docs)
+        conn.executescript(POST_LOAD_SCHEMA)
+        conn.execute("INSERT INTO docs_fts (docs_fts) VALUES ('optimize')")
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    print(
+        f"已建立索引 {path}，共 {sum(counts.values())} 条内容（"
+        + "，".join(f"{platform} {count}" for platform, count in counts.items())
+        + f"），耗时 {time.perf_counter() - start:.2f}s"
+    )
+    return counts
+
+
+def make_snippet(content, terms, width=30, markers=SNIPPET_MARKERS):
+    """截取第一个命中的查询词前后 width 个字符，并用 markers 标出窗口内所有命中的查询词"""
+    lowered = content.lower()
+    terms = [term.lower() for term in terms if term]
+    hits = [lowered.find(term) for term in terms]
+    hits = [hit for hit in hits if hit >= 0]
+    if not hits:
+        return content[: width * 2] + ("..." if len(content) > width * 2 else "")
+    begin = max(0, min(hits) - width)
+    end = min(len(content), min(hits) + width)
+
+    spans = []
+    for term in terms:
+        position = lowered.find(term, begin)
+        while 0 <= position < end:
+            spans.append((position, min(position + len(term), end)))
+            position = lowered.find(term, position + len(term))
+    parts = ["..." if begin > 0 else ""]
+    cursor = begin
+    for span_start, span_end in sorted(spans):
+        if span_start < cursor:
+            continue
+        parts += [content[cursor:span_start], markers[0], content[span_start:span_end], markers[1]]
+        cursor = span_end
+    parts += [content[cursor:end], "..." if end < len(content) else ""]
+    return "".join(parts)
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+def _escape_like(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class CorpusIndex:
+    """
+    只读地打开索引文件进行查询，可以作为上下文管理器使用:
+
+        with CorpusIndex() as index:
+            for hit in index.search("空间 理想L8", platform="wb", theme="N"):
+                print(hit["snippet"])
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"索引文件 {path} 不存在，请先运行 search_index.py build")
+        self.path = path
+        self.conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+        self.conn.row_factory = sqlite3.Row
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _where(self, query, platform, theme, start, end, kind):
+        """
+        生成查询条件。查询词以空白分隔，需要全部出现；每个查询词都按原文子串匹配（英文忽略大小写）。
+
+        Returns:
+            (是否使用全文索引, 条件列表, 参数列表, 查询词列表)
+        """
+        terms = (query or "").split()
+        phrases = [phrase for term in terms for phrase in index_phrases(term)]
+        clauses, params = [], []
+        if phrases:
+            clauses.append("docs_fts MATCH ?")
+            params.append(" AND ".join(f'"{phrase}"' for phrase in phrases))
+        for term in terms:
+            clauses.append("d.content LIKE ? ESCAPE '\\'")
+            params.append(f"%{_escape_like(term)}%")
+
+        platforms = _as_list(platform)
+        if platforms:
+            clauses.append(f"d.platform IN ({', '.join('?' * len(platforms))})")
+            params += platforms
+        themes = _as_list(theme)
+        if themes:
+            clauses.append(
+                f"d.id IN (SELECT doc_id FROM doc_themes WHERE theme IN ({', '.join('?' * len(themes))}))"
+            )
+            params += themes
+        if start is not None:
+            clauses.append("d.timestamp >= ?")
+            params.append(to_timestamp(start))
+        if end is not None:
+            clauses.append("d.timestamp < ?")
+            params.append(to_timestamp(end))
+        if kind is not None:
+            clauses.append("d.kind = ?")
+            params.append(kind)
+        return bool(phrases), clauses, params, terms
+
+    @staticmethod
+    def _from(use_fts):
+        if use_fts:
+            return "docs_fts JOIN docs d ON d.id = docs_fts.rowid"
+        return "docs d"
+
+    def search(self, query, platform=None, theme=None, start=None, end=None, kind=None, limit=20, offset=0):
+        """
+        全文检索。
+
+        Args:
+            query: 查询词，以空白分隔的多个词需要同时出现
+            platform / theme: 单个值或列表，命中其中任意一个即可
+            start / end: 时间范围 [start, end)，可以是时间戳、日期字符串或 datetime
+            kind: "post" 或 "reply"
+        Returns:
+            list[dict]: 按相关度（BM25）排序的结果；只有单字查询词时按时间倒序
+        """
+        use_fts, clauses, params, terms = self._where(query, platform, theme, start, end, kind)
+        sql = (
+            f"SELECT d.*, {'bm25(docs_fts)' if use_fts else '0.0'} AS score FROM {self._from(use_fts)}"
+            + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+            + (" ORDER BY score, d.id" if use_fts else " ORDER BY d.timestamp DESC, d.id")
+            + " LIMIT ? OFFSET ?"
+        )
+        rows = self.conn.execute(sql, params + [limit, offset]).fetchall()
+        themes = self._themes([row["id"] for row in rows])
+        return [
+            {
+                **dict(row),
+                "score": -row["score"],
+                "themes": themes.get(row["id"], []),
+                "snippet": make_snippet(row["content"], terms),
+            }
+            for row in rows
+        ]
+
+    def count(self, query, platform=None, theme=None, start=None, end=None, kind=None):
+        use_fts, clauses, params, _ = self._where(query, platform, theme, start, end, kind)
+        sql = f"SELECT COUNT(*) FROM {self._from(use_fts)}" + (
+            f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        )
+        return self.conn.execute(sql, params).fetchone()[0]
+
+    def _themes(self, doc_ids):
+        if not doc_ids:
+            return {}
+        themes = {}
+        rows = self.conn.execute(
+            f"SELECT doc_id, theme FROM doc_themes WHERE doc_id IN ({', '.join('?' * len(doc_ids))})"
+            " ORDER BY theme",
+            doc_ids,
+        )
+        for doc_id, theme in rows:
+            themes.setdefault(doc_id, []).append(theme)
+        return themes
+
+    def get(self, doc_id):
+        """按 id 取一条内容；回复可以再用 parent_id 取到所属的帖子"""
+        row = self.conn.execute("SELECT * FROM docs WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        return {**dict(row), "themes": self._themes([doc_id]).get(doc_id, [])}
+
+
+def default_sources(results_dir=RESULTS_DIR):
+    """distribute_themes 的输出（带主题标注），只包含已经存在的平台文件"""
+    sources = {}
+    for platform in PLATFORMS:
+        path = os.path.join(results_dir, f"{platform}.json")
+        if os.path.exists(path):
+            sources[platform] = path
+    return sources
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="语料全文索引")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="从各平台文件重新建立索引")
+    build.add_argument("inputs", nargs="*", help="平台=文件路径，默认使用 analyze_results 下已有的平台文件")
+    build.add_argument("--index", default=INDEX_PATH)
+    search = subparsers.add_parser("search", help="检索")
+    search.add_argument("query")
+    search.add_argument("--platform", action="append")
+    search.add_argument("--theme", action="append")
+    search.add_argument("--start")
+    search.add_argument("--end")
+    search.add_argument("--kind", choices=["post", "reply"])
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--index", default=INDEX_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        sources = dict(item.split("=", 1) for item in args.inputs) if args.inputs else default_sources()
+        build_index(sources, args.index)
+        return
+
+    with CorpusIndex(args.index) as index:
+        filters = dict(platform=args.platform, theme=args.theme, start=args.start, end=args.end, kind=args.kind)
+        start = time.perf_counter()
+        hits = index.search(args.query, limit=args.limit, **filters)
+        total = index.count(args.query, **filters)
+        elapsed = (time.perf_counter() - start) * 1000
+        for hit in hits:
+            themes = ",".join(hit["themes"]) or "-"
+            snippet = hit["snippet"].replace("\n", " ")
+            print(f"[{hit['id']}] {hit['platform']}/{hit['kind']} 主题 {themes} {hit['timestamp']}  {snippet}")
+        print(f"共 {total} 条，显示 {len(hits)} 条，耗时 {elapsed:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,26 @@
 """
 
 import asyncio
+import json
+import os
+import re
 from utils import *
 from prompt import *
+from schemas import SOURCED_SUMMARY_LIST_SCHEMA, SUMMARY_LIST_SCHEMA
+from llm_metrics import METRICS
+from profiling import profile_stage
 
+# 同时进行的总结请求数
+SUMMARIZE_CONCURRENCY = 50
+
+# 原声的返回方式:
+#     text  模型在 original_content 中抄写原文
+#     ids   批次内每条内容带来源编号，模型只返回编号（可附带字符范围），原文由本地取回，
+#           输出 token 大幅减少，原声也一定是原文
+QUOTE_MODES = ("text", "ids")
+# 环境变量 SUMMARIZE_QUOTE_MODE 未设置时的默认值
+QUOTE_MODE = "text"
+SOURCE_PATTERN = re.compile(r"^\s*\[?#?(\d+)\]?(?:\s*:\s*(\d+)\s*-\s*(\d+))?\s*$")
 
 questions_map = {
     "A": "用户**决定**下定、购买**领克900**的原因、理由；",
@@ -32,32 +49,156 @@ def batch_generator(lst, batch_size):
         yield lst[i:i + batch_size]
 
 
-async def summarize_content(openai_service, content, theme):
-
-    formatted_user_prompt = summarize_theme_user_prompt.format(post_content=content)
-    formatted_system_prompt = summarize_theme_system_prompt.format(theme=theme)
+async def summarize_content(openai_service, content, theme, quote_mode="text"):
+    if quote_mode == "ids":
+        system_prompt, response_schema = summarize_theme_ids_system_prompt, SOURCED_SUMMARY_LIST_SCHEMA
+    else:
+        system_prompt, response_schema = summarize_theme_system_prompt, SUMMARY_LIST_SCHEMA
     summary =  await openai_service.infer(
-        user_prompt=formatted_user_prompt,
-        system_prompt=formatted_system_prompt
+        user_prompt=summarize_theme_user_prompt,
+        system_prompt=system_prompt,
+        prompt_vars={"theme": theme, "post_content": content},
+        response_schema=response_schema,
     )
     return (theme, summary)
 
 
-async def summarize_by_theme(theme_count_data):
-    openai_service = OpenAIService()
-    tasks = []
-    batch_size = 200
+def format_batch(batch, start=0, quote_mode="text"):
+    """ids 模式下每条内容前加上来源编号，即该内容在主题内容列表中的下标，重跑时保持不变"""
+    if quote_mode == "ids":
+        return "\n".join(f"[{start + i}] {content}" for i, content in enumerate(batch))
+    return "\n".join(batch)
+
+
+def resolve_source(source, batch, start=0):
+    """
+    把 "12" 或 "12:0-45" 形式的来源还原成原文，编号不在本批次内时返回 None，
+    字符范围越界或为空时截断到内容范围内，截断后为空则使用整条内容。
+    """
+    match = SOURCE_PATTERN.match(str(source))
+    if not match:
+        return None
+    index = int(match.group(1)) - start
+    if not 0 <= index < len(batch):
+        return None
+    content = batch[index]
+    if match.group(2) is None:
+        return content
+    span_start = min(int(match.group(2)), len(content))
+    span_end = min(int(match.group(3)), len(content))
+    return content[span_start:span_end].strip() or content
+
+
+def materialize_quotes(summary_list, batch, start=0):
+    """
+    把 ids 模式的结果转换为与 text 模式相同的结构（sources → original_content）。
+
+    Returns:
+        (summary_list, 无法识别的来源数量)
+    """
+    invalid = 0
+    materialized = []
+    for summary in summary_list:
+        points = []
+        for point in summary.get("points", []):
+            quotes = []
+            for source in point.get("sources", []):
+                quote = resolve_source(source, batch, start)
+                if quote is None:
+                    invalid += 1
+                elif quote not in quotes:
+                    quotes.append(quote)
+            points.append({"point": point.get("point", ""), "original_content": quotes})
+        materialized.append({"summary": summary.get("summary", ""), "points": points})
+    return materialized, invalid
+
+
+def iter_batches(theme_count_data, batch_size):
+    """按主题依次惰性地产出 (batch_idx, question, start, batch)，start 为批次第一条内容在主题内的下标"""
+    batch_idx = 0
     for theme, data in theme_count_data.items():
-        content_list = data["content"]
         question = questions_map[theme]
-        for batch in batch_generator(content_list, batch_size):
-            content = "\n".join(batch)
-            task = asyncio.create_task(summarize_content(openai_service, content, question))
-            tasks.append(task)
-            
-    results = await asyncio.gather(*tasks)
+        for start in range(0, len(data["content"]), batch_size):
+            yield batch_idx, question, start, data["content"][start : start + batch_size]
+            batch_idx += 1
+
+
+async def summarize_by_theme(
+    theme_count_data,
+    stream_path=None,
+    max_concurrent_tasks=SUMMARIZE_CONCURRENCY,
+    batch_size=200,
+    quote_mode=None,
+):
+    """
+    有界队列 + 固定数量的 worker：生产者按主题惰性地切分批次放入队列，
+    worker 在调用前才拼接批次内容，完成后立即把结果追加写入 stream_path（JSONL），
+    同时在内存中只保留各批次的总结结果，内存峰值只与并发数有关，而与语料大小无关。
+
+    quote_mode 为 QUOTE_MODES 之一，默认由环境变量 SUMMARIZE_QUOTE_MODE 控制；
+    两种模式返回的结构相同。
+
+    Returns:
+        dict: {问题: {"summary_list": [...]}}，每个问题下总结的顺序与批次顺序一致
+    """
+    # .env 在创建 OpenAIService 时才加载，之后再读取 SUMMARIZE_QUOTE_MODE
+    openai_service = OpenAIService(stage="summarize_themes")
+    quote_mode = quote_mode or os.environ.get("SUMMARIZE_QUOTE_MODE", QUOTE_MODE)
+    if quote_mode not in QUOTE_MODES:
+        raise ValueError(f"未知的原声模式: {quote_mode}，可选: {', '.join(QUOTE_MODES)}")
+    if openai_service.batch:
+        # 批量后端中所有批次需要同时在途才能放进同一个批次提交
+        max_concurrent_tasks = sum(
+            -(-len(data["content"]) // batch_size) for data in theme_count_data.values()
+        ) or 1
+    queue = asyncio.Queue(maxsize=max_concurrent_tasks * 2)
+    results = []
+    stream = open(stream_path, "w", encoding="utf-8") if stream_path else None
+
+    async def producer():
+        for item in iter_batches(theme_count_data, batch_size):
+            await queue.put(item)
+        for _ in range(max_concurrent_tasks):
+            await queue.put(None)
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            batch_idx, question, start, batch = item
+            try:
+                _, summary = await summarize_content(
+                    openai_service, format_batch(batch, start, quote_mode), question, quote_mode
+                )
+            except Exception as e:
+                print(f"总结失败（第 {batch_idx} 批）: {e}")
+                summary = None
+            if summary is None:
+                continue
+            if quote_mode == "ids":
+                summary, invalid = materialize_quotes(summary, batch, start)
+                if invalid:
+                    print(f"第 {batch_idx} 批有 {invalid} 个来源编号不在本批次内，已忽略")
+            results.append((batch_idx, question, summary))
+            if stream:
+                stream.write(
+                    json.dumps(
+                        {"batch_idx": batch_idx, "theme": question, "summary_list": summary},
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                )
+                stream.flush()
+
+    try:
+        await asyncio.gather(producer(), *(worker() for _ in range(max_concurrent_tasks)))
+    finally:
+        if stream:
+            stream.close()
+
     analyzed_data = {}
-    for theme, summary in results:
+    for _, theme, summary in sorted(results, key=lambda r: r[0]):
         if theme not in analyzed_data:
             analyzed_data[theme] = {"summary_list": []}
         analyzed_data[theme]["summary_list"].extend(summary)
@@ -66,11 +207,15 @@ async def summarize_by_theme(theme_count_data):
 
 def main():
     theme_count_data = read_json("analyze/analyze_results/theme_count.json")
-    analyzed_data = asyncio.run(summarize_by_theme(theme_count_data))
+    analyzed_data = asyncio.run(
+        summarize_by_theme(theme_count_data, stream_path="analyze/analyze_results/summarized.jsonl")
+    )
     write_json(analyzed_data, "analyze/analyze_results/summarized.json")
+    METRICS.dump("summarize_themes")
 
 
 if __name__ == "__main__":
-    main()
+    with profile_stage("summarize_themes"):
+        main()
 
         
@@ -0,0 +1,200 @@
+"""
+带全局并发上限、按节点重试和按节点断点保存的异步任务图执行器。
+
+每个节点是一次异步调用（通常是一次 LLM 请求），节点之间通过 deps 声明依赖，
+节点完成后可以通过 then 回调继续向图中添加依赖它的新节点（例如先合并一个主题下的总结，
+再按合并后的每个总结分别合并要点）。
+
+    - 同时执行的节点数受 max_concurrency 限制；
+    - 节点失败后按指数退避重试，重试用尽的节点记为失败，依赖它的节点不再执行；
+    - 设置 checkpoint_dir 后，每个成功的节点结果单独保存，键为 version、节点 id 与输入内容的摘要，
+      重新运行时输入未变的节点直接读取结果，只重跑失败或输入变化的节点；
+      节点的实现（提示词、输出格式等）变化时应修改 version，避免读到旧实现保存的结果；
+    - 运行结束后可以打印关键路径上各节点的耗时。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+
+
+class Node:
+    def __init__(self, node_id, func, inputs=None, deps=(), then=None, version=None):
+        self.node_id = node_id
+        self.func = func
+        self.inputs = inputs
+        self.deps = list(deps)
+        self.then = then
+        self.version = version
+        self.status = "pending"
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def key(self):
+        payload = json.dumps([self.version, self.node_id, self.inputs], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+class TaskGraph:
+    def __init__(self, max_concurrency=50, retries=3, backoff=2.0, checkpoint_dir=None, version=None):
+        """
+        version: 可 JSON 序列化的任意值，计入断点的键；不同 version 保存的断点互不复用
+        """
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.checkpoint_dir = checkpoint_dir
+        self.version = version
+        self.nodes = {}
+        self._new_nodes = []
+        self.started_at = None
+        self.finished_at = None
+
+    def add(self, node_id, func, inputs=None, deps=(), then=None):
+        """
+        添加节点，func(inputs) 返回 awaitable；then(result) 在节点成功后调用，可以继续 add 新节点。
+        """
+        if node_id in self.nodes:
+            raise ValueError(f"重复的节点: {node_id}")
+        node = Node(node_id, func, inputs, deps, then, self.version)
+        self.nodes[node_id] = node
+        self._new_nodes.append(node)
+        return node
+
+    # ------------------------------------------------------------------
+    # 断点
+    # ------------------------------------------------------------------
+
+    def _checkpoint_path(self, node):
+        return os.path.join(self.checkpoint_dir, f"{node.key}.json")
+
+    def _load_checkpoint(self, node):
+        if not self.checkpoint_dir:
+            return False
+        path = self._checkpoint_path(node)
+        if not os.path.exists(path):
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            node.result = json.load(f)["result"]
+        return True
+
+    def _save_checkpoint(self, node):
+        if not self.checkpoint_dir:
+            return
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = self._checkpoint_path(node)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"node_id": node.node_id, "result": node.result}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+
+    async def _execute(self, node, semaphore):
+        if self._load_checkpoint(node):
+            node.started_at = time.perf_counter()
+            node.status = "cached"
+        else:
+            for attempt in range(self.retries):
+                node.attempts = attempt + 1
+                try:
+                    async with semaphore:
+                        # 节点耗时从拿到并发额度开始计算，不含排队时间
+                        if node.started_at is None:
+                            node.started_at = time.perf_counter()
+                        node.result = await node.func(node.inputs)
+                    node.status = "ok"
+                    self._save_checkpoint(node)
+                    break
+                except Exception as e:
+                    node.error = e
+                    if attempt == self.retries - 1:
+                        node.status = "failed"
+                        print(f"节点 {node.node_id} 失败（共执行 {self.retries} 次）: {e}")
+                        break
+                    delay = self.backoff * 2**attempt * (1 + random.random())
+                    print(f"节点 {node.node_id} 第 {attempt + 1} 次执行失败: {e}，{delay:.1f}s 后重试")
+                    await asyncio.sleep(delay)
+        node.finished_at = time.perf_counter()
+        if node.status in ("ok", "cached") and node.then:
+            node.then(node.result)
+
+    async def run(self):
+        """执行图中所有节点（包括运行过程中新添加的节点），返回 {node_id: Node}"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.started_at = time.perf_counter()
+        waiting = []
+        running = {}
+
+        while True:
+            waiting += self._new_nodes
+            self._new_nodes = []
+
+            still_waiting = []
+            for node in waiting:
+                dep_status = [self.nodes[d].status for d in node.deps]
+                if any(s in ("failed", "blocked") for s in dep_status):
+                    node.status = "blocked"
+                elif all(s in ("ok", "cached") for s in dep_status):
+                    node.status = "running"
+                    running[asyncio.create_task(self._execute(node, semaphore))] = node
+                else:
+                    still_waiting.append(node)
+            waiting = still_waiting
+
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                running.pop(task)
+                task.result()
+
+        for node in waiting:
+            node.status = "blocked"
+        self.finished_at = time.perf_counter()
+        return self.nodes
+
+    # ------------------------------------------------------------------
+    # 报告
+    # ------------------------------------------------------------------
+
+    def critical_path(self):
+        """从最后完成的节点沿着最晚完成的依赖往回追溯"""
+        finished = [n for n in self.nodes.values() if n.finished_at is not None]
+        if not finished:
+            return []
+        node = max(finished, key=lambda n: n.finished_at)
+        path = [node]
+        while node.deps:
+            node = max((self.nodes[d] for d in node.deps), key=lambda n: n.finished_at or 0)
+            path.append(node)
+        return path[::-1]
+
+    def print_report(self):
+        statuses = {}
+        for node in self.nodes.values():
+            statuses[node.status] = statuses.get(node.status, 0) + 1
+        wall = (self.finished_at or 0) - (self.started_at or 0)
+        work = sum(n.duration for n in self.nodes.values() if n.status == "ok")
+        print(
+            f"\n任务图: 共 {len(self.nodes)} 个节点 "
+            + ", ".join(f"{status} {count}" for status, count in sorted(statuses.items()))
+        )
+        print(f"总耗时 {wall:.2f}s，节点累计耗时 {work:.2f}s，平均并行度 {work / wall if wall else 0:.1f}")
+        print("关键路径:")
+        for node in self.critical_path():
+            print(f"  {node.node_id:<50} {node.duration:>8.2f}s  {node.status}")
@@ -1,9 +1,8 @@
 from utils import *
+from count_themes import dedup_theme_content
 
 theme_count = read_json("analyze/analyze_results/theme_count.json")
 
-for theme in theme_count.values():
-    theme["content"] = list(set(theme["content"]))
+dedup_theme_content(theme_count)
 
 write_json(theme_count, "analyze/analyze_results/theme_count.json")
-    
\ No newline at end of file
@@ -1,45 +1,194 @@
 import json
 import os
 import re
-# from openai import OpenAI
-import openai
+import time
 
-from dotenv import load_dotenv
+import json_io
+from json_io import read_jsonl, write_jsonl
 
-load_dotenv()
+from llm_metrics import METRICS, CallStats
+from prompt import JSON_REPAIR_SYSTEM_PROMPT, JSON_REPAIR_USER_PROMPT
+from prompt_layout import INLINE, PREFIX_CACHE, layout_prompts, prefix_digest
+from model_router import ModelRouter, confidence_from_logprobs
+from records import to_json
+from schemas import SchemaError
+
+# 默认开启请求对冲的阶段：总结和合并阶段要等所有请求返回，阶段耗时由最慢的几个请求决定。
+# 设置了环境变量 OPENAI_HEDGE 时以它为准（1 为所有阶段开启，0 为全部关闭）
+HEDGED_STAGES = ("summarize_themes", "merge_duplicates")
 
 
 class OpenAIService:
     """Service class for OpenAI API interactions."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        structured_output=None,
+        stage="default",
+        prompt_layout=None,
+        backend=None,
+        hedge=None,
+        router=None,
+    ):
+        # openai、dotenv 和 asyncio 相关模块导入较慢，只在真正需要调用接口时才导入，
+        # 这样不调用模型的命令（去重、统计、导出等）启动时不必加载它们，也不依赖这些包
+        import openai
+        from dotenv import load_dotenv
+
+        # .env 中的接口配置在这里才加载，batch_backend、hedging 导入时会读取其中的环境变量
+        load_dotenv()
+        from batch_backend import get_batch_submitter
+        from hedging import HEDGER
+
         self.client = openai.AsyncOpenAI(
             api_key=os.environ.get("OPENAI_API_KEY"),
             base_url=os.environ.get("OPENAI_API_BASE"),
         )
+        # 是否使用服务端的结构化输出（json_schema）模式，默认由环境变量 OPENAI_STRUCTURED_OUTPUT 控制
+        if structured_output is None:
+            structured_output = os.environ.get("OPENAI_STRUCTURED_OUTPUT", "0") == "1"
+        self.structured_output = structured_output
+        # 调用指标里记录的阶段名，单次调用可以通过 infer(stage=...) 覆盖
+        self.stage = stage
+        # prompt 布局（prompt_layout.INLINE / PREFIX_CACHE），默认由环境变量 OPENAI_PROMPT_LAYOUT 控制
+        self.prompt_layout = prompt_layout or os.environ.get("OPENAI_PROMPT_LAYOUT", INLINE)
+        self._prefixes = {}
+        # interactive 为普通接口，batch / batch_local 见 batch_backend.py，默认由环境变量 OPENAI_BACKEND 控制
+        self.backend = backend or os.environ.get("OPENAI_BACKEND", "interactive")
+        self.batch = get_batch_submitter(self.backend) if self.backend != "interactive" else None
+        # 是否对慢请求发出对冲请求（见 hedging.py），默认按 HEDGED_STAGES 和环境变量 OPENAI_HEDGE 决定，批量后端中不生效
+        if hedge is None:
+            env = os.environ.get("OPENAI_HEDGE")
+            hedge = env == "1" if env is not None else stage in HEDGED_STAGES
+        self.hedger = HEDGER if hedge and not self.batch else None
+        # 按阶段选择模型（见 model_router.py），默认由环境变量 OPENAI_MODEL_ROUTING / OPENAI_MODEL_ROUTES 控制
+        self.router = router or ModelRouter.from_env()
+
+    def _check_prefix(self, stage, system_prompt):
+        """prefix_cache 布局下同一阶段的系统提示词应当不变，变化时提示缓存会失效"""
+        digest = prefix_digest(system_prompt)
+        seen = self._prefixes.setdefault(stage, set())
+        if seen and digest not in seen:
+            print(f"[{stage}] 系统提示词发生变化（第 {len(seen) + 1} 种），前缀缓存无法命中")
+        seen.add(digest)
 
     async def infer(
         self,
         user_prompt: str,
         system_prompt: str,
-        model: str = "gpt-4.1-mini",
+        model: str = None,
         temperature: float = 0.8,
         retries: int = 3,
+        response_schema=None,
+        stage=None,
+        prompt_vars=None,
     ):
-        """Make an inference using OpenAI API."""
+        """
+        Make an inference using OpenAI API.
+
+        传入 response_schema（schemas.ResponseSchema）时，返回结果会在本地按 schema 校验，
+        校验失败时只把出错的输出发给模型做一次修复，而不是重新发送整个 prompt。
+        传入 prompt_vars 时 system_prompt / user_prompt 为模板，按 self.prompt_layout 填入变量，
+        见 prompt_layout.py。
+        不传 model 时按阶段由 self.router 选择模型，便宜的模型结果无效或置信度过低时升级到下一档，
+        见 model_router.py。
+        每次调用的耗时、token、重试、缓存命中的 token 等信息会记录到 llm_metrics.METRICS。
+        """
+        stage = stage or self.stage
+        route = self.router.route(stage, model)
+        call = CallStats(stage, route.tiers[0])
+        system_prompt, user_prompt = layout_prompts(
+            system_prompt, user_prompt, prompt_vars, self.prompt_layout
+        )
+        if self.prompt_layout == PREFIX_CACHE:
+            self._check_prefix(call.stage, system_prompt)
+        status = "error"
+        try:
+            for tier, tier_model in enumerate(route.tiers):
+                last = tier == len(route.tiers) - 1
+                call.model = tier_model
+                call.logprobs = route.min_confidence is not None and not last
+                call.confidence = None
+                tier_started_at = time.time()
+                try:
+                    if response_schema is not None:
+                        result = await self._infer_structured(
+                            user_prompt,
+                            system_prompt,
+                            tier_model,
+                            temperature,
+                            retries,
+                            response_schema,
+                            call,
+                        )
+                    else:
+                        result = await self._infer_fenced(
+                            user_prompt, system_prompt, tier_model, temperature, retries, call
+                        )
+                except Exception:
+                    call.add_tier(tier_model, time.time() - tier_started_at, False)
+                    if last:
+                        raise
+                    print(f"[{stage}] {tier_model} 调用失败，升级到 {route.tiers[tier + 1]}")
+                    continue
+                confident = (
+                    not call.logprobs
+                    or call.confidence is None
+                    or call.confidence >= route.min_confidence
+                )
+                accepted = result is not None and confident
+                call.add_tier(tier_model, time.time() - tier_started_at, accepted)
+                if accepted or last:
+                    break
+                reason = "结果无效" if result is None else f"置信度 {call.confidence:.2f} 过低"
+                print(f"[{stage}] {tier_model} {reason}，升级到 {route.tiers[tier + 1]}")
+            status = "ok" if result is not None else "invalid"
+            return result
+        finally:
+            METRICS.record(call, status)
+
+    async def _complete(self, messages, model, temperature, call, response_schema=None):
+        kwargs = {}
+        if response_schema is not None and self.structured_output:
+            kwargs["response_format"] = response_schema.response_format()
+        if call.logprobs:
+            kwargs["logprobs"] = True
+        if self.batch:
+            completion = await self.batch.complete(
+                model=model, messages=messages, temperature=temperature, **kwargs
+            )
+        else:
+            def request():
+                return self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    timeout=300,
+                    temperature=temperature,
+                    **kwargs,
+                )
+
+            if self.hedger:
+                completion = await self.hedger.run((call.stage, model), request, call)
+            else:
+                completion = await request()
+        call.add_usage(getattr(completion, "usage", None))
+        if call.logprobs:
+            call.confidence = confidence_from_logprobs(completion)
+        return completion.choices[0].message.content
+
+    async def _infer_fenced(self, user_prompt, system_prompt, model, temperature, retries, call):
         for attempt in range(retries):
+            call.retries = attempt
             try:
-                completion = self.client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        ({"role": "system", "content": system_prompt}),
+                res_raw = await self._complete(
+                    [
+                        {"role": "system", "content": system_prompt},
                         {"role": "user", "content": user_prompt},
                     ],
-                    timeout=300,
-                    temperature=temperature,
+                    model,
+                    temperature,
+                    call,
                 )
-                completion_result = await completion
-                res_raw = completion_result.choices[0].message.content
                 # Try to parse JSON if present
                 pattern = re.compile(r"```json\s*([\s\S]*?)\s*```")
                 matches = pattern.findall(res_raw) if res_raw else None
@@ -47,6 +196,7 @@ class OpenAIService:
                     try:
                         return json.loads(matches[0], strict=False)
                     except json.JSONDecodeError as e:
+                        call.parse_failures += 1
                         print(f"Error parsing JSON: {matches[0]}, retrying...")
                         user_prompt += f"""**请严格按照要求的json格式返回结果，确保json格式正确，且不要返回多余的解释和注释**
                         请注意避免出现如下报错：
@@ -56,6 +206,7 @@ class OpenAIService:
                         """
                         continue
                 else:
+                    call.parse_failures += 1
                     print(f"JSON not found in {res_raw}, retrying...")
                     user_prompt += "**请严格按照要求的json格式返回结果，确保json格式正确，且不要返回多余的解释和注释**"
                     continue
@@ -65,12 +216,62 @@ class OpenAIService:
                 if attempt == retries - 1:
                     raise
 
+        print(f"Failed to get valid JSON after {retries} attempts, returning None")
+        return None
+
+    async def _infer_structured(
+        self, user_prompt, system_prompt, model, temperature, retries, response_schema, call
+    ):
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        for attempt in range(retries):
+            call.retries = attempt
+            try:
+                res_raw = await self._complete(messages, model, temperature, call, response_schema)
+                try:
+                    return response_schema.parse(res_raw)
+                except (json.JSONDecodeError, SchemaError) as e:
+                    call.parse_failures += 1
+                    print(f"Invalid {response_schema.name} output ({e}), repairing...")
+                    error = e
+
+                repaired_raw = await self._complete(
+                    [
+                        {"role": "system", "content": JSON_REPAIR_SYSTEM_PROMPT},
+                        {
+                            "role": "user",
+                            "content": JSON_REPAIR_USER_PROMPT.format(
+                                schema=json.dumps(response_schema.wire_schema, ensure_ascii=False),
+                                raw_output=res_raw,
+                                error=error,
+                            ),
+                        },
+                    ],
+                    model,
+                    0,
+                    call,
+                    response_schema,
+                )
+                try:
+                    return response_schema.parse(repaired_raw)
+                except (json.JSONDecodeError, SchemaError) as e:
+                    call.parse_failures += 1
+                    print(f"Repair failed (attempt {attempt + 1}/{retries}): {e}")
+
+            except Exception as e:
+                print(f"OpenAI API call failed (attempt {attempt + 1}/{retries}): {e}")
+                if attempt == retries - 1:
+                    raise
+
+        print(f"Failed to get valid {response_schema.name} output after {retries} attempts, returning None")
+        return None
+
 
 def read_json(file_path):
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        return data
+        return json_io.read_json(file_path)
     except FileNotFoundError:
         print(f"File not found: {file_path}")
         raise
@@ -78,10 +279,10 @@ def read_json(file_path):
         print(f"Error decoding JSON: {e}")
         raise
     
-def write_json(data, file_path):
+def write_json(data, file_path, indent=4):
+    """只由下一阶段读取的中间结果传 indent=None，输出紧凑格式（见 json_io.py）"""
     try:
-        with open(file_path, 'w', encoding='utf-8') as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
+        json_io.write_json(data, file_path, indent=indent, default=to_json)
     except IOError as e:
         print(f"Error writing to file: {e}")
         raise
@@ -0,0 +1,274 @@
+"""
+核对 summarize_themes 输出中的用户原声（original_content）是否确实摘自输入内容。
+
+summarize_theme_system_prompt 要求原声直接从帖子中抽取、不做修改，但模型仍会改写、拼接甚至编造原声。
+核对按主题进行：把该主题下所有原声（按省略号 "..." 拆成片段）编译进一个 Aho–Corasick 自动机，
+对该主题的全部输入内容只扫描一遍，就能得到每个片段出现在哪些内容中；一条原声的所有片段都出现在
+同一条内容里（忽略空白和大小写），即视为逐字摘录。与某条内容完全相同的原声（最常见的情况）直接查表。
+
+找不到出处的原声按 mode 处理:
+    flag     只写入报告，不修改总结（报告中附上模糊匹配到的原文供人工核对）
+    anchor   在字符二元组最相近的几条内容中做模糊匹配，相似度不低于阈值时替换为原文中对应的片段，否则删除
+    drop     删除
+anchor / drop 模式下，原声被全部删除的要点、要点被全部删除的总结也一并删除。
+
+用法（在仓库根目录下运行）:
+    python analyze/analyze_scripts/verify_quotes.py                  # 默认 anchor
+    python analyze/analyze_scripts/verify_quotes.py --mode flag
+"""
+import argparse
+import copy
+import re
+import time
+from bisect import bisect_right
+from collections import Counter
+from difflib import SequenceMatcher
+from operator import add
+
+from json_io import read_json, write_json
+from keyword_matcher import AhoCorasick
+
+THEME_COUNT_PATH = "analyze/analyze_results/theme_count_dedup.json"
+SUMMARIZED_PATH = "analyze/analyze_results/summarized.json"
+OUTPUT_PATH = "analyze/analyze_results/summarized_verified.json"
+REPORT_PATH = "analyze/analyze_results/quote_report.json"
+
+MODES = ("flag", "anchor", "drop")
+# 模糊匹配的相似度（与 difflib 的 ratio 相同）不低于该值才替换为原文
+ANCHOR_THRESHOLD = 0.8
+# 模糊匹配时只比较字符二元组重合最多的几条内容
+ANCHOR_CANDIDATES = 3
+ELLIPSIS_PATTERN = re.compile(r"\s*(?:\.{3,}|…+|。{3,})\s*")
+# 拼接各条内容时使用的分隔符，保证片段不会跨内容匹配
+SEPARATOR = "\x00"
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize(text):
+    """与 keyword_matcher.normalize 相同的归一化（转小写、去掉空白），这里不需要原文下标"""
+    return WHITESPACE_PATTERN.sub("", text or "").lower()
+
+
+def split_fragments(quote):
+    """模型会用省略号拼接同一条内容中不相邻的几句话，每一段分别核对"""
+    return [fragment for fragment in ELLIPSIS_PATTERN.split(quote) if fragment.strip()]
+
+
+class ThemeSource:
+    """一个主题的全部输入内容"""
+
+    def __init__(self, contents):
+        self.contents = list(contents)
+        self.normalized = [normalize(content) for content in self.contents]
+        self.exact = {}
+        for index, text in enumerate(self.normalized):
+            self.exact.setdefault(text, index)
+        self.text = SEPARATOR.join(self.normalized)
+        self.starts = []
+        position = 0
+        for text in self.normalized:
+            self.starts.append(position)
+            position += len(text) + len(SEPARATOR)
+        self._bigrams = None
+
+    def locate(self, quotes):
+        """
+        查找每条原声出自哪条内容，所有原声共用一个自动机，对内容只扫描一遍。
+
+        Returns:
+            list: 与 quotes 一一对应的内容下标，找不到时为 None
+        """
+        located = [None] * len(quotes)
+        pending = {}
+        fragment_ids = {}
+        automaton = AhoCorasick()
+        for quote_index, quote in enumerate(quotes):
+            index = self.exact.get(normalize(quote))
+            if index is not None:
+                located[quote_index] = index
+                continue
+            fragments = [normalize(fragment) for fragment in split_fragments(quote)]
+            if not fragments:
+                continue
+            pending[quote_index] = fragments
+            for fragment in fragments:
+                if fragment not in fragment_ids:
+                    fragment_ids[fragment] = len(fragment_ids)
+                    automaton.add(fragment, fragment_ids[fragment])
+        if not pending:
+            return located
+
+        found = [set() for _ in fragment_ids]
+        for start, _, fragment_id in automaton.iter_matches(self.text):
+            found[fragment_id].add(bisect_right(self.starts, start) - 1)
+        for quote_index, fragments in pending.items():
+            common = set.intersection(*(found[fragment_ids[fragment]] for fragment in fragments))
+            if common:
+                located[quote_index] = min(common)
+        return located
+
+    def _candidates(self, quote):
+        """字符二元组重合最多的几条内容；出现在大部分内容中的二元组区分度低，不参与计数"""
+        if self._bigrams is None:
+            self._bigrams = {}
+            for index, text in enumerate(self.normalized):
+                for gram in set(map(add, text, text[1:])):
+                    self._bigrams.setdefault(gram, []).append(index)
+        normalized = normalize(quote)
+        postings = sorted(
+            (self._bigrams.get(gram, ()) for gram in set(map(add, normalized, normalized[1:]))), key=len
+        )
+        limit = max(len(self.contents) // 10, ANCHOR_CANDIDATES)
+        counts = Counter()
+        for posting in [p for p in postings if len(p) <= limit] or postings[:3]:
+            counts.update(posting)
+        return [index for index, _ in counts.most_common(ANCHOR_CANDIDATES)]
+
+    def anchor(self, quote):
+        """
+        在最相近的几条内容中找出与原声最相似的原文片段。
+
+        Returns:
+            (原文片段, 相似度)，找不到任何相近内容时为 (None, 0.0)
+        """
+        best = (None, 0.0)
+        fragments = split_fragments(quote)
+        for index in self._candidates(quote):
+            content = self.contents[index]
+            spans = []
+            matched = 0
+            for fragment in fragments:
+                blocks = [
+                    block
+                    for block in SequenceMatcher(None, fragment, content, autojunk=False).get_matching_blocks()
+                    if block.size
+                ]
+                if not blocks:
+                    spans = None
+                    break
+                matched += sum(block.size for block in blocks)
+                spans.append(content[blocks[0].b : blocks[-1].b + blocks[-1].size])
+            if not spans:
+                continue
+            # 与 SequenceMatcher.ratio 相同的定义，原文片段过长（匹配的字符很分散）时相似度也会降低
+            similarity = 2 * matched / (sum(map(len, fragments)) + sum(map(len, spans)))
+            if similarity > best[1]:
+                best = (" ... ".join(spans), similarity)
+        return best
+
+
+def verify_summaries(summarized, theme_contents, mode="anchor", threshold=ANCHOR_THRESHOLD):
+    """
+    Args:
+        summarized: {问题: {"summary_list": [...]}}，summarize_by_theme 的输出
+        theme_contents: {问题: [内容, ...]}，各问题下送去总结的全部内容
+    Returns:
+        (核对后的 summarized（不修改传入的对象）, 报告)
+    """
+    if mode not in MODES:
+        raise ValueError(f"未知的处理方式: {mode}，可选: {', '.join(MODES)}")
+    verified = copy.deepcopy(summarized)
+    counts = Counter()
+    entries = []
+
+    for theme, theme_data in verified.items():
+        if theme not in theme_contents:
+            print(f"找不到主题的输入内容，跳过核对: {theme}")
+            continue
+        source = ThemeSource(theme_contents[theme])
+        points = [
+            point
+            for summary in theme_data.get("summary_list", [])
+            for point in summary.get("points", [])
+        ]
+        quotes = [quote for point in points for quote in point.get("original_content") or []]
+        located = iter(source.locate(quotes))
+
+        for summary in theme_data.get("summary_list", []):
+            for point in summary.get("points", []):
+                kept = []
+                for quote in point.get("original_content") or []:
+                    if next(located) is not None:
+                        counts["verified"] += 1
+                        kept.append(quote)
+                        continue
+                    entry = {
+                        "theme": theme,
+                        "summary": summary.get("summary"),
+                        "point": point.get("point"),
+                        "quote": quote,
+                    }
+                    if mode != "drop":
+                        entry["anchor"], entry["similarity"] = source.anchor(quote)
+                        entry["similarity"] = round(entry["similarity"], 3)
+                    if mode == "flag":
+                        entry["action"] = "flagged"
+                        kept.append(quote)
+                    elif mode == "anchor" and entry["similarity"] >= threshold:
+                        entry["action"] = "anchored"
+                        kept.append(entry["anchor"])
+                    else:
+                        entry["action"] = "dropped"
+                    counts[entry["action"]] += 1
+                    entries.append(entry)
+                point["original_content"] = list(dict.fromkeys(kept))
+
+            if mode != "flag":
+                before = len(summary.get("points", []))
+                summary["points"] = [p for p in summary.get("points", []) if p.get("original_content")]
+                counts["points_dropped"] += before - len(summary["points"])
+        if mode != "flag":
+            before = len(theme_data.get("summary_list", []))
+            theme_data["summary_list"] = [s for s in theme_data.get("summary_list", []) if s.get("points")]
+            counts["summaries_dropped"] += before - len(theme_data["summary_list"])
+
+    report = {"mode": mode, "threshold": threshold, "counts": dict(counts), "quotes": entries}
+    return verified, report
+
+
+def print_report(report):
+    counts = report["counts"]
+    total = counts.get("verified", 0) + len(report["quotes"])
+    print(
+        f"核对原声 {total} 条: 逐字摘录 {counts.get('verified', 0)} 条，"
+        f"替换为原文 {counts.get('anchored', 0)} 条，删除 {counts.get('dropped', 0)} 条，"
+        f"仅标记 {counts.get('flagged', 0)} 条；"
+        f"删除要点 {counts.get('points_dropped', 0)} 个，删除总结 {counts.get('summaries_dropped', 0)} 个"
+    )
+
+
+def theme_contents_by_question(theme_count, questions_map):
+    """theme_count_dedup.json 以主题字母为键，summarized.json 以问题为键"""
+    return {questions_map[theme]: data["content"] for theme, data in theme_count.items() if theme in questions_map}
+
+
+def main(
+    theme_count_path=THEME_COUNT_PATH,
+    summarized_path=SUMMARIZED_PATH,
+    output_path=OUTPUT_PATH,
+    report_path=REPORT_PATH,
+    mode="anchor",
+    threshold=ANCHOR_THRESHOLD,
+):
+    from summarize_themes import questions_map
+
+    start = time.perf_counter()
+    theme_contents = theme_contents_by_question(read_json(theme_count_path), questions_map)
+    verified, report = verify_summaries(read_json(summarized_path), theme_contents, mode, threshold)
+    write_json(verified, output_path, indent=None)
+    write_json(report, report_path)
+    print_report(report)
+    print(f"耗时 {time.perf_counter() - start:.2f}s，报告已保存到 {report_path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="核对总结中的用户原声是否摘自原文")
+    parser.add_argument("--theme-count", default=THEME_COUNT_PATH)
+    parser.add_argument("--input", default=SUMMARIZED_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--report", default=REPORT_PATH)
+    parser.add_argument("--mode", choices=MODES, default="anchor")
+    parser.add_argument("--threshold", type=float, default=ANCHOR_THRESHOLD)
+    args = parser.parse_args()
+    main(args.theme_count, args.input, args.output, args.report, args.mode, args.threshold)
@@ -8,10 +8,16 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 
+import os
+import sys
 import time
 
 from autohome_utils import *
 
+# 剖析工具（PROFILE 环境变量开启）在 analyze/analyze_scripts 下
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analyze", "analyze_scripts"))
+from profiling import profile_stage
+
 chrome_options = Options()
 chrome_options.add_argument('--disable-plugins-discovery')
 chrome_options.add_argument('--mute-audio')
@@ -265,5 +271,6 @@ def main():
     print(f'Total time cost: {round(end_time - start_time)} seconds')
     
 if __name__ == "__main__":
-    main()
+    with profile_stage("autohome_scrape"):
+        main()
     
\ No newline at end of file
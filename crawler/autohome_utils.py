@@ -13,10 +13,15 @@ import time
 import os
 import random
 import pickle
+import sys
     
 from datetime import datetime, timedelta
 import re
 
+# 与分析脚本共用的 JSON 读写（原子写入、按扩展名压缩）在 analyze/analyze_scripts 下
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analyze", "analyze_scripts"))
+import json_io
+
 
 def get_cookies(user_profile_url, cookies_file):
     # 首次登录获取cookie文件
@@ -98,9 +103,7 @@ def manual_login(driver, cookies_file):
 
 def read_json(file_path):
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        return data
+        return json_io.read_json(file_path)
     except FileNotFoundError:
         print(f"File not found: {file_path}")
         raise
@@ -110,8 +113,7 @@ def read_json(file_path):
     
 def write_json(data, file_path):
     try:
-        with open(file_path, 'w', encoding='utf-8') as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
+        json_io.write_json(data, file_path)
     except IOError as e:
         print(f"Error writing to file: {e}")
         raise
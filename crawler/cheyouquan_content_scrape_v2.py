@@ -8,11 +8,17 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 
+import sys
 import time
 import os
 import random
 import pickle
 
+# 剖析工具（PROFILE 环境变量开启）和共用的 JSON 读写在 analyze/analyze_scripts 下
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analyze", "analyze_scripts"))
+import json_io
+from profiling import profile_stage
+
 chrome_options = Options()
 chrome_options.add_argument('--disable-plugins-discovery')
 chrome_options.add_argument('--mute-audio')
@@ -215,19 +221,18 @@ def main():
 
     driver.set_window_size(1920, 1080)
         
-    with open('crawler/dongchedi_posts.json', 'r', encoding='utf-8') as file:
-        results = json.load(file)
+    results = json_io.read_json('crawler/dongchedi_posts.json')
     
     for i in range(totalPages):
         posts = get_posts_by_page(driver, url, i+offset+1)
         results["lixiang_l8"].extend(posts)
         time.sleep(random.uniform(1, 5))
     
-    with open('crawler/dongchedi_posts.json', 'w', encoding='utf-8') as file:
-        json.dump(results, file, ensure_ascii=False, indent=4)
+    json_io.write_json(results, 'crawler/dongchedi_posts.json')
         
     end_time = time.perf_counter()
     print(f'Total time cost: {round(end_time - start_time)} seconds')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with profile_stage("cheyouquan_content_scrape"):
+        main()
\ No newline at end of file
@@ -8,11 +8,17 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 
+import sys
 import time
 import os
 import random
 import pickle
 
+# 剖析工具（PROFILE 环境变量开启）和共用的 JSON 读写在 analyze/analyze_scripts 下
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analyze", "analyze_scripts"))
+import json_io
+from profiling import profile_stage
+
 chrome_options = Options()
 chrome_options.add_argument('--disable-plugins-discovery')
 chrome_options.add_argument('--mute-audio')
@@ -185,11 +191,9 @@ def main():
 
     driver.set_window_size(1920, 1080)
         
-    with open('crawler/dongchedi_posts.json', 'r', encoding='utf-8') as file:
-        results = json.load(file)
+    results = json_io.read_json('crawler/dongchedi_posts.json')
     
-    with open('crawler/cheyouquan_progress.json', 'r', encoding='utf-8') as file:
-        progress = json.load(file)
+    progress = json_io.read_json('crawler/cheyouquan_progress.json')
     for product_name, posts in results.items():
         for post in posts:
             url = post.get('url', None)
@@ -199,15 +203,15 @@ def main():
             post['replies'].extend(replies)
             print(f"Replies for post {url}: {replies}")
             
-            with open('crawler/dongchedi_posts.json', 'w', encoding='utf-8') as file:
-                json.dump(results, file, ensure_ascii=False, indent=4)
+            # 原子写入，爬取中途被中断也不会留下写了一半的结果和进度文件
+            json_io.write_json(results, 'crawler/dongchedi_posts.json')
             progress.append(url)
-            with open('crawler/cheyouquan_progress.json', 'w', encoding='utf-8') as file:
-                json.dump(progress, file, ensure_ascii=False, indent=4)
+            json_io.write_json(progress, 'crawler/cheyouquan_progress.json')
             time.sleep(random.uniform(1, 3))
         
     end_time = time.perf_counter()
     print(f'Total time cost: {round(end_time - start_time)} seconds')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with profile_stage("cheyouquan_replies_scrape"):
+        main()
\ No newline at end of file
@@ -1,10 +1,28 @@
 // src/app/page.js (或者任何你想展示数据的页面)
 "use client";
+import { useEffect, useState } from "react";
 import SummarizedDataViewer from "../components/SummarizedDataViewer"; // 调整路径
-import jsonData from "../../analyze/analyze_results/merged_summarized_data.json";
+
+// 由 analyze/analyze_scripts/export_summaries.py 生成，各主题的内容在展开时再按需加载
+const MANIFEST_URL = "/data/summaries/manifest.json";
 
 export default function HomePage() {
-  if (!jsonData) {
+  const [manifest, setManifest] = useState(null);
+  const [error, setError] = useState(null);
+
+  useEffect(() => {
+    fetch(MANIFEST_URL)
+      .then((res) => {
+        if (!res.ok) {
+          throw new Error(`HTTP ${res.status}`);
+        }
+        return res.json();
+      })
+      .then(setManifest)
+      .catch((e) => setError(e.message));
+  }, []);
+
+  if (error) {
     return (
       <p className="text-center text-red-600 p-8">加载数据失败: {error}</p>
     );
@@ -18,7 +36,11 @@ export default function HomePage() {
         </h1>
       </header>
       <main className="w-full">
-        <SummarizedDataViewer rawData={jsonData} />
+        {manifest ? (
+          <SummarizedDataViewer manifest={manifest} />
+        ) : (
+          <p className="text-center text-gray-600 p-8">加载中...</p>
+        )}
       </main>
     </div>
   );
@@ -1,74 +1,277 @@
 // src/components/SummarizedDataViewer.js
 "use client";
-import React, { useState, useMemo } from "react"; // 引入 useMemo
+import React, { useState, useMemo, useEffect } from "react"; // 引入 useMemo
 import TableOfContents from "./TableOfContents";
 import ReactMarkdown from "react-markdown";
 import MarkdownComponents from "./ChatWidget/MarkdownComponents";
 
-const SummarizedDataViewer = ({ rawData }) => {
+// 各主题的分片在第一次展开时才从 /data/summaries/ 加载，见 analyze/analyze_scripts/export_summaries.py
+const SUMMARIES_BASE_URL = "/data/summaries/";
+
+const sortByDiscussion = (summaryList, themeTotalOriginalContentCount) =>
+  [...summaryList].sort((a, b) => {
+    let aContentCount = 0;
+    a.points?.forEach((p) => {
+      aContentCount += p.original_content?.length || 0;
+    });
+
+    let bContentCount = 0;
+    b.points?.forEach((p) => {
+      bContentCount += p.original_content?.length || 0;
+    });
+
+    const aPercentage =
+      themeTotalOriginalContentCount > 0
+        ? aContentCount / themeTotalOriginalContentCount
+        : 0;
+    const bPercentage =
+      themeTotalOriginalContentCount > 0
+        ? bContentCount / themeTotalOriginalContentCount
+        : 0;
+
+    return bPercentage - aPercentage; // 降序排序
+  });
+
+const ThemeSection = ({ themeEntry, isOpen, shard, onToggle }) => {
   const [expandedPoints, setExpandedPoints] = useState({});
-  const data = rawData["data"];
+  const { theme, id: themeId } = themeEntry;
+  const themeTotalOriginalContentCount = themeEntry.count;
 
-  if (!data || Object.keys(data).length === 0) {
-    return <p className="text-gray-600 text-lg p-4">暂无数据可展示。</p>;
-  }
+  // 使用 useMemo 优化排序过程，仅当分片加载完成时计算
+  const summaryList = useMemo(
+    () =>
+      shard?.data
+        ? sortByDiscussion(
+            shard.data.summary_list || [],
+            themeTotalOriginalContentCount,
+          )
+        : [],
+    [shard, themeTotalOriginalContentCount],
+  );
+
+  // 从目录点击某个总结时，分片加载完成后再滚动到该总结
+  useEffect(() => {
+    if (!isOpen || !shard?.data) {
+      return;
+    }
+    const target = decodeURIComponent(window.location.hash.slice(1));
+    if (target.startsWith(themeId)) {
+      document.getElementById(target)?.scrollIntoView();
+    }
+  }, [isOpen, shard, themeId]);
 
-  const toggleExpandPoint = (themeIndex, originalSummaryIndex, pointIndex) => {
-    const key = `${themeIndex}-${originalSummaryIndex}-${pointIndex}`;
+  const toggleExpandPoint = (originalSummaryIndex, pointIndex) => {
+    const key = `${originalSummaryIndex}-${pointIndex}`;
     setExpandedPoints((prev) => ({
       ...prev,
       [key]: !prev[key],
     }));
   };
 
-  // 使用 useMemo 优化排序和计算过程，仅当 data 变化时重新计算
-  const processedData = useMemo(() => {
-    return Object.entries(data).map(([theme, themeData]) => {
-      let themeTotalOriginalContentCount = 0;
-      themeData.summary_list?.forEach((summaryItem) => {
-        summaryItem.points?.forEach((pointItem) => {
-          themeTotalOriginalContentCount +=
-            pointItem.original_content?.length || 0;
-        });
-      });
+  let content = null;
+  if (isOpen && (!shard || shard.loading)) {
+    content = <p className="text-gray-500 italic">加载中...</p>;
+  } else if (isOpen && shard.error) {
+    content = (
+      <p className="text-red-600 italic">加载失败: {shard.error}</p>
+    );
+  } else if (isOpen) {
+    content = (
+      <>
+          {summaryList &&
+          summaryList.length > 0 ? (
+            summaryList.map((summaryItem, summaryIndex) => {
+              const summaryId = `${themeId}-${summaryItem.summary}`;
+              let summaryOriginalContentCount = 0;
+              summaryItem.points?.forEach((pointItem) => {
+                summaryOriginalContentCount +=
+                  pointItem.original_content?.length || 0;
+              });
+
+              const discussionPercentage =
+                themeTotalOriginalContentCount > 0
+                  ? (
+                      (summaryOriginalContentCount /
+                        themeTotalOriginalContentCount) *
+                      100
+                    ).toFixed(2)
+                  : 0;
+              const originalSummaryIndex = shard.data.summary_list.findIndex(
+                (s) => s.summary === summaryItem.summary,
+              );
+
+              return (
+                <div
+                  key={summaryIndex}
+                  id={summaryId}
+                  className="mb-6 p-4 bg-indigo-50 border-l-4 border-indigo-500 rounded-r-md"
+                >
+                  <div className="flex justify-between items-start mb-3">
+                    <h3 className="text-xl font-semibold text-indigo-600 flex-1 break-words">
+                      {summaryItem.summary}
+                    </h3>
+                    {themeTotalOriginalContentCount > 0 && (
+                      <span className="ml-4 px-2 py-1 text-xs font-semibold text-indigo-700 bg-indigo-200 rounded-full whitespace-nowrap">
+                        讨论度: {discussionPercentage}%
+                      </span>
+                    )}
+                  </div>
+                  {summaryItem.points &&
+                  summaryItem.points.length > 0 ? (
+                    <ul className="list-none pl-0">
+                      {summaryItem.points.map(
+                        (pointItem, pointIndex) => {
+                          const pointKey = `${originalSummaryIndex}-${pointIndex}`;
+                          const isExpanded = !!expandedPoints[pointKey];
+                          const displayContents = isExpanded
+                            ? pointItem.original_content
+                            : pointItem.original_content?.slice(0, 2) ||
+                              [];
+
+                          return (
+                            <li
+                              key={pointIndex}
+                              className="mb-4 p-3 bg-white border border-gray-300 rounded-md shadow-xs"
+                            >
+                              <p className="text-base text-gray-700 mb-2 break-words">
+                                <strong className="font-medium text-gray-900">
+                                  要点：
+                                </strong>{" "}
+                                {pointItem.point}
+                              </p>
+                              {pointItem.original_content &&
+                                pointItem.original_content.length >
+                                  0 && (
+                                  <div className="mt-2 pl-4 border-l-2 border-gray-300">
+                                    <p className="text-sm font-medium text-gray-700 mb-1">
+                                      <strong>
+                                        典型用户原声 (
+                                        {
+                                          pointItem.original_content
+                                            .length
+                                        }
+                                        )：
+                                      </strong>
+                                    </p>
+                                    <ul className="list-disc pl-5 space-y-1">
+                                      {displayContents.map(
+                                        (content, contentIndex) => (
+                                          <li
+                                            key={contentIndex}
+                                            className="text-sm text-gray-600 leading-relaxed break-words"
+                                          >
+                                            {content}
+                                          </li>
+                                        ),
+                                      )}
+                                    </ul>
+                                    {pointItem.original_content.length >
+                                      2 && (
+                                      <button
+                                        onClick={() =>
+                                          toggleExpandPoint(
+                                            originalSummaryIndex,
+                                            pointIndex,
+                                          )
+                                        }
+                                        className="mt-2 text-xs text-indigo-600 hover:text-indigo-800 font-medium focus:outline-none
+                                                                        cursor-pointer"
+                                      >
+                                        {isExpanded
+                                          ? "收起"
+                                          : `...等 ${pointItem.original_content.length - 2} 条更多`}
+                                      </button>
+                                    )}
+                                  </div>
+                                )}
+                            </li>
+                          );
+                        },
+                      )}
+                    </ul>
+                  ) : (
+                    <p className="text-gray-500 italic">
+                      该总结下无具体要点。
+                    </p>
+                  )}
+                </div>
+              );
+            })
+          ) : (
+            <p className="text-gray-500 italic">该主题下无总结内容。</p>
+          )}
+      </>
+    );
+  }
+
+  return (
+    <div
+      id={themeId}
+      className="mb-8 p-6 bg-white border border-gray-200 rounded-md shadow-sm flex flex-col"
+    >
+      <h2
+        onClick={onToggle}
+        className="text-2xl font-bold text-indigo-700 mb-6 pb-3 border-b-2 border-indigo-500 cursor-pointer flex justify-between items-start"
+      >
+        <span className="flex-1 break-words">{theme.replaceAll("*", "")}</span>
+        <span className="ml-4 text-sm font-medium text-indigo-500 whitespace-nowrap">
+          {themeTotalOriginalContentCount} 条原声 {isOpen ? "收起" : "展开"}
+        </span>
+      </h2>
+      <div className="flex-grow">{content}</div>
+    </div>
+  );
+};
 
-      const sortedSummaryList = themeData.summary_list
-        ? [...themeData.summary_list].sort((a, b) => {
-            let aContentCount = 0;
-            a.points?.forEach((p) => {
-              aContentCount += p.original_content?.length || 0;
-            });
+const SummarizedDataViewer = ({ manifest }) => {
+  const [openThemes, setOpenThemes] = useState({});
+  const [shards, setShards] = useState({});
+  const themes = manifest.themes;
 
-            let bContentCount = 0;
-            b.points?.forEach((p) => {
-              bContentCount += p.original_content?.length || 0;
-            });
+  if (!themes || themes.length === 0) {
+    return <p className="text-gray-600 text-lg p-4">暂无数据可展示。</p>;
+  }
 
-            const aPercentage =
-              themeTotalOriginalContentCount > 0
-                ? aContentCount / themeTotalOriginalContentCount
-                : 0;
-            const bPercentage =
-              themeTotalOriginalContentCount > 0
-                ? bContentCount / themeTotalOriginalContentCount
-                : 0;
+  const loadShard = (themeEntry) => {
+    if (shards[themeEntry.id]) {
+      return;
+    }
+    setShards((prev) => ({ ...prev, [themeEntry.id]: { loading: true } }));
+    fetch(SUMMARIES_BASE_URL + themeEntry.shard)
+      .then((res) => {
+        if (!res.ok) {
+          throw new Error(`HTTP ${res.status}`);
+        }
+        return res.json();
+      })
+      .then((shard) =>
+        setShards((prev) => ({ ...prev, [themeEntry.id]: { data: shard } })),
+      )
+      .catch((e) =>
+        setShards((prev) => ({
+          ...prev,
+          [themeEntry.id]: { error: e.message },
+        })),
+      );
+  };
 
-            return bPercentage - aPercentage; // 降序排序
-          })
-        : [];
+  const openTheme = (themeEntry) => {
+    setOpenThemes((prev) => ({ ...prev, [themeEntry.id]: true }));
+    loadShard(themeEntry);
+  };
 
-      return {
-        theme,
-        themeData: { ...themeData, summary_list: sortedSummaryList },
-        themeTotalOriginalContentCount,
-      };
-    });
-  }, [data]);
+  const toggleTheme = (themeEntry) => {
+    if (openThemes[themeEntry.id]) {
+      setOpenThemes((prev) => ({ ...prev, [themeEntry.id]: false }));
+    } else {
+      openTheme(themeEntry);
+    }
+  };
 
   return (
     <div className="flex gap-6">
       <div className="hidden lg:block w-64 flex-shrink-0">
-        <TableOfContents data={data} />
+        <TableOfContents themes={themes} onSelectTheme={openTheme} />
       </div>
       <div className="font-sans text-gray-800 bg-gray-50 rounded-lg shadow-lg grid grid-cols-1 md:grid-cols-2 w-full gap-6 p-6">
         <div className=" text-black p-8 mb-12 bg-white shadow-lg rounded-lg">
@@ -83,7 +286,7 @@ const SummarizedDataViewer = ({ rawData }) => {
               components={MarkdownComponents}
               className="markdown-content"
             >
-              {rawData.total_summary}
+              {manifest.total_summary}
             </ReactMarkdown>
           </div>
         </div>
@@ -99,157 +302,19 @@ const SummarizedDataViewer = ({ rawData }) => {
               components={MarkdownComponents}
               className="markdown-content"
             >
-              {rawData.suggestion}
+              {manifest.suggestion}
             </ReactMarkdown>
           </div>
         </div>
-        {processedData.map(
-          (
-            { theme, themeData, themeTotalOriginalContentCount },
-            themeIndex,
-          ) => {
-            // 将主题名称转换为有效的 HTML id
-            const themeId = theme.replaceAll("*", "").replaceAll(" ", "-");
-            return (
-              <div
-                key={theme}
-                id={themeId}
-                className="mb-8 p-6 bg-white border border-gray-200 rounded-md shadow-sm flex flex-col"
-              >
-                <h2 className="text-2xl font-bold text-indigo-700 mb-6 pb-3 border-b-2 border-indigo-500">
-                  {theme.replaceAll("*", "")}
-                </h2>
-                <div className="flex-grow">
-                  {themeData.summary_list &&
-                  themeData.summary_list.length > 0 ? (
-                    themeData.summary_list.map((summaryItem, summaryIndex) => {
-                      const summaryId = `${themeId}-${summaryItem.summary}`;
-                      let summaryOriginalContentCount = 0;
-                      summaryItem.points?.forEach((pointItem) => {
-                        summaryOriginalContentCount +=
-                          pointItem.original_content?.length || 0;
-                      });
-
-                      const discussionPercentage =
-                        themeTotalOriginalContentCount > 0
-                          ? (
-                              (summaryOriginalContentCount /
-                                themeTotalOriginalContentCount) *
-                              100
-                            ).toFixed(2)
-                          : 0;
-                      const originalSummaryIndex = data[
-                        theme
-                      ].summary_list.findIndex(
-                        (s) => s.summary === summaryItem.summary,
-                      );
-
-                      return (
-                        <div
-                          key={summaryIndex}
-                          id={summaryId}
-                          className="mb-6 p-4 bg-indigo-50 border-l-4 border-indigo-500 rounded-r-md"
-                        >
-                          <div className="flex justify-between items-start mb-3">
-                            <h3 className="text-xl font-semibold text-indigo-600 flex-1 break-words">
-                              {summaryItem.summary}
-                            </h3>
-                            {themeTotalOriginalContentCount > 0 && (
-                              <span className="ml-4 px-2 py-1 text-xs font-semibold text-indigo-700 bg-indigo-200 rounded-full whitespace-nowrap">
-                                讨论度: {discussionPercentage}%
-                              </span>
-                            )}
-                          </div>
-                          {summaryItem.points &&
-                          summaryItem.points.length > 0 ? (
-                            <ul className="list-none pl-0">
-                              {summaryItem.points.map(
-                                (pointItem, pointIndex) => {
-                                  const pointKey = `${themeIndex}-${originalSummaryIndex}-${pointIndex}`;
-                                  const isExpanded = !!expandedPoints[pointKey];
-                                  const displayContents = isExpanded
-                                    ? pointItem.original_content
-                                    : pointItem.original_content?.slice(0, 2) ||
-                                      [];
-
-                                  return (
-                                    <li
-                                      key={pointIndex}
-                                      className="mb-4 p-3 bg-white border border-gray-300 rounded-md shadow-xs"
-                                    >
-                                      <p className="text-base text-gray-700 mb-2 break-words">
-                                        <strong className="font-medium text-gray-900">
-                                          要点：
-                                        </strong>{" "}
-                                        {pointItem.point}
-                                      </p>
-                                      {pointItem.original_content &&
-                                        pointItem.original_content.length >
-                                          0 && (
-                                          <div className="mt-2 pl-4 border-l-2 border-gray-300">
-                                            <p className="text-sm font-medium text-gray-700 mb-1">
-                                              <strong>
-                                                典型用户原声 (
-                                                {
-                                                  pointItem.original_content
-                                                    .length
-                                                }
-                                                )：
-                                              </strong>
-                                            </p>
-                                            <ul className="list-disc pl-5 space-y-1">
-                                              {displayContents.map(
-                                                (content, contentIndex) => (
-                                                  <li
-                                                    key={contentIndex}
-                                                    className="text-sm text-gray-600 leading-relaxed break-words"
-                                                  >
-                                                    {content}
-                                                  </li>
-                                                ),
-                                              )}
-                                            </ul>
-                                            {pointItem.original_content.length >
-                                              2 && (
-                                              <button
-                                                onClick={() =>
-                                                  toggleExpandPoint(
-                                                    themeIndex,
-                                                    originalSummaryIndex,
-                                                    pointIndex,
-                                                  )
-                                                }
-                                                className="mt-2 text-xs text-indigo-600 hover:text-indigo-800 font-medium focus:outline-none
-                                                                                cursor-pointer"
-                                              >
-                                                {isExpanded
-                                                  ? "收起"
-                                                  : `...等 ${pointItem.original_content.length - 2} 条更多`}
-                                              </button>
-                                            )}
-                                          </div>
-                                        )}
-                                    </li>
-                                  );
-                                },
-                              )}
-                            </ul>
-                          ) : (
-                            <p className="text-gray-500 italic">
-                              该总结下无具体要点。
-                            </p>
-                          )}
-                        </div>
-                      );
-                    })
-                  ) : (
-                    <p className="text-gray-500 italic">该主题下无总结内容。</p>
-                  )}
-                </div>
-              </div>
-            );
-          },
-        )}
+        {themes.map((themeEntry) => (
+          <ThemeSection
+            key={themeEntry.id}
+            themeEntry={themeEntry}
+            isOpen={!!openThemes[themeEntry.id]}
+            shard={shards[themeEntry.id]}
+            onToggle={() => toggleTheme(themeEntry)}
+          />
+        ))}
         <div className="mb-8 p-6 bg-white border border-gray-200 rounded-md shadow-sm flex flex-col">
           <h2 className="text-2xl font-bold text-indigo-700 mb-6 pb-3 border-b-2 border-indigo-500">
             用户在考虑领克900时，对比的竞品车型有哪些；